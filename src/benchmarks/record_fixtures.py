@@ -0,0 +1,89 @@
+import os
+import re
+import sys
+import json
+import glob
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.replay_server import FixtureStore
+
+
+def _store_response(store, url, response):
+    content_type = response.headers.get('Content-Type', 'text/html; charset=utf-8')
+    store.add(url, response.content, content_type, response.status_code)
+
+
+def record_live(fixtures_dir, limit=None):
+    """Record collection pages, sitemaps and product pages/endpoints from the live store"""
+    from data_collection.scraper_primary import AgiliteScraper
+
+    store = FixtureStore(fixtures_dir)
+    scraper = AgiliteScraper(fetch_mode='json')
+    try:
+        store.origin = scraper.store_url
+        for page_url in scraper.get_all_pagination_links():
+            _store_response(store, page_url, scraper.fetch(page_url, timeout=30))
+
+        for sitemap_url in [f"{scraper.store_url}/sitemap.xml"]:
+            response = scraper.fetch(sitemap_url, timeout=30)
+            _store_response(store, sitemap_url, response)
+            for child in re.findall(r'<loc>([^<]*sitemap_products[^<]*)</loc>', response.text):
+                child = child.replace('&amp;', '&')
+                _store_response(store, child, scraper.fetch(child, timeout=30))
+
+        product_links = scraper.get_product_links()
+        if limit:
+            product_links = product_links[:limit]
+        for i, url in enumerate(product_links):
+            print(f"Recording product {i + 1}/{len(product_links)}: {url}")
+            handle = scraper._product_handle(url)
+            for product_url in (url, f"{scraper.store_url}/products/{handle}.js",
+                                f"{scraper.store_url}/products/{handle}.json"):
+                _store_response(store, product_url, scraper.fetch(product_url, timeout=30))
+    finally:
+        scraper.close()
+
+    store.save()
+    print(f"Recorded {len(store.entries)} responses into {fixtures_dir}")
+    return store
+
+
+def import_test_scrape(test_dir, fixtures_dir):
+    """Build fixtures from the dumps a test-mode scrape leaves in data/test_scrape"""
+    store = FixtureStore(fixtures_dir)
+
+    for path in glob.glob(os.path.join(test_dir, 'page_*_data.json')):
+        with open(path, 'r', encoding='utf-8') as f:
+            page = json.load(f)
+        if page.get('page_url') and page.get('page_html'):
+            store.add(page['page_url'], page['page_html'])
+
+    for path in glob.glob(os.path.join(test_dir, 'product_*_page.html')):
+        handle = os.path.basename(path)[len('product_'):-len('_page.html')]
+        with open(path, 'rb') as f:
+            store.add(f"{store.origin}/products/{handle}", f.read())
+
+    for path in glob.glob(os.path.join(test_dir, 'product_*_endpoint.json')):
+        handle = os.path.basename(path)[len('product_'):-len('_endpoint.json')]
+        with open(path, 'rb') as f:
+            store.add(f"{store.origin}/products/{handle}.js", f.read(), 'application/json')
+
+    store.save()
+    print(f"Imported {len(store.entries)} responses from {test_dir} into {fixtures_dir}")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record scraper benchmark fixtures")
+    parser.add_argument('--out', default='data/benchmarks/fixtures', help="Fixture directory")
+    parser.add_argument('--limit', type=int, default=None, help="Record at most this many products")
+    parser.add_argument('--from-test-scrape', metavar='DIR', default=None,
+                        help="Import test-mode dumps (e.g. data/test_scrape) instead of recording live")
+    args = parser.parse_args()
+
+    if args.from_test_scrape:
+        import_test_scrape(args.from_test_scrape, args.out)
+    else:
+        record_live(args.out, args.limit)
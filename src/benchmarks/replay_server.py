@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+MANIFEST_NAME = 'manifest.json'
+RECORDED_ORIGIN = 'https://agilite.co.il'
+
+
+class FixtureStore:
+    """
+    Recorded responses on disk, keyed by request path (including the query string).
+
+    Layout: <directory>/manifest.json maps each path to a body file in
+    <directory>/bodies/ together with its status and content type.
+    """
+
+    def __init__(self, directory, origin=RECORDED_ORIGIN):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.entries = {}
+        self.origin = origin
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.origin = manifest.get('origin', origin)
+            self.entries = manifest.get('entries', {})
+
+    @staticmethod
+    def path_key(url):
+        parsed = urlparse(url)
+        return f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path
+
+    def add(self, url, body, content_type='text/html; charset=utf-8', status=200):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        key = self.path_key(url)
+        filename = hashlib.sha256(key.encode('utf-8')).hexdigest() + '.bin'
+        os.makedirs(os.path.join(self.directory, 'bodies'), exist_ok=True)
+        with open(os.path.join(self.directory, 'bodies', filename), 'wb') as f:
+            f.write(body)
+        self.entries[key] = {'file': filename, 'content_type': content_type, 'status': status}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        with open(os.path.join(self.directory, 'bodies', entry['file']), 'rb') as f:
+            return entry, f.read()
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'origin': self.origin, 'entries': self.entries}, f, ensure_ascii=False, indent=2)
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server.replay
+        server.record_request()
+        server.delay()
+
+        injected = server.injected_error()
+        if injected:
+            self._send(injected, b'', 'text/plain', {'Retry-After': str(server.retry_after)} if injected == 429 else None)
+            return
+
+        found = server.store.get(self.path)
+        if not found:
+            self._send(404, b'Not Found', 'text/plain')
+            return
+        entry, body = found
+        if entry['content_type'].startswith(('text/', 'application/json', 'application/javascript', 'application/xml')):
+            # Point absolute links at the replay server so nothing leaks to the live store
+            body = body.replace(server.store.origin.encode('utf-8'), server.url.encode('utf-8'))
+        self._send(entry['status'], body, entry['content_type'])
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    """
+    Local HTTP server that replays recorded fixtures.
+
+    Every response is delayed by a random latency in [latency_min, latency_max]
+    seconds, and a fraction `error_rate` of requests fails with `error_status`.
+    """
+
+    def __init__(self, fixtures_dir, latency_min=0.0, latency_max=0.0, error_rate=0.0,
+                 error_status=503, retry_after=1, seed=None, port=0):
+        self.store = FixtureStore(fixtures_dir)
+        self.latency_min = latency_min
+        self.latency_max = max(latency_min, latency_max)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors_injected = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _ReplayHandler)
+        self._server.daemon_threads = True
+        self._server.replay = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = None
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def delay(self):
+        if self.latency_max > 0:
+            with self._lock:
+                latency = self._random.uniform(self.latency_min, self.latency_max)
+            time.sleep(latency)
+
+    def injected_error(self):
+        with self._lock:
+            if self.error_rate > 0 and self._random.random() < self.error_rate:
+                self.errors_injected += 1
+                return self.error_status
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
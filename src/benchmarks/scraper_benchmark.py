@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import resource
+import argparse
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.replay_server import ReplayServer
+from data_collection.timing import percentile
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of finished child processes (e.g. Firefox), in MB"""
+    # ru_maxrss is reported in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {'process': round(own / 1024, 1), 'children': round(children / 1024, 1)}
+
+
+def run_benchmark(fixtures_dir, fetch_mode='json', concurrency=8, rate_per_host=1000.0,
+                  latency_min=0.0, latency_max=0.0, error_rate=0.0, error_status=503,
+                  discovery='html', use_cache=False, seed=0):
+    """
+    Run AgiliteScraper end to end against a replay server and measure it.
+
+    Returns throughput, per-product latency percentiles and peak memory.
+    """
+    from data_collection.scraper_primary import AgiliteScraper
+
+    # The benchmark measures fetching, so the on-disk HTTP cache is off unless asked for
+    os.environ['SCRAPER_HTTP_CACHE'] = 'true' if use_cache else 'false'
+    # Sitemap state and the HTTP cache live in a throwaway directory, so a benchmark
+    # never changes what the next real scrape considers unchanged or cached
+    workdir = tempfile.mkdtemp(prefix='scraper_benchmark_')
+
+    with ReplayServer(fixtures_dir, latency_min, latency_max, error_rate, error_status, seed=seed) as server:
+        scraper = AgiliteScraper(
+            fetch_mode=fetch_mode,
+            concurrency=concurrency,
+            rate_per_host=rate_per_host,
+            discovery=discovery,
+            store_url=server.url,
+            state_dir=os.path.join(workdir, 'state'),
+            http_cache_dir=os.path.join(workdir, 'http_cache')
+        )
+
+        latencies = []
+        lock = threading.Lock()
+        fetch = scraper.get_product_data
+
+        def timed_fetch(url):
+            start = time.perf_counter()
+            try:
+                return fetch(url)
+            finally:
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        scraper.get_product_data = timed_fetch
+        try:
+            start = time.perf_counter()
+            products = scraper.scrape_all_products()
+            duration = time.perf_counter() - start
+        finally:
+            scraper.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        return {
+            'fetch_mode': fetch_mode,
+            'concurrency': concurrency,
+            'latency_injected': [latency_min, latency_max],
+            'error_rate': error_rate,
+            'products_attempted': len(latencies),
+            'products_scraped': len(products),
+            'duration_seconds': round(duration, 3),
+            'throughput_per_second': round(len(products) / duration, 3) if duration else None,
+            'latency_p50_seconds': round(percentile(latencies, 50), 4) if latencies else None,
+            'latency_p95_seconds': round(percentile(latencies, 95), 4) if latencies else None,
+            'server_requests': server.requests,
+            'server_errors_injected': server.errors_injected,
+            'fetch_window': scraper.controller.snapshot(),
+            'phase_timings': scraper.timing_summary.summary()['phases'],
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraper against recorded fixtures")
+    parser.add_argument('--fixtures', default='data/benchmarks/fixtures', help="Fixture directory")
+    parser.add_argument('--fetch-mode', default='json', choices=['json', 'rendered'])
+    parser.add_argument('--discovery', default='html', choices=['html', 'sitemap'])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate-per-host', type=float, default=1000.0)
+    parser.add_argument('--latency-ms', type=float, nargs=2, default=[0, 0], metavar=('MIN', 'MAX'),
+                        help="Random latency added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--with-cache', action='store_true', help="Keep the on-disk HTTP cache enabled")
+    parser.add_argument('--output', default=None, help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.fixtures,
+        fetch_mode=args.fetch_mode,
+        concurrency=args.concurrency,
+        rate_per_host=args.rate_per_host,
+        latency_min=args.latency_ms[0] / 1000,
+        latency_max=args.latency_ms[1] / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        discovery=args.discovery,
+        use_cache=args.with_cache
+    )
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
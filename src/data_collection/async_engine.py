@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncScrapeEngine:
+    """
+    Runs a blocking per-URL fetch function concurrently on an asyncio loop.
+
+    Concurrency is capped by the number of workers. URLs are not paced here:
+    the fetch function rate-limits its own requests (the scraper's fetch() waits
+    on concurrency.HostRateLimiter), so every request to a host shares one limit.
+    """
+
+    def __init__(self, fetch, concurrency=8):
+        self.fetch = fetch
+        self.concurrency = max(1, int(concurrency))
+        self.completed = 0
+
+    async def _worker(self, loop, executor, pending, total, results, on_result):
+        while pending:
+            index, url = pending.pop()
+            try:
+                result = await loop.run_in_executor(executor, self.fetch, url)
+            except Exception as e:
+                print(f"Error scraping {url}: {str(e)}")
+                result = None
+            self.completed += 1
+            print(f"Finished product {self.completed}/{total}: {url}")
+            if on_result:
+                on_result(url, result)
+            else:
+                results[index] = result
+
+    async def scrape(self, urls, on_result=None):
+        """
+        Fetch all URLs with a fixed set of workers.
+
+        Results are returned in input order, unless `on_result(url, result)` is
+        given, in which case each result is handed over as it completes and
+        nothing is kept in memory.
+        """
+        loop = asyncio.get_running_loop()
+        self.completed = 0
+        # Workers pop from the end, so reverse to keep roughly the input order
+        pending = list(enumerate(urls))[::-1]
+        results = None if on_result else [None] * len(urls)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            workers = [
+                self._worker(loop, executor, pending, len(urls), results, on_result)
+                for _ in range(min(self.concurrency, len(urls)))
+            ]
+            await asyncio.gather(*workers)
+        return results
+
+    def run(self, urls, on_result=None):
+        """Synchronous entry point for callers outside an event loop"""
+        return asyncio.run(self.scrape(urls, on_result))
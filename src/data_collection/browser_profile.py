@@ -0,0 +1,164 @@
+import os
+import socketserver
+import threading
+from urllib.parse import quote
+
+# Third-party hosts a product page does not need: analytics, ads, chat widgets, web fonts
+DEFAULT_BLOCKED_HOSTS = [
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+    'googleadservices.com',
+    'facebook.net',
+    'facebook.com',
+    'hotjar.com',
+    'clarity.ms',
+    'bing.com',
+    'tiktok.com',
+    'snapchat.com',
+    'pinterest.com',
+    'klaviyo.com',
+    'gorgias.chat',
+    'tidio.co',
+    'zdassets.com',
+    'intercom.io',
+    'youtube.com',
+    'vimeo.com',
+    'fonts.googleapis.com',
+    'fonts.gstatic.com',
+    'monorail-edge.shopifysvc.com',
+]
+
+# Preferences for a trimmed headless profile: no images, fonts, media, prefetching or telemetry.
+# Stylesheets still load: Firefox ignores permissions.default.stylesheet, and a PAC script
+# only sees the host of HTTPS requests, so CSS from the store itself cannot be told apart.
+LIGHTWEIGHT_PREFERENCES = {
+    'permissions.default.image': 2,
+    'gfx.downloadable_fonts.enabled': False,
+    'browser.display.use_document_fonts': 0,
+    'media.autoplay.default': 5,
+    'media.video_stats.enabled': False,
+    'dom.webnotifications.enabled': False,
+    'dom.push.enabled': False,
+    'network.prefetch-next': False,
+    'network.dns.disablePrefetch': True,
+    'network.http.speculative-parallel-limit': 0,
+    'browser.cache.disk.enable': False,
+    'browser.sessionhistory.max_entries': 2,
+    'browser.sessionstore.max_tabs_undo': 0,
+    'browser.shell.checkDefaultBrowser': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'toolkit.telemetry.enabled': False,
+    'app.update.auto': False,
+    'dom.ipc.processCount': 1,
+}
+
+PAGE_METRICS_SCRIPT = """
+var entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+var bytes = 0;
+for (var i = 0; i < entries.length; i++) { bytes += entries[i].transferSize || 0; }
+return {bytes: bytes, requests: entries.length};
+"""
+
+
+def blocked_hosts_from_env():
+    """Default blocklist plus any extra hosts listed in SCRAPER_BLOCKED_HOSTS"""
+    extra = [h.strip() for h in os.environ.get('SCRAPER_BLOCKED_HOSTS', '').split(',') if h.strip()]
+    return DEFAULT_BLOCKED_HOSTS + extra
+
+
+def build_pac_script(blocked_hosts, sink_port):
+    """Proxy auto-config that sends blocked hosts to the local sink and everything else direct"""
+    conditions = ' || '.join(
+        f'host == "{host}" || dnsDomainIs(host, ".{host}")' for host in blocked_hosts
+    ) or 'false'
+    return (
+        "function FindProxyForURL(url, host) {"
+        f" if ({conditions}) return \"PROXY 127.0.0.1:{sink_port}\";"
+        " return \"DIRECT\"; }"
+    )
+
+
+class _SinkHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            self.request.recv(4096)
+            self.request.sendall(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        except OSError:
+            pass
+        self.server.sink.record()
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class BlockedRequestSink:
+    """
+    Local endpoint that blocked requests are proxied to.
+
+    It refuses every request and counts them, which gives an exact number of
+    blocked requests per page without relying on browser timing entries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.blocked = 0
+        self._server = _SinkServer(('127.0.0.1', 0), _SinkHandler)
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def record(self):
+        with self._lock:
+            self.blocked += 1
+
+    def reset(self):
+        """Start counting for a new page"""
+        with self._lock:
+            self.blocked = 0
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def write_profile_template(directory, preferences):
+    """Write preferences to a reusable profile directory's user.js"""
+    os.makedirs(directory, exist_ok=True)
+    lines = []
+    for name, value in preferences.items():
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, str):
+            value = '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+        lines.append(f'user_pref("{name}", {value});\n')
+    with open(os.path.join(directory, 'user.js'), 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    return directory
+
+
+def proxy_preferences(blocked_hosts, sink_port):
+    """Preferences that point Firefox at the blocklist PAC script"""
+    pac = build_pac_script(blocked_hosts, sink_port)
+    return {
+        'network.proxy.type': 2,
+        'network.proxy.autoconfig_url': 'data:application/x-ns-proxy-autoconfig,' + quote(pac),
+    }
+
+
+def collect_page_metrics(driver, sink=None):
+    """Bytes transferred and request counts for the page currently loaded in the driver"""
+    try:
+        metrics = driver.execute_script(PAGE_METRICS_SCRIPT) or {}
+    except Exception as e:
+        print(f"Could not collect page metrics: {str(e)}")
+        metrics = {}
+    return {
+        'bytes_transferred': metrics.get('bytes', 0),
+        'requests': metrics.get('requests', 0),
+        'requests_blocked': sink.blocked if sink else 0
+    }
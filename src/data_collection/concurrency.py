@@ -0,0 +1,140 @@
+import time
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+
+def parse_retry_after(value):
+    """Seconds to wait according to a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host, shared by all threads: every request to a host
+    takes one token, refilled at `rate` per second up to `burst`.
+
+    A request that finds the bucket empty reserves the next token and sleeps
+    until it is due, so waiting requests go out in the order they arrived.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until a request to the URL's host may start"""
+        if self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(host, (self.capacity, now))
+            # Tokens go negative while requests are queued for the host
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate) - 1
+            self._buckets[host] = (tokens, now)
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
+
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD limit on how many requests may be in flight at once.
+
+    Each healthy response grows the window by roughly one slot per window's
+    worth of requests; throttling (429), server errors (5xx), transport errors
+    and latency above `target_latency` shrink it multiplicatively, at most once
+    per `cooldown` seconds. A Retry-After header pauses all new requests until
+    it has passed.
+    """
+
+    def __init__(self, min_window=1, max_window=16, initial_window=4, target_latency=2.0,
+                 decrease_factor=0.5, cooldown=None):
+        self.min_window = max(1, int(min_window))
+        self.max_window = max(self.min_window, int(max_window))
+        self.window = float(min(max(initial_window, self.min_window), self.max_window))
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown if cooldown is not None else target_latency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.slow = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Hold one request slot for the duration of the with-block"""
+        with self._condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.window):
+                    break
+                self._condition.wait(timeout=wait if wait > 0 else None)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def record(self, latency=None, status=None, error=False, retry_after=None):
+        """Feed the outcome of one request back into the window"""
+        with self._condition:
+            self.requests += 1
+            now = time.monotonic()
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+            if status == 429:
+                self.throttled += 1
+                congested = True
+            elif error or (status is not None and status >= 500):
+                self.errors += 1
+                congested = True
+            elif latency is not None and latency > self.target_latency:
+                self.slow += 1
+                congested = True
+            else:
+                congested = False
+
+            if congested:
+                # One decrease per cooldown, so a burst of failures does not collapse the window
+                if now - self._last_decrease >= self.cooldown:
+                    self.window = max(self.min_window, self.window * self.decrease_factor)
+                    self._last_decrease = now
+            else:
+                self.window = min(self.max_window, self.window + 1.0 / self.window)
+            self._condition.notify_all()
+
+    def snapshot(self):
+        """Current window size and counters, for logging and run reports"""
+        with self._condition:
+            return {
+                'window': round(self.window, 2),
+                'in_flight': self.in_flight,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'slow': self.slow,
+                'paused_for_seconds': round(max(0.0, self.paused_until - time.monotonic()), 2)
+            }
@@ -0,0 +1,141 @@
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+
+class PooledDriver:
+    """A WebDriver together with the number of pages it has rendered"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class DriverPool:
+    """
+    Pool of reusable WebDriver instances leased to worker threads.
+
+    Drivers are started lazily up to `size`, health-checked before every lease,
+    and replaced after `max_pages` pages or when a lease ends with an exception.
+    """
+
+    def __init__(self, factory, size=1, max_pages=50, destroy=None):
+        self.factory = factory
+        # Called instead of driver.quit() when a driver leaves the pool
+        self.destroy = destroy
+        self.size = max(1, int(size))
+        self.max_pages = max(1, int(max_pages))
+        # Guards _idle and _created; notified whenever a driver or a slot for one frees up
+        self._available = threading.Condition()
+        self._idle = deque()
+        self._created = 0
+        self._closed = False
+
+    def _start_driver(self):
+        return PooledDriver(self.factory())
+
+    def _quit(self, pooled):
+        try:
+            if self.destroy:
+                self.destroy(pooled.driver)
+            else:
+                pooled.driver.quit()
+        except Exception as e:
+            print(f"Warning: Could not quit driver: {str(e)}")
+
+    def _is_healthy(self, pooled):
+        """A driver is healthy if the browser still answers a trivial script"""
+        try:
+            pooled.driver.execute_script("return 1")
+            return True
+        except Exception as e:
+            print(f"Driver failed health check: {str(e)}")
+            return False
+
+    def _acquire(self, timeout):
+        """An idle driver, or a new one while fewer than `size` exist; waits for either otherwise"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                if self._idle:
+                    return self._idle.popleft()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No driver became available within {timeout} seconds")
+                self._available.wait(remaining)
+        try:
+            return self._start_driver()
+        except Exception:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, pooled):
+        with self._available:
+            self._idle.append(pooled)
+            self._available.notify()
+
+    def _discard(self, pooled):
+        self._quit(pooled)
+        # Frees a slot, so a waiting thread may start a replacement
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def warm(self):
+        """Start every driver up front instead of on first use"""
+        started = []
+        while self._created < self.size:
+            started.append(self._acquire(timeout=None))
+        for pooled in started:
+            self._release(pooled)
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Lease a healthy driver for the duration of the with-block"""
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+
+        pooled = self._acquire(timeout)
+        if not self._is_healthy(pooled):
+            print("Recycling unhealthy driver")
+            self._discard(pooled)
+            pooled = self._acquire(timeout)
+
+        crashed = False
+        try:
+            yield pooled.driver
+        except Exception:
+            crashed = True
+            raise
+        finally:
+            pooled.pages += 1
+            if self._closed:
+                self._discard(pooled)
+            elif crashed:
+                print("Recycling driver after crash")
+                print(traceback.format_exc())
+                self._discard(pooled)
+            elif pooled.pages >= self.max_pages:
+                print(f"Recycling driver after {pooled.pages} pages")
+                self._discard(pooled)
+            else:
+                self._release(pooled)
+
+    def close(self):
+        """Quit all idle drivers; drivers still leased are quit when returned"""
+        with self._available:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._available.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
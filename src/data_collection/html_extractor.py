@@ -0,0 +1,182 @@
+import json
+import re
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+# lxml is a C-backed parser several times faster than the pure-Python html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+TITLE_SELECTOR = 'h2.product-title, h1.product-title, .product-title'
+
+PRICE_SELECTORS = [
+    'sale-price',
+    '.price-list sale-price',
+    '.price',
+    '.product-price',
+    '[class*="price"]'
+]
+
+VARIANT_GROUP_SELECTORS = [
+    '.product-form__input',
+    '.selector-wrapper',
+    '.variant-picker',
+    '.product-form__option'
+]
+
+IMAGE_SELECTORS = [
+    '.product-single__photos img',
+    '.product-gallery img',
+    '.product-images img',
+    '[class*="product"] img'
+]
+
+# More specific stock selectors first
+STOCK_SELECTORS = [
+    '.product-inventory',
+    '.stock-status',
+    '.availability',
+    '[class*="stock"]',
+    '[class*="inventory"]',
+    '[class*="availability"]',
+    '.add-to-cart-button',
+    '.product-form__submit',
+    'button[type="submit"]'
+]
+
+
+def stock_status_from_text(stock_text, disabled=False):
+    """Map the text of a stock or add-to-cart element to a stock status, or None"""
+    stock_text = stock_text.strip().lower()
+    if ('out of stock' in stock_text or 'sold out' in stock_text or
+            'unavailable' in stock_text or 'not available' in stock_text):
+        return 'Out of Stock'
+    if ('in stock' in stock_text or 'available' in stock_text or
+            'add to cart' in stock_text or 'buy now' in stock_text):
+        # A disabled add to cart button means the product cannot be bought
+        return 'Out of Stock' if disabled else 'In Stock'
+    if 'pre-order' in stock_text:
+        return 'Pre-order'
+    return None
+
+
+class ProductPageExtractor:
+    """
+    Parses a product page once and answers every selector group from that tree.
+
+    This replaces per-selector WebDriver round trips; only state that exists
+    solely in the live browser still needs the driver.
+    """
+
+    def __init__(self, page_source, url=None):
+        self.soup = BeautifulSoup(page_source, HTML_PARSER)
+        # Relative links resolve against the page's <base href>, if any, like the browser does
+        base = self.soup.find('base', href=True)
+        self.url = urljoin(url, base['href']) if url and base else url
+
+    def absolute_url(self, src):
+        """Resolve a protocol-relative or relative link against the page URL, as img.src does in the browser"""
+        return urljoin(self.url, src) if self.url and src else src
+
+    def page_title(self):
+        title = self.soup.find('title')
+        return title.get_text().strip() if title else None
+
+    def json_ld_product(self):
+        """Return the first schema.org Product object from the page's JSON-LD scripts"""
+        for script in self.soup.find_all('script', type='application/ld+json'):
+            try:
+                data = json.loads(script.string or '')
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and data.get('@type') == 'Product':
+                print(f"Found Product JSON-LD data: {data.get('name', 'Unknown')}")
+                return data
+            # Also check for arrays of products
+            if isinstance(data, list):
+                for item in data:
+                    if isinstance(item, dict) and item.get('@type') == 'Product':
+                        print(f"Found Product JSON-LD data in array: {item.get('name', 'Unknown')}")
+                        return item
+        return None
+
+    def title(self):
+        element = self.soup.select_one(TITLE_SELECTOR)
+        return element.get_text().strip() if element else None
+
+    def price(self):
+        for selector in PRICE_SELECTORS:
+            element = self.soup.select_one(selector)
+            if not element:
+                continue
+            # Clean up price text - remove currency symbol and extra spaces
+            price_text = re.sub(r'[^\d.,]', '', element.get_text())
+            if price_text:
+                print(f"Found price with selector {selector}: {price_text}")
+                return price_text
+        return None
+
+    def variants(self):
+        """Return variant groups as [{'type': ..., 'values': [...]}] from the first matching group selector"""
+        variants = []
+        for group_selector in VARIANT_GROUP_SELECTORS:
+            groups = self.soup.select(group_selector)
+            if not groups:
+                continue
+
+            print(f"Found {len(groups)} variant groups with selector '{group_selector}'")
+            for group in groups:
+                # Find the title of the variant group (e.g., "Color", "Size")
+                label = group.select_one('label, .form__label, .variant__label')
+                group_title = label.get_text().strip().replace(':', '') if label else "Unknown"
+
+                value_elements = group.select('input[type="radio"], option, [data-value]')
+                if not value_elements:  # Fallback for different structures
+                    value_elements = group.select('.variant-input-wrap')
+
+                values = []
+                for el in value_elements:
+                    if el.name == 'input':
+                        value = el.get('value')
+                    elif el.name == 'option':
+                        value = el.get_text().strip()
+                        if "select" in value.lower():
+                            continue  # Skip placeholder
+                    else:  # Other elements like divs or custom tags
+                        value = el.get('data-value') or el.get_text().strip()
+                    if value and value not in values:
+                        values.append(value)
+
+                if not values:
+                    continue
+                existing = next((v for v in variants if v['type'] == group_title), None)
+                if existing:
+                    existing['values'].extend(v for v in values if v not in existing['values'])
+                else:
+                    variants.append({'type': group_title, 'values': values})
+                print(f"Found variant group '{group_title}' with values: {values}")
+
+            # If we found variants with this group selector, we can stop
+            if variants:
+                break
+        return variants
+
+    def images(self):
+        for selector in IMAGE_SELECTORS:
+            images = [self.absolute_url(img.get('src')) for img in self.soup.select(selector) if img.get('src')]
+            if images:
+                print(f"Found {len(images)} images with selector {selector}")
+                return images
+        return []
+
+    def stock_status(self):
+        for selector in STOCK_SELECTORS:
+            for element in self.soup.select(selector):
+                status = stock_status_from_text(element.get_text(), element.get('disabled') is not None)
+                if status:
+                    print(f"Found stock status with selector {selector}: {status}")
+                    return status
+        return None
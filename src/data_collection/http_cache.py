@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import threading
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Response headers worth keeping; the body is stored decoded, so encoding/length headers are dropped
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Date')
+
+
+class HTTPCache:
+    """
+    On-disk store of GET responses keyed by URL, holding their ETag/Last-Modified validators.
+
+    Each entry is a body file plus a small JSON metadata file. File modification
+    times double as LRU recency, and the oldest entries are evicted once the
+    total body size exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory='data/http_cache', max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return f"{base}.meta.json", f"{base}.body"
+
+    def load(self, url):
+        """Return the cached metadata and body for a URL, or None"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+
+    def touch(self, url):
+        """Mark an entry as recently used"""
+        for path in self._paths(url):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def store(self, url, response):
+        """Save a response that carries at least one validator"""
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        if 'ETag' not in headers and 'Last-Modified' not in headers:
+            return
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+
+        meta = {
+            'url': url,
+            'headers': headers,
+            'encoding': response.encoding,
+            'size': len(body)
+        }
+        meta_path, body_path = self._paths(url)
+        with self._lock:
+            # Write to temporary files first so readers never see a half-written entry
+            with open(f"{body_path}.tmp", 'wb') as f:
+                f.write(body)
+            with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(f"{body_path}.tmp", body_path)
+            os.replace(f"{meta_path}.tmp", meta_path)
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.body'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, body_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            meta_path = body_path[:-len('.body')] + '.meta.json'
+            for path in (body_path, meta_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter that revalidates cached GET responses with conditional requests.
+
+    A 304 Not Modified answer is turned back into the cached 200 response, marked
+    with `response.from_cache = True`.
+    """
+
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+
+        cached = self.cache.load(request.url)
+        if cached:
+            meta, _ = cached
+            if 'ETag' in meta['headers']:
+                request.headers['If-None-Match'] = meta['headers']['ETag']
+            if 'Last-Modified' in meta['headers']:
+                request.headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+
+        response = super().send(request, **kwargs)
+        response.from_cache = False
+
+        if response.status_code == 304 and cached:
+            self.cache.touch(request.url)
+            cached_response = self._cached_response(request, response, *cached)
+            # Reading the empty body before closing returns the connection to the pool
+            response.content
+            response.close()
+            return cached_response
+        if response.status_code == 200:
+            self.cache.store(request.url, response)
+        return response
+
+    def _cached_response(self, request, not_modified, meta, body):
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        # Validators on the 304 supersede the stored ones
+        for name in ('ETag', 'Last-Modified', 'Cache-Control', 'Date'):
+            if name in not_modified.headers:
+                response.headers[name] = not_modified.headers[name]
+        response._content = body
+        response.encoding = meta.get('encoding')
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = not_modified.elapsed
+        response.from_cache = True
+        return response
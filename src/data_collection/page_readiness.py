@@ -0,0 +1,92 @@
+import time
+
+# Seconds to wait for each signal. A content signal that fires within its own
+# timeout marks the page as ready; page-level signals only count once every
+# signal listed before them has timed out, since a loaded document may still
+# lack product data.
+DEFAULT_READINESS_TIMEOUTS = {
+    'json_ld': 5.0,        # Product JSON-LD script is in the DOM
+    'price': 5.0,          # A price node has been rendered
+    'network_idle': 8.0,   # readyState complete and no new resource requests for a quiet window
+    'ready_state': 10.0,   # document.readyState == 'complete'
+}
+
+CONTENT_SIGNALS = ('json_ld', 'price')
+
+# One round trip per poll: every signal is evaluated in the same script
+READINESS_SCRIPT = """
+var scripts = document.querySelectorAll('script[type="application/ld+json"]');
+var jsonLd = false;
+for (var i = 0; i < scripts.length; i++) {
+    if ((scripts[i].textContent || '').indexOf('"Product"') !== -1) { jsonLd = true; break; }
+}
+var price = document.querySelector('sale-price, .price-list sale-price, .price, .product-price');
+return {
+    json_ld: jsonLd,
+    price: !!(price && price.textContent.trim()),
+    ready_state: document.readyState === 'complete',
+    resources: window.performance ? performance.getEntriesByType('resource').length : 0
+};
+"""
+
+
+class ReadinessResult:
+    """Outcome of waiting for a page: which signal fired and how long it took"""
+
+    def __init__(self, signal, elapsed, timed_out):
+        self.signal = signal
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+
+    @property
+    def ready(self):
+        return self.signal is not None
+
+    def __repr__(self):
+        return f"<ReadinessResult(signal={self.signal}, elapsed={self.elapsed:.2f}s, timed_out={self.timed_out})>"
+
+
+def wait_for_page_ready(driver, timeouts=None, poll_interval=0.1, idle_window=0.5):
+    """
+    Poll the page until one of the readiness signals fires.
+
+    Signals are checked in the order of `timeouts`; a signal stops being
+    considered once its own timeout has passed, and page-level signals wait
+    until every signal listed before them has timed out. Returns a ReadinessResult whose
+    `signal` is None when every signal timed out.
+    """
+    timeouts = timeouts or DEFAULT_READINESS_TIMEOUTS
+    start = time.monotonic()
+    deadline = max(timeouts.values())
+    last_resource_count = None
+    last_resource_change = start
+
+    while True:
+        elapsed = time.monotonic() - start
+        try:
+            state = driver.execute_script(READINESS_SCRIPT) or {}
+        except Exception as e:
+            # Navigation can briefly detach the document; try again on the next poll
+            print(f"Readiness check failed: {str(e)}")
+            state = {}
+
+        now = time.monotonic()
+        resource_count = state.get('resources')
+        if resource_count != last_resource_count:
+            last_resource_count = resource_count
+            last_resource_change = now
+        state['network_idle'] = bool(state.get('ready_state')) and now - last_resource_change >= idle_window
+
+        earlier_pending = False
+        for signal, timeout in timeouts.items():
+            gated = signal not in CONTENT_SIGNALS and earlier_pending
+            earlier_pending = earlier_pending or elapsed <= timeout
+            if gated:
+                continue
+            if elapsed <= timeout and state.get(signal):
+                timed_out = [name for name, limit in timeouts.items() if elapsed > limit]
+                return ReadinessResult(signal, elapsed, timed_out)
+
+        if elapsed >= deadline:
+            return ReadinessResult(None, elapsed, list(timeouts))
+        time.sleep(poll_interval)
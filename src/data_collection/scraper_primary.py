@@ -4,30 +4,113 @@ import time
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from webdriver_manager.firefox import GeckoDriverManager
 from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.firefox.firefox_profile import FirefoxProfile
 import traceback
+import sys
+import threading
+from contextlib import nullcontext
 from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_collection.async_engine import AsyncScrapeEngine
+from data_collection.driver_pool import DriverPool
+from data_collection.concurrency import AdaptiveConcurrencyController, HostRateLimiter, parse_retry_after
+from data_collection.timing import PhaseTimer, TimingSummary
+from data_collection.http_cache import HTTPCache, CachingAdapter
+from data_collection.sitemap import fetch_product_sitemap_entries, SitemapState
+from data_collection.html_extractor import ProductPageExtractor, HTML_PARSER
+from raw_store import SnapshotRun, timings_path
+from fingerprint import product_fingerprint
+from data_collection.page_readiness import wait_for_page_ready, DEFAULT_READINESS_TIMEOUTS
+from data_collection.browser_profile import (
+    LIGHTWEIGHT_PREFERENCES, BlockedRequestSink, blocked_hosts_from_env,
+    collect_page_metrics, proxy_preferences, write_profile_template
+)
+
 class AgiliteScraper:
-    def __init__(self, test_mode=False):
-        self.base_url = "https://agilite.co.il/collections/all"
-        self.driver = None
+    def __init__(self, test_mode=False, fetch_mode=None, concurrency=None, rate_per_host=None,
+                 driver_pool_size=None, driver_max_pages=None, discovery=None, store_url=None,
+                 state_dir=None, http_cache_dir=None):
+        # Overridable so the scraper can run against a local replay server
+        self.store_url = (store_url or os.environ.get('SCRAPER_STORE_URL', 'https://agilite.co.il')).rstrip('/')
+        self.base_url = f"{self.store_url}/collections/all"
         self.test_mode = test_mode
-        self.setup_driver()
+        # 'json' reads the Shopify product endpoints and only falls back to Selenium
+        # when they fail; 'rendered' always drives the browser
+        self.fetch_mode = fetch_mode or os.environ.get('SCRAPER_FETCH_MODE', 'json')
+        # 'html' walks every collection page; 'sitemap' reads sitemap.xml and only
+        # rescrapes products whose lastmod changed since the previous run
+        self.discovery = discovery or os.environ.get('SCRAPER_DISCOVERY', 'html')
+        # Overridable so offline runs (e.g. benchmarks) do not touch the production sitemap state
+        self.state_dir = state_dir
+        # Upper bound on parallel fetches and polite requests per second per host
+        self.concurrency = int(concurrency or os.environ.get('SCRAPER_CONCURRENCY', 8))
+        self.rate_per_host = float(rate_per_host or os.environ.get('SCRAPER_RATE_PER_HOST', 2.0))
+        # Every request (collection pages, sitemaps, product endpoints, page loads) takes a token of its host
+        self.rate_limiter = HostRateLimiter(self.rate_per_host)
+        # Every fetch goes through an AIMD window that grows while responses are healthy
+        # and backs off on 429s, 5xx responses and rising latency
+        self.controller = AdaptiveConcurrencyController(
+            min_window=1,
+            max_window=self.concurrency,
+            initial_window=min(4, self.concurrency),
+            target_latency=float(os.environ.get('SCRAPER_TARGET_LATENCY', 2.0))
+        )
+        self.fetch_retries = 3
+
+        # Completed snapshots are stored as compressed NDJSON ('gzip', 'zstd' or 'none')
+        self.raw_compression = os.environ.get('SCRAPER_RAW_COMPRESSION', 'gzip')
+
+        # Per-product phase timings; the timer of the product being scraped is thread-local
+        self.timing_summary = TimingSummary()
+        self._timers = threading.local()
+        # Rendered pages skip images, fonts and third-party hosts such as analytics and chat widgets
+        self.block_resources = os.environ.get('SCRAPER_BLOCK_RESOURCES', 'true').lower() in ('1', 'true', 'yes')
+        self.blocked_hosts = blocked_hosts_from_env()
+        self.profile_dir = os.environ.get('SCRAPER_PROFILE_DIR', 'data/firefox_profile')
+        self._profile_ready = False
+        # Headless browsers for the rendered path; size it to the container's CPU and RAM
+        self.driver_pool = DriverPool(
+            self.create_driver,
+            size=int(driver_pool_size or os.environ.get('SCRAPER_DRIVER_POOL_SIZE', 1)),
+            max_pages=int(driver_max_pages or os.environ.get('SCRAPER_DRIVER_MAX_PAGES', 50)),
+            destroy=self.destroy_driver
+        )
+        # Per-signal readiness timeouts (seconds) for rendered pages
+        self.readiness_timeouts = dict(DEFAULT_READINESS_TIMEOUTS)
+        self.url_check_timeout = 5
+        if self.fetch_mode == 'rendered':
+            self.driver_pool.warm()
         self.session = requests.Session()
+        pool_kwargs = {'pool_connections': 10, 'pool_maxsize': max(10, self.concurrency)}
+        # Conditional GETs against an on-disk cache, so unchanged pages come back as 304s
+        if os.environ.get('SCRAPER_HTTP_CACHE', 'true').lower() in ('1', 'true', 'yes'):
+            self.http_cache = HTTPCache(
+                directory=http_cache_dir or os.environ.get('SCRAPER_HTTP_CACHE_DIR', 'data/http_cache'),
+                max_bytes=int(os.environ.get('SCRAPER_HTTP_CACHE_MAX_MB', 200)) * 1024 * 1024
+            )
+            adapter = CachingAdapter(self.http_cache, **pool_kwargs)
+        else:
+            self.http_cache = None
+            adapter = HTTPAdapter(**pool_kwargs)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Firefox/123.0'
         })
 
-    def setup_driver(self):
+    def create_driver(self):
+        """Start a new headless Firefox instance"""
         try:
             print("Setting up Firefox driver...")
             firefox_options = Options()
@@ -48,17 +131,92 @@ class AgiliteScraper:
             # Set user agent
             firefox_options.set_preference('general.useragent.override', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0')
             
+            sink = None
+            if self.block_resources:
+                # Every driver starts from the same trimmed profile template
+                if not self._profile_ready:
+                    write_profile_template(self.profile_dir, LIGHTWEIGHT_PREFERENCES)
+                    self._profile_ready = True
+                firefox_options.profile = FirefoxProfile(self.profile_dir)
+                # Blocked hosts are proxied to a local sink that refuses and counts them
+                sink = BlockedRequestSink()
+                for name, value in proxy_preferences(self.blocked_hosts, sink.port).items():
+                    firefox_options.set_preference(name, value)
+            
             service = Service(GeckoDriverManager().install())
-            self.driver = webdriver.Firefox(service=service, options=firefox_options)
-            self.driver.set_page_load_timeout(30)  # Set page load timeout
-            self.driver.implicitly_wait(5)  # Set implicit wait time
+            try:
+                driver = webdriver.Firefox(service=service, options=firefox_options)
+            except Exception:
+                if sink:
+                    sink.close()
+                raise
+            driver.request_sink = sink
+            driver.set_page_load_timeout(30)  # Set page load timeout
+            # No implicit wait: readiness is awaited explicitly, so missing selectors fail fast
+            driver.implicitly_wait(0)
             print("Firefox driver setup completed successfully")
+            return driver
         except Exception as e:
             print(f"Error setting up Firefox driver: {str(e)}")
             print("Full traceback:")
             print(traceback.format_exc())
             raise
 
+    def destroy_driver(self, driver):
+        """Quit a browser and stop its blocked-request sink"""
+        try:
+            driver.quit()
+        finally:
+            sink = getattr(driver, 'request_sink', None)
+            if sink:
+                sink.close()
+
+    def fetch(self, url, **kwargs):
+        """
+        GET a URL through the per-host rate limit and the adaptive concurrency controller.
+
+        429 and 5xx responses and transport errors are retried up to
+        self.fetch_retries times; Retry-After is honored by pausing all fetches.
+        """
+        kwargs.setdefault('timeout', 15)
+        for attempt in range(self.fetch_retries + 1):
+            # Wait for the host's token before taking a slot, so no slot is held while sleeping
+            self.rate_limiter.wait(url)
+            with self.controller.slot():
+                start = time.monotonic()
+                try:
+                    response = self.session.get(url, **kwargs)
+                except requests.RequestException:
+                    self.controller.record(time.monotonic() - start, error=True)
+                    if attempt == self.fetch_retries:
+                        raise
+                    retry_after = None
+                    response = None
+                else:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    self.controller.record(time.monotonic() - start, response.status_code, retry_after=retry_after)
+
+            if response is not None and response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == self.fetch_retries:
+                return response
+            status = response.status_code if response is not None else 'error'
+            print(f"Fetch of {url} got {status}, retrying (attempt {attempt + 1}); window {self.controller.snapshot()['window']}")
+            # Without Retry-After, back off exponentially; with it, the controller pause does the waiting
+            if not retry_after:
+                time.sleep(min(30, 2 ** attempt))
+        return response
+
+    def _phase(self, name):
+        """Time a phase of the product currently being scraped on this thread"""
+        timer = getattr(self._timers, 'current', None)
+        return timer.phase(name) if timer else nullcontext()
+
+    def _add_phase(self, name, seconds):
+        timer = getattr(self._timers, 'current', None)
+        if timer:
+            timer.add(name, seconds)
+
     def save_intermediate_data(self, data, filename):
         """Save intermediate data to JSON file"""
         try:
@@ -80,8 +238,8 @@ class AgiliteScraper:
     def get_total_pages(self):
         """Get total number of pages using Shopify pagination"""
         try:
-            response = self.session.get(self.base_url)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = self.fetch(self.base_url)
+            soup = BeautifulSoup(response.text, HTML_PARSER)
             # Shopify uses standard pagination class
             pagination = soup.find('div', class_='pagination')
             if pagination:
@@ -106,8 +264,8 @@ class AgiliteScraper:
     def get_product_links_from_page(self, page_url):
         """Get product links from a single page using Shopify structure"""
         try:
-            response = self.session.get(page_url)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = self.fetch(page_url)
+            soup = BeautifulSoup(response.text, HTML_PARSER)
             product_links = []
             
             # Shopify uses standard classes for product cards
@@ -119,7 +277,7 @@ class AgiliteScraper:
                 if link:
                     product_url = link.get('href')
                     if product_url and '/products/' in product_url:
-                        full_url = f"https://agilite.co.il{product_url}"
+                        full_url = f"{self.store_url}{product_url}"
                         if full_url not in product_links:
                             product_links.append(full_url)
             
@@ -140,15 +298,15 @@ class AgiliteScraper:
 
     def get_all_pagination_links(self):
         """Collect all real page links from the pagination block"""
-        response = self.session.get(self.base_url)
-        soup = BeautifulSoup(response.text, 'html.parser')
+        response = self.fetch(self.base_url)
+        soup = BeautifulSoup(response.text, HTML_PARSER)
         pagination = soup.find('nav', class_='pagination')
         page_urls = set()
         if pagination:
             for a in pagination.find_all('a', href=True):
                 href = a['href']
                 if href.startswith('/'):
-                    full_url = f"https://agilite.co.il{href}"
+                    full_url = f"{self.store_url}{href}"
                 else:
                     full_url = href
                 page_urls.add(full_url)
@@ -168,7 +326,8 @@ class AgiliteScraper:
             page_urls = self.get_all_pagination_links()
             print(f"Page URLs to process: {page_urls}")
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
+        # Actual parallelism is limited by the adaptive controller's window
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
             results = list(executor.map(self.get_product_links_from_page, page_urls))
 
         for links in results:
@@ -188,45 +347,206 @@ class AgiliteScraper:
     def extract_json_ld_data(self, page_source):
         """Extract product data from JSON-LD structured data"""
         try:
-            soup = BeautifulSoup(page_source, 'html.parser')
-            json_ld_scripts = soup.find_all('script', type='application/ld+json')
-            
-            for script in json_ld_scripts:
-                try:
-                    data = json.loads(script.string)
-                    if isinstance(data, dict) and data.get('@type') == 'Product':
-                        print(f"Found Product JSON-LD data: {data.get('name', 'Unknown')}")
-                        return data
-                    # Also check for arrays of products
-                    elif isinstance(data, list):
-                        for item in data:
-                            if isinstance(item, dict) and item.get('@type') == 'Product':
-                                print(f"Found Product JSON-LD data in array: {item.get('name', 'Unknown')}")
-                                return item
-                except json.JSONDecodeError:
-                    continue
-            return None
+            return ProductPageExtractor(page_source).json_ld_product()
         except Exception as e:
             print(f"Error extracting JSON-LD data: {str(e)}")
             return None
 
+    def _product_handle(self, url):
+        """Return the Shopify product handle from a product URL"""
+        return url.rstrip('/').split('/')[-1].split('?')[0]
+
+    def _absolute_url(self, src):
+        """Turn protocol-relative and root-relative Shopify CDN links into full URLs"""
+        if not src:
+            return src
+        if src.startswith('//'):
+            return f"https:{src}"
+        if src.startswith('/'):
+            return f"{self.store_url}{src}"
+        return src
+
+    def fetch_product_json(self, url):
+        """Fetch the raw product object from the storefront's /products/<handle>.js or .json endpoint"""
+        handle = self._product_handle(url)
+        for suffix in ('js', 'json'):
+            endpoint = f"{self.store_url}/products/{handle}.{suffix}"
+            try:
+                with self._phase('endpoint_fetch'):
+                    response = self.fetch(endpoint)
+                if response.status_code != 200:
+                    print(f"Product endpoint {endpoint} returned {response.status_code}")
+                    continue
+                with self._phase('endpoint_decode'):
+                    data = response.json()
+                # The .json endpoint wraps the product in a "product" key
+                if suffix == 'json':
+                    data = data.get('product')
+                if isinstance(data, dict) and data.get('title'):
+                    return suffix, data
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error fetching product endpoint {endpoint}: {str(e)}")
+        return None, None
+
+    def parse_product_json(self, url, data, source='js'):
+        """Map a Shopify product object to the same dict shape get_product_data returns"""
+        product_data = {
+            'url': url,
+            'title': data.get('title'),
+            'price': None,
+            'variants': [],
+            'description': None,
+            'images': [],
+            'stock_status': None,
+            'variant_stock': [],
+            'timestamp': datetime.now().isoformat()
+        }
+
+        # The .js endpoint has HTML in "description", the .json endpoint in "body_html"
+        description_html = data.get('description') or data.get('body_html') or ''
+        product_data['description'] = BeautifulSoup(description_html, 'html.parser').get_text(' ', strip=True)
+
+        variants = data.get('variants') or []
+        if source == 'js':
+            # Prices in the .js endpoint are in minor units (agorot)
+            if data.get('price') is not None:
+                product_data['price'] = str(data['price'] / 100)
+        elif variants and variants[0].get('price') is not None:
+            product_data['price'] = str(float(variants[0]['price']))
+
+        for option in data.get('options') or []:
+            if isinstance(option, dict):
+                name, values = option.get('name'), option.get('values') or []
+            else:
+                # Older .js payloads only list option names
+                name, values = option, []
+            # Shopify gives single-variant products a placeholder "Title" option
+            if values == ['Default Title']:
+                continue
+            if values:
+                product_data['variants'].append({'type': name or 'Unknown', 'values': list(values)})
+
+        for variant in variants:
+            variant_price = variant.get('price')
+            if source == 'js' and variant_price is not None:
+                variant_price = variant_price / 100
+            product_data['variant_stock'].append({
+                'title': variant.get('title'),
+                'sku': variant.get('sku'),
+                'price': str(float(variant_price)) if variant_price is not None else None,
+                'available': variant.get('available')
+            })
+
+        for image in data.get('images') or []:
+            src = image.get('src') if isinstance(image, dict) else image
+            if src:
+                product_data['images'].append(self._absolute_url(src))
+
+        # Product-level availability is only exposed by .js; otherwise derive it from variants
+        available = data.get('available')
+        if available is None:
+            flags = [v['available'] for v in product_data['variant_stock'] if v['available'] is not None]
+            available = any(flags) if flags else None
+        if available is not None:
+            product_data['stock_status'] = 'In Stock' if available else 'Out of Stock'
+
+        return product_data
+
+    def get_product_data_json(self, url):
+        """Get product data over HTTP from the Shopify product endpoints, without a browser"""
+        try:
+            print(f"\nFetching product JSON: {url}")
+            source, data = self.fetch_product_json(url)
+            if not data:
+                return None
+
+            with self._phase('endpoint_parse'):
+                product_data = self.parse_product_json(url, data, source)
+
+            if self.test_mode:
+                product_id = self._product_handle(url)
+                self.save_intermediate_data(data, f'product_{product_id}_endpoint.json')
+                self.save_intermediate_data(product_data, f'product_{product_id}_data.json')
+
+            print(f"✓ Successfully fetched from /products/{self._product_handle(url)}.{source}: {product_data['title']}")
+            return product_data
+        except Exception as e:
+            print(f"Error parsing product JSON from {url}: {str(e)}")
+            print("Full traceback:")
+            print(traceback.format_exc())
+            return None
+
     def get_product_data(self, url):
+        """
+        Get product data, preferring the product JSON endpoints over a rendered page.
+
+        The time spent in each phase is attached as 'phase_timings' and added to
+        the run's timing summary; 'fingerprint' is a hash of the product content.
+        """
+        timer = PhaseTimer()
+        self._timers.current = timer
+        fetched_via = 'json'
+        try:
+            product_data = None
+            if self.fetch_mode != 'rendered':
+                product_data = self.get_product_data_json(url)
+                if not product_data:
+                    print(f"Product endpoints failed for {url}, falling back to Selenium")
+            if not product_data:
+                fetched_via = 'rendered'
+                product_data = self.get_product_data_rendered(url)
+        finally:
+            self._timers.current = None
+
+        timings = timer.as_dict()
+        self.timing_summary.add(url, timings, fetched_via, ok=product_data is not None)
+        if product_data:
+            product_data['phase_timings'] = timings
+            # Lets the processor skip products whose content has not changed since the last run
+            product_data['fingerprint'] = product_fingerprint(product_data)
+        return product_data
+
+    def get_product_data_rendered(self, url):
+        """Render the product page in a pooled browser and extract its data"""
+        try:
+            lease_start = time.perf_counter()
+            with self.driver_pool.lease() as driver:
+                self._add_phase('driver_lease', time.perf_counter() - lease_start)
+                return self._get_product_data_with_driver(driver, url)
+        except Exception as e:
+            print(f"Error rendering product {url}: {str(e)}")
+            return None
+
+    def _get_product_data_with_driver(self, driver, url):
         """Get product data using updated selectors based on HTML analysis"""
         try:
             print(f"\nProcessing product: {url}")
             
             # Clear cache and cookies in a safer way
             try:
-                self.driver.delete_all_cookies()
+                driver.delete_all_cookies()
             except Exception as e:
                 print(f"Warning: Could not clear cookies: {str(e)}")
             
+            # Count blocked requests for this page only
+            sink = getattr(driver, 'request_sink', None)
+            if sink:
+                sink.reset()
+            
             # Navigate to URL with retry mechanism
             max_retries = 3
             for attempt in range(max_retries):
                 try:
                     print(f"Attempt {attempt + 1} to load {url}")
-                    self.driver.get(url)
+                    self.rate_limiter.wait(url)
+                    # Page loads share the fetch window; only failures feed back into it
+                    # since render time says little about server load
+                    with self.controller.slot(), self._phase('navigation'):
+                        try:
+                            driver.get(url)
+                        except Exception:
+                            self.controller.record(error=True)
+                            raise
                     break
                 except Exception as e:
                     if attempt == max_retries - 1:
@@ -234,49 +554,52 @@ class AgiliteScraper:
                     print(f"Attempt {attempt + 1} failed: {str(e)}")
                     time.sleep(2)
             
-            # Wait for page to load and check URL
-            wait = WebDriverWait(self.driver, 15)
-            
             # Wait for the page to actually load the correct URL
-            expected_product_handle = url.split('/')[-1]
+            expected_product_handle = self._product_handle(url)
+            url_wait = WebDriverWait(driver, self.url_check_timeout, poll_frequency=0.2)
             max_retries = 3
             for attempt in range(max_retries):
-                time.sleep(2)  # Give page time to load
-                current_url = self.driver.current_url
-                current_handle = current_url.split('/')[-1].split('?')[0]
-                
-                if current_handle == expected_product_handle:
-                    print(f"✓ Correct page loaded: {current_handle}")
+                try:
+                    with self._phase('url_verification'):
+                        url_wait.until(lambda d: self._product_handle(d.current_url) == expected_product_handle)
+                    print(f"✓ Correct page loaded: {expected_product_handle}")
                     break
-                elif attempt < max_retries - 1:
-                    print(f"⚠ Wrong page loaded ({current_handle}), retrying... (attempt {attempt + 1})")
-                    self.driver.refresh()
-                    time.sleep(3)
-                else:
-                    print(f"✗ Failed to load correct page after {max_retries} attempts")
-                    return None
+                except TimeoutException:
+                    current_handle = self._product_handle(driver.current_url)
+                    if attempt < max_retries - 1:
+                        print(f"⚠ Wrong page loaded ({current_handle}), retrying... (attempt {attempt + 1})")
+                        with self._phase('navigation'):
+                            driver.refresh()
+                    else:
+                        print(f"✗ Failed to load correct page after {max_retries} attempts")
+                        return None
             
-            # Additional wait for page content to load
-            try:
-                wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-                time.sleep(2)  # Extra buffer for JS to execute
-            except TimeoutException:
-                print("Timeout waiting for page body to load")
+            # Wait for a concrete readiness signal instead of a fixed buffer for JS
+            with self._phase('readiness_wait'):
+                readiness = wait_for_page_ready(driver, self.readiness_timeouts)
+            if not readiness.ready:
+                print(f"✗ Page not ready after {readiness.elapsed:.1f}s, no readiness signal fired")
                 return None
+            print(f"✓ Page ready via '{readiness.signal}' after {readiness.elapsed:.2f}s")
             
+            # Grab the page source once and parse it once; every selector group
+            # below is answered from this tree instead of WebDriver round trips
+            with self._phase('page_source'):
+                page_source = driver.page_source
+            with self._phase('html_parse'):
+                extractor = ProductPageExtractor(page_source, url)
+
             # Save page source for debugging
             if self.test_mode:
                 product_id = url.split('/')[-1]
-                page_source = self.driver.page_source
                 with open(f'data/test_scrape/product_{product_id}_page.html', 'w', encoding='utf-8') as f:
                     f.write(page_source)
                 print(f"Saved page source to product_{product_id}_page.html")
                 
                 # Verify we have the correct page by checking title
-                soup = BeautifulSoup(page_source, 'html.parser')
-                title = soup.find('title')
-                if title:
-                    print(f"Page title: {title.text.strip()}")
+                page_title = extractor.page_title()
+                if page_title:
+                    print(f"Page title: {page_title}")
 
             # Initialize product data
             product_data = {
@@ -291,7 +614,8 @@ class AgiliteScraper:
             }
 
             # Extract JSON-LD data first
-            json_ld_data = self.extract_json_ld_data(self.driver.page_source)
+            json_ld_start = time.perf_counter()
+            json_ld_data = extractor.json_ld_product()
             if json_ld_data:
                 print("Found JSON-LD structured data")
                 
@@ -331,230 +655,50 @@ class AgiliteScraper:
                             product_data['price'] = str(offers['price'])
                         if 'availability' in offers:
                             product_data['stock_status'] = offers['availability']
+            self._add_phase('json_ld', time.perf_counter() - json_ld_start)
 
             # Fallback to HTML selectors if JSON-LD didn't provide all data
-            
-            # Get product title if not found in JSON-LD
             if not product_data['title']:
-                try:
-                    print("Looking for product title in HTML...")
-                    title_element = wait.until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, 'h2.product-title, h1.product-title, .product-title'))
-                    )
-                    product_data['title'] = title_element.text.strip()
-                    print(f"Found title: {product_data['title']}")
-                except Exception as e:
-                    print(f"Error getting title from HTML: {str(e)}")
-
-            # Get price if not found in JSON-LD
+                with self._phase('title_selectors'):
+                    product_data['title'] = extractor.title()
             if not product_data['price']:
-                try:
-                    print("Looking for price in HTML...")
-                    # Try different price selectors based on HTML structure
-                    price_selectors = [
-                        'sale-price',
-                        '.price-list sale-price',
-                        '.price',
-                        '.product-price',
-                        '[class*="price"]'
-                    ]
-                    
-                    for selector in price_selectors:
-                        try:
-                            price_element = wait.until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                            )
-                            price_text = price_element.text.strip()
-                            # Clean up price text - remove currency symbol and extra spaces
-                            price_text = re.sub(r'[^\d.,]', '', price_text)
-                            if price_text:
-                                product_data['price'] = price_text
-                                print(f"Found price with selector {selector}: {product_data['price']}")
-                                break
-                        except:
-                            continue
-                except Exception as e:
-                    print(f"Error getting price from HTML: {str(e)}")
-
-            # Get variants if not found in JSON-LD
+                with self._phase('price_selectors'):
+                    product_data['price'] = extractor.price()
             if not product_data['variants']:
-                try:
-                    print("Looking for variants in HTML...")
-                    # Selector for variant groups (fieldset, etc.)
-                    variant_group_selectors = [
-                        '.product-form__input',
-                        '.selector-wrapper',
-                        '.variant-picker',
-                        '.product-form__option'
-                    ]
-
-                    for group_selector in variant_group_selectors:
-                        try:
-                            variant_groups = self.driver.find_elements(By.CSS_SELECTOR, group_selector)
-                            if not variant_groups:
-                                continue
-
-                            print(f"Found {len(variant_groups)} variant groups with selector '{group_selector}'")
-                            for group in variant_groups:
-                                try:
-                                    # Find the title of the variant group (e.g., "Color", "Size")
-                                    group_title_element = group.find_element(By.CSS_SELECTOR, 'label, .form__label, .variant__label')
-                                    group_title = group_title_element.text.strip().replace(':', '')
-                                except NoSuchElementException:
-                                    group_title = "Unknown"
-                                
-                                # Find all values within this group
-                                value_elements = group.find_elements(By.CSS_SELECTOR, 'input[type="radio"], option, [data-value]')
-                                values = []
-
-                                if not value_elements: # Fallback for different structures
-                                     value_elements = group.find_elements(By.CSS_SELECTOR, '.variant-input-wrap')
-
-                                for el in value_elements:
-                                    value = None
-                                    if el.tag_name == 'input':
-                                        value = el.get_attribute('value')
-                                    elif el.tag_name == 'option':
-                                        value = el.text.strip()
-                                        if "select" in value.lower(): continue # Skip placeholder
-                                    else: # Other elements like divs or custom tags
-                                        value = el.get_attribute('data-value') or el.text.strip()
-                                    
-                                    if value and value not in values:
-                                        values.append(value)
-                                
-                                if values:
-                                    # Check if this group is already added
-                                    is_new_group = True
-                                    for existing_group in product_data['variants']:
-                                        if existing_group['type'] == group_title:
-                                            is_new_group = False
-                                            # Add new values if any
-                                            for v in values:
-                                                if v not in existing_group['values']:
-                                                    existing_group['values'].append(v)
-                                            break
-                                    if is_new_group:
-                                         product_data['variants'].append({
-                                            'type': group_title,
-                                            'values': values
-                                        })
-                                    print(f"Found variant group '{group_title}' with values: {values}")
-                                
-                            # If we found variants with this group selector, we can stop
-                            if product_data['variants']:
-                                break 
-                        except Exception as e:
-                            print(f"Error processing group selector {group_selector}: {e}")
-                            continue
-
-                except Exception as e:
-                    print(f"Error getting variants from HTML: {str(e)}")
-
-            # Get images if not found in JSON-LD
+                with self._phase('variant_selectors'):
+                    product_data['variants'] = extractor.variants()
             if not product_data['images']:
-                try:
-                    print("Looking for images in HTML...")
-                    # Try different image selectors
-                    image_selectors = [
-                        '.product-single__photos img',
-                        '.product-gallery img',
-                        '.product-images img',
-                        '[class*="product"] img'
-                    ]
-                    
-                    for selector in image_selectors:
-                        try:
-                            image_elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                            product_data['images'] = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
-                            if product_data['images']:
-                                print(f"Found {len(product_data['images'])} images with selector {selector}")
-                                break
-                        except:
-                            continue
-                except Exception as e:
-                    print(f"Error getting images from HTML: {str(e)}")
+                with self._phase('image_selectors'):
+                    product_data['images'] = extractor.images()
+            if not product_data['stock_status']:
+                with self._phase('stock_selectors'):
+                    product_data['stock_status'] = extractor.stock_status()
 
-            # Get stock status if not found in JSON-LD
+            # Whether the buy button is disabled can be toggled by JavaScript after load,
+            # so this is the one check that still asks the live browser
             if not product_data['stock_status']:
+                print("Trying to infer stock status from live page state...")
                 try:
-                    print("Looking for stock status in HTML...")
-                    # Try different stock status selectors - more specific ones first
-                    stock_selectors = [
-                        '.product-inventory',
-                        '.stock-status',
-                        '.availability',
-                        '[class*="stock"]',
-                        '[class*="inventory"]',
-                        '[class*="availability"]',
-                        '.add-to-cart-button',
-                        '.product-form__submit',
-                        'button[type="submit"]'
-                    ]
-                    
-                    for selector in stock_selectors:
-                        try:
-                            stock_elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                            if not stock_elements:
-                                continue
-                                
-                            for stock_element in stock_elements:
-                                stock_text = stock_element.text.strip().lower()
-                                element_class = stock_element.get_attribute('class') or ''
-                                element_disabled = stock_element.get_attribute('disabled')
-                                
-                                print(f"Checking stock element: '{stock_text}' (class: {element_class}, disabled: {element_disabled})")
-                                
-                                # Check for common stock status indicators
-                                if ('out of stock' in stock_text or 'sold out' in stock_text or 
-                                    'unavailable' in stock_text or 'not available' in stock_text):
-                                    product_data['stock_status'] = 'Out of Stock'
-                                    print(f"Found stock status: {product_data['stock_status']}")
-                                    break
-                                elif ('in stock' in stock_text or 'available' in stock_text or 
-                                      'add to cart' in stock_text or 'buy now' in stock_text):
-                                    # Additional check: if button is disabled, it might be out of stock
-                                    if element_disabled:
-                                        product_data['stock_status'] = 'Out of Stock'
-                                    else:
-                                        product_data['stock_status'] = 'In Stock'
-                                    print(f"Found stock status: {product_data['stock_status']}")
-                                    break
-                                elif 'pre-order' in stock_text:
-                                    product_data['stock_status'] = 'Pre-order'
-                                    print(f"Found stock status: {product_data['stock_status']}")
-                                    break
-                            
-                            if product_data['stock_status']:
+                    with self._phase('live_stock_check'):
+                        disabled_buttons = driver.find_elements(By.CSS_SELECTOR, 'button[disabled], input[disabled]')
+                        for button in disabled_buttons:
+                            button_text = button.text.strip().lower()
+                            if any(word in button_text for word in ['add to cart', 'buy', 'purchase']):
+                                product_data['stock_status'] = 'Out of Stock'
+                                print(f"Inferred stock status from disabled button: {product_data['stock_status']}")
                                 break
-                        except Exception as e:
-                            print(f"Error checking selector {selector}: {str(e)}")
-                            continue
-                            
-                    # If still no stock status found, try to infer from page structure
-                    if not product_data['stock_status']:
-                        print("Trying to infer stock status from page structure...")
-                        try:
-                            # Check if there's a disabled add to cart button
-                            disabled_buttons = self.driver.find_elements(By.CSS_SELECTOR, 'button[disabled], input[disabled]')
-                            if disabled_buttons:
-                                for button in disabled_buttons:
-                                    button_text = button.text.strip().lower()
-                                    if any(word in button_text for word in ['add to cart', 'buy', 'purchase']):
-                                        product_data['stock_status'] = 'Out of Stock'
-                                        print(f"Inferred stock status from disabled button: {product_data['stock_status']}")
-                                        break
-                            
-                            # If still no status, assume in stock if we found a price
-                            if not product_data['stock_status'] and product_data['price']:
-                                product_data['stock_status'] = 'In Stock'
-                                print(f"Assuming in stock based on price presence: {product_data['stock_status']}")
-                                
-                        except Exception as e:
-                            print(f"Error inferring stock status: {str(e)}")
-                            
                 except Exception as e:
-                    print(f"Error getting stock status from HTML: {str(e)}")
+                    print(f"Error inferring stock status: {str(e)}")
+
+            # If still no status, assume in stock if we found a price
+            if not product_data['stock_status'] and product_data['price']:
+                product_data['stock_status'] = 'In Stock'
+                print(f"Assuming in stock based on price presence: {product_data['stock_status']}")
+
+            # Page weight after blocking, to see what rendering each product costs
+            with self._phase('page_metrics'):
+                product_data['render_metrics'] = collect_page_metrics(driver, sink)
+            print(f"Page metrics: {product_data['render_metrics']}")
 
             # Save product data in test mode
             if self.test_mode:
@@ -564,74 +708,180 @@ class AgiliteScraper:
             print(f"✓ Successfully processed: {product_data['title']}")
             return product_data
         except Exception as e:
+            # Let browser-level failures reach the pool so the driver gets recycled
+            if isinstance(e, WebDriverException) and not isinstance(e, TimeoutException):
+                raise
             print(f"Error getting product data from {url}: {str(e)}")
             print("Full traceback:")
             print(traceback.format_exc())
             return None
 
-    def scrape_all_products(self):
-        """Scrape data for all products"""
-        print("Starting product scraping...")
+    def _state_directory(self):
+        """Directory for state carried between runs"""
+        if self.state_dir:
+            return self.state_dir
+        return 'data/test_scrape/state' if self.test_mode else 'data/state'
+
+    def get_sitemap_entries(self):
+        """Get {product URL: lastmod} for every product listed in the store's sitemaps"""
+        try:
+            entries = fetch_product_sitemap_entries(self.fetch, self.store_url)
+            print(f"Found {len(entries)} products in sitemap")
+            if self.test_mode:
+                self.save_intermediate_data(entries, 'sitemap_entries.json')
+            return entries
+        except Exception as e:
+            print(f"Error reading sitemap: {str(e)}")
+            return {}
+
+    def _output_directory(self):
+        return 'data/test_scrape' if self.test_mode else 'data/raw'
+
+    def scrape_product_urls(self, product_links, on_result=None):
+        """
+        Scrape the given product URLs concurrently and return the successful results.
+
+        When `on_result(url, product)` is given, products are handed over as they
+        complete instead of being collected.
+        """
+        # Products are fetched concurrently; pacing comes from the per-host rate limit in fetch()
+        # instead of a fixed sleep between products
+        print(f"Scraping with concurrency {self.concurrency} at {self.rate_per_host} requests/sec per host")
+        self.timing_summary = TimingSummary()
+        engine = AsyncScrapeEngine(self.get_product_data, concurrency=self.concurrency)
+        results = engine.run(product_links, on_result)
+        print(f"Fetch window: {self.controller.snapshot()}")
+        self.print_timing_summary()
+        if on_result:
+            return None
+        return [p for p in results if p is not None]
+
+    def print_timing_summary(self):
+        """Print p50/p95 per scrape phase for the products scraped so far"""
+        phases = self.timing_summary.summary()['phases']
+        if not phases:
+            return
+        print("Phase timings (seconds):")
+        for name, stats in sorted(phases.items(), key=lambda item: item[1]['total'], reverse=True):
+            print(f"  {name:<18} n={stats['count']:<5} p50={stats['p50']:.3f} p95={stats['p95']:.3f} "
+                  f"max={stats['max']:.3f} total={stats['total']:.1f}")
+
+    def save_timing_summary(self, snapshot_path):
+        """Write the run's timing summary next to its snapshot"""
+        try:
+            path = self.timing_summary.write(timings_path(snapshot_path))
+            print(f"Timing summary saved to {path}")
+        except Exception as e:
+            print(f"Error saving timing summary: {str(e)}")
+
+    def plan_products(self):
+        """
+        Decide which product URLs to scrape.
+
+        Returns (URLs to scrape, products carried forward, sitemap state, sitemap entries);
+        the last three are only set in sitemap discovery mode.
+        """
+        if self.discovery == 'sitemap':
+            entries = self.get_sitemap_entries()
+            if entries:
+                state = SitemapState(os.path.join(self._state_directory(), 'sitemap_state.json'))
+                to_scrape, carried = state.plan(entries)
+                print(f"Sitemap discovery: {len(to_scrape)} new or changed, {len(carried)} unchanged")
+                if self.test_mode:
+                    to_scrape = to_scrape[:3]
+                    print("Test mode: Processing only first 3 changed products")
+                return to_scrape, carried, state, entries
+            print("Sitemap discovery failed, falling back to collection pages")
+
         product_links = self.get_product_links()
-        products = []
         
         # In test mode, only process first few products
         if self.test_mode:
             product_links = product_links[:3]
             print("Test mode: Processing only first 3 products")
+        return product_links, [], None, None
 
-        # Process products sequentially to avoid cache issues
-        # No threading for now to ensure clean page loads
-        results = []
-        for i, url in enumerate(product_links):
-            print(f"\n{'='*50}")
-            print(f"Processing product {i+1}/{len(product_links)}")
-            print(f"{'='*50}")
-            
-            result = self.get_product_data(url)
-            results.append(result)
-            
-            # Add delay between products to ensure clean separation
-            if i < len(product_links) - 1:  # Don't sleep after last product
-                print("Waiting 3 seconds before next product...")
-                time.sleep(3)
-        
-        products = [p for p in results if p is not None]
+    def scrape_all_products(self):
+        """Scrape data for all products and return them as a list"""
+        print("Starting product scraping...")
+        product_links, carried, state, entries = self.plan_products()
+        products = self.scrape_product_urls(product_links)
+        if state:
+            for product in products:
+                state.record(product['url'], entries.get(product['url']), product)
+            state.prune(entries)
+            state.save()
+        products += carried
         
         print(f"Successfully scraped {len(products)} products")
         return products
 
+    def scrape_to_snapshot(self):
+        """
+        Scrape all products straight into an NDJSON snapshot in the output directory.
+
+        Each product is appended as soon as it completes, together with a checkpoint
+        journal of finished URLs. If an earlier run was interrupted, its snapshot is
+        resumed and finished URLs are skipped. Returns (snapshot path, product count).
+        """
+        print("Starting product scraping...")
+        run = SnapshotRun.resume_or_start(self._output_directory(), self.raw_compression)
+        print(f"Writing products to {run.path}")
+        try:
+            product_links, carried, state, entries = self.plan_products()
+
+            for product in carried:
+                if product['url'] not in run.done:
+                    run.write(product)
+
+            remaining = [url for url in product_links if url not in run.done]
+            if len(remaining) < len(product_links):
+                print(f"Resuming: {len(product_links) - len(remaining)} products already scraped")
+
+            def on_result(url, product):
+                if product is None:
+                    return
+                run.write(product)
+                if state:
+                    state.record(url, entries.get(url), product)
+
+            self.scrape_product_urls(remaining, on_result)
+
+            if state:
+                state.prune(entries)
+                state.save()
+        except BaseException:
+            # Keep the checkpoint journal so the next run resumes this snapshot
+            run.close()
+            raise
+
+        run.complete()
+        self.save_timing_summary(run.path)
+        print(f"Successfully scraped {run.count} products into {run.path}")
+        return run.path, run.count
+
     def save_products_data(self, products):
-        """Save product data to JSON file"""
+        """Save product data to an NDJSON snapshot"""
         try:
-            if self.test_mode:
-                directory = 'data/test_scrape'
-            else:
-                directory = 'data/raw'
+            run = SnapshotRun.start(self._output_directory(), self.raw_compression)
+            for product in products:
+                run.write(product)
+            run.complete()
+            self.save_timing_summary(run.path)
             
-            os.makedirs(directory, exist_ok=True)
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f'products_{timestamp}.json'
-            filepath = os.path.join(directory, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(products, f, ensure_ascii=False, indent=2)
-            
-            print(f"Data saved to {filepath}")
+            print(f"Data saved to {run.path}")
         except Exception as e:
             print(f"Error saving data: {str(e)}")
 
     def close(self):
-        """Close the browser"""
-        if self.driver:
-            self.driver.quit()
+        """Shut down all pooled browsers"""
+        self.driver_pool.close()
 
 if __name__ == "__main__":
     try:
         # Create scraper in normal mode
         scraper = AgiliteScraper(test_mode=False)
-        products = scraper.scrape_all_products()
-        scraper.save_products_data(products)
+        scraper.scrape_to_snapshot()
     except Exception as e:
         print(f"Error during scraping: {str(e)}")
         print("Full traceback:")
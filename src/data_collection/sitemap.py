@@ -0,0 +1,101 @@
+import os
+import json
+import copy
+from datetime import datetime
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+SITEMAP_NS = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+
+
+def parse_sitemap(xml_text):
+    """Return (child sitemap URLs, [(page URL, lastmod)]) from a sitemap or sitemap index"""
+    root = ET.fromstring(xml_text.encode('utf-8') if isinstance(xml_text, str) else xml_text)
+    sitemaps = [loc.text.strip() for loc in root.findall('sm:sitemap/sm:loc', SITEMAP_NS) if loc.text]
+    urls = []
+    for url in root.findall('sm:url', SITEMAP_NS):
+        loc = url.find('sm:loc', SITEMAP_NS)
+        lastmod = url.find('sm:lastmod', SITEMAP_NS)
+        if loc is not None and loc.text:
+            urls.append((loc.text.strip(), lastmod.text.strip() if lastmod is not None and lastmod.text else None))
+    return sitemaps, urls
+
+
+def fetch_product_sitemap_entries(fetch, store_url):
+    """Read sitemap.xml and its sitemap_products_*.xml children into {product URL: lastmod}"""
+    response = fetch(f"{store_url}/sitemap.xml")
+    response.raise_for_status()
+    sitemaps, urls = parse_sitemap(response.content)
+
+    entries = {}
+    for sitemap_url in sitemaps:
+        if 'sitemap_products' not in sitemap_url:
+            continue
+        child = fetch(sitemap_url)
+        child.raise_for_status()
+        _, child_urls = parse_sitemap(child.content)
+        urls.extend(child_urls)
+
+    store_host = urlparse(store_url).netloc
+    for url, lastmod in urls:
+        parsed = urlparse(url)
+        # Keep primary-locale product pages only
+        if parsed.netloc == store_host and parsed.path.startswith('/products/'):
+            entries[url] = lastmod
+    return entries
+
+
+class SitemapState:
+    """
+    Last seen sitemap lastmod and product snapshot per URL, persisted between runs.
+
+    Products whose lastmod is unchanged are carried forward from their stored
+    snapshot instead of being scraped again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.products = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.products = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Could not read sitemap state {path}, starting fresh: {str(e)}")
+
+    def plan(self, entries, now=None):
+        """
+        Split sitemap entries into URLs to scrape and snapshots to carry forward.
+
+        Carried-forward products are stamped with this run's time (`now`, default
+        the current time): they were seen in this run, and the processor dates
+        records and observations by the product timestamp.
+        """
+        timestamp = (now or datetime.now()).isoformat()
+        to_scrape = []
+        carried = []
+        for url, lastmod in entries.items():
+            known = self.products.get(url)
+            if known and lastmod and known.get('lastmod') == lastmod and known.get('product'):
+                product = copy.deepcopy(known['product'])
+                product['carried_forward'] = True
+                product['timestamp'] = timestamp
+                carried.append(product)
+            else:
+                to_scrape.append(url)
+        return to_scrape, carried
+
+    def record(self, url, lastmod, product):
+        """Remember a freshly scraped snapshot and the lastmod it was scraped at"""
+        self.products[url] = {'lastmod': lastmod, 'product': product}
+
+    def prune(self, entries):
+        """Forget products that are no longer listed in the sitemap"""
+        self.products = {url: state for url, state in self.products.items() if url in entries}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.products, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class PhaseTimer:
+    """
+    Wall-clock time spent in each named phase of scraping one product.
+
+    Phases entered more than once (e.g. navigation retries) accumulate.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._start = time.perf_counter()
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def as_dict(self):
+        """Phase durations in seconds, plus the total time since the timer started"""
+        timings = {name: round(seconds, 4) for name, seconds in self.phases.items()}
+        timings['total'] = round(time.perf_counter() - self._start, 4)
+        return timings
+
+
+class TimingSummary:
+    """Collects per-product phase timings of one run and summarizes them with percentiles"""
+
+    def __init__(self, slowest=10):
+        self.slowest = slowest
+        self.products = []
+        self._lock = threading.Lock()
+
+    def add(self, url, timings, fetched_via=None, ok=True):
+        with self._lock:
+            self.products.append({'url': url, 'fetched_via': fetched_via, 'ok': ok, 'timings': timings})
+
+    def summary(self):
+        """Per-phase count, total, p50/p90/p95 and max, and the slowest products"""
+        with self._lock:
+            products = list(self.products)
+
+        by_phase = {}
+        for product in products:
+            for name, seconds in product['timings'].items():
+                by_phase.setdefault(name, []).append(seconds)
+
+        phases = {}
+        for name, values in by_phase.items():
+            phases[name] = {
+                'count': len(values),
+                'total': round(sum(values), 4),
+                'p50': round(percentile(values, 50), 4),
+                'p90': round(percentile(values, 90), 4),
+                'p95': round(percentile(values, 95), 4),
+                'max': round(max(values), 4)
+            }
+
+        slowest = sorted(products, key=lambda p: p['timings'].get('total', 0), reverse=True)[:self.slowest]
+        return {
+            'products': len(products),
+            'failed': sum(1 for p in products if not p['ok']),
+            'fetched_via': {
+                via: sum(1 for p in products if p['fetched_via'] == via)
+                for via in sorted({p['fetched_via'] for p in products if p['fetched_via']})
+            },
+            'phases': phases,
+            'slowest': [{'url': p['url'], 'timings': p['timings']} for p in slowest]
+        }
+
+    def write(self, path):
+        """Write the summary as JSON next to the run output"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        return path
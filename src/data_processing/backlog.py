@@ -0,0 +1,46 @@
+import os
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from raw_store import iter_products, snapshot_checksum, snapshot_name, snapshot_time
+from fingerprint import product_fingerprint
+
+
+def parse_snapshot(path: str, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Reads and fingerprints one raw snapshot; runs in a worker process.
+
+    Returns the snapshot's name, start time, content checksum and its products,
+    each with a 'fingerprint'. Files larger than `max_bytes` on disk are only
+    checksummed ('products' is None); the caller streams them instead, so a
+    huge snapshot is never held in memory or sent between processes whole.
+    """
+    products = None
+    if max_bytes is None or os.path.getsize(path) <= max_bytes:
+        products = []
+        for product in iter_products(path):
+            if isinstance(product, dict) and not product.get('fingerprint'):
+                product['fingerprint'] = product_fingerprint(product)
+            products.append(product)
+    return {
+        'path': path,
+        'snapshot': snapshot_name(path),
+        'started_at': snapshot_time(path),
+        'checksum': snapshot_checksum(path),
+        'products': products
+    }
+
+
+def ordered_map(executor: Executor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """
+    Like executor.map, but with at most `window` tasks submitted ahead of the
+    consumer, so parsed results do not pile up in memory while they are written.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
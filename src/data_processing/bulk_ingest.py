@@ -0,0 +1,308 @@
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select, func, text, tuple_
+from sqlalchemy.orm import Session
+
+from models import (Product, ProductImage, ProductVariant, ProductObservation, IngestQuarantine, ImageDimension,
+                    VariantDimension, create_partitions, month_start)
+
+logger = logging.getLogger(__name__)
+
+
+def _copy_field(value: Any) -> str:
+    """Formats one value for COPY ... (FORMAT csv): NULL is a bare empty field, everything else is quoted."""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=' ')
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def dialect_insert(db: Session):
+    """The INSERT construct of the session's dialect, which supports ON CONFLICT upserts."""
+    if db.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    return upsert
+
+
+def check_lengths(table, row: Dict[str, Any]) -> Optional[str]:
+    """Returns an error if a string value does not fit its column, otherwise None; other keys are ignored."""
+    for name, value in row.items():
+        if name not in table.c:
+            continue
+        length = getattr(table.c[name].type, 'length', None)
+        if length and isinstance(value, str) and len(value) > length:
+            return f"{table.name}.{name} is {len(value)} characters, limit is {length}"
+    return None
+
+
+# Values looked up or inserted per statement
+DIMENSION_CHUNK = 1000
+
+
+def _chunks(values: List[Any]):
+    for start in range(0, len(values), DIMENSION_CHUNK):
+        yield values[start:start + DIMENSION_CHUNK]
+
+
+class DimensionKeys:
+    """
+    Resolves image URLs and variant (type, name) pairs to their image_dim and variant_dim ids.
+
+    Values not seen before are inserted with ON CONFLICT DO NOTHING and then
+    looked up, a chunk at a time, so concurrent ingests agree on one row per
+    value. Ids are cached for the lifetime of the object, which must not
+    outlive a rollback of the transaction the rows were inserted in.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._images: Dict[str, int] = {}
+        self._variants: Dict[Tuple[str, str], int] = {}
+
+    def image_ids(self, urls: Iterable[str]) -> Dict[str, int]:
+        """Ids of the given image URLs, inserting the new ones."""
+        urls = set(urls)
+        # Sorted, so concurrent ingests lock the same rows in the same order
+        missing = sorted(url for url in urls if url not in self._images)
+        table = ImageDimension.__table__
+        for chunk in _chunks(missing):
+            self.db.execute(dialect_insert(self.db)(table).on_conflict_do_nothing(index_elements=['url']),
+                            [{'url': url} for url in chunk])
+            self._images.update(self.db.execute(select(table.c.url, table.c.id).where(table.c.url.in_(chunk))).all())
+        return {url: self._images[url] for url in urls}
+
+    def variant_ids(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """Ids of the given (variant type, name) pairs, inserting the new ones."""
+        keys = set(keys)
+        missing = sorted(key for key in keys if key not in self._variants)
+        table = VariantDimension.__table__
+        for chunk in _chunks(missing):
+            self.db.execute(
+                dialect_insert(self.db)(table).on_conflict_do_nothing(index_elements=['variant_type', 'name']),
+                [{'variant_type': variant_type, 'name': name} for variant_type, name in chunk]
+            )
+            rows = self.db.execute(select(table.c.variant_type, table.c.name, table.c.id)
+                                   .where(tuple_(table.c.variant_type, table.c.name).in_(chunk))).all()
+            self._variants.update(((variant_type, name), id_) for variant_type, name, id_ in rows)
+        return {key: self._variants[key] for key in keys}
+
+    def link(self, images: List[Dict[str, Any]],
+             variants: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Turns image rows with a 'url' and variant rows with a 'variant_type' and
+        'name' into product_images and product_variants rows referencing the
+        dimension rows; other keys are kept.
+        """
+        image_ids = self.image_ids(image['url'] for image in images)
+        variant_ids = self.variant_ids((variant['variant_type'] or '', variant['name']) for variant in variants)
+        image_rows = []
+        for image in images:
+            row = {key: value for key, value in image.items() if key != 'url'}
+            row['image_id'] = image_ids[image['url']]
+            image_rows.append(row)
+        variant_rows = []
+        for variant in variants:
+            row = {key: value for key, value in variant.items() if key not in ('variant_type', 'name')}
+            row['variant_id'] = variant_ids[(variant['variant_type'] or '', variant['name'])]
+            variant_rows.append(row)
+        return image_rows, variant_rows
+
+
+class BulkWriter:
+    """
+    Buffers products, their images and variants, and observations, and writes
+    them in batches inside the caller's transaction.
+
+    Images and variants are stored once in image_dim and variant_dim; a batch
+    only writes product_images and product_variants rows linking its products
+    to them.
+
+    Product ids are reserved from the database sequence a block at a time, so
+    child rows can reference their product without a round trip per product.
+    Batches are written with PostgreSQL COPY when the driver supports it and
+    with multi-row INSERT statements otherwise. If a batch fails, it is retried
+    row by row under savepoints and the rows that still fail are quarantined.
+    The caller commits.
+    """
+
+    def __init__(self, db: Session, session_id: Optional[int] = None, source_file: Optional[str] = None,
+                 batch_size: int = 1000, use_copy: Optional[bool] = None):
+        self.db = db
+        self.session_id = session_id
+        self.source_file = source_file
+        self.batch_size = max(1, int(batch_size))
+        self.dialect = db.get_bind().dialect.name
+        if use_copy is None:
+            use_copy = self.dialect == 'postgresql' and db.get_bind().dialect.driver == 'psycopg2'
+        self.use_copy = use_copy
+        self.products_written = 0
+        self.observations_written = 0
+        self.quarantined = 0
+        # Reserved ids whose product ended up quarantined instead of stored
+        self.failed_product_ids = set()
+        self._reserved: List[int] = []
+        self._products: List[Dict[str, Any]] = []
+        self._images: List[Dict[str, Any]] = []
+        self._variants: List[Dict[str, Any]] = []
+        self._observations: List[Dict[str, Any]] = []
+        self._quarantine: List[Dict[str, Any]] = []
+        self.dimensions = DimensionKeys(db)
+        # Months whose history partitions are known to exist
+        self._partition_months = set()
+
+    def _reserve_ids(self, count: int):
+        """Reserves `count` product ids in one statement."""
+        if self.dialect == 'postgresql':
+            rows = self.db.execute(
+                text("SELECT nextval(pg_get_serial_sequence('agilite.products', 'id')) "
+                     "FROM generate_series(1, :count)"),
+                {'count': count}
+            )
+            self._reserved.extend(row[0] for row in rows)
+        else:
+            # Databases without sequences (e.g. SQLite in development) continue after the highest id
+            start = max(self._reserved + [self.db.execute(select(func.max(Product.id))).scalar() or 0])
+            self._reserved.extend(range(start + 1, start + 1 + count))
+
+    def add_product(self, row: Dict[str, Any], images: List[Dict[str, Any]],
+                    variants: List[Dict[str, Any]]) -> int:
+        """Queues a product with its images and variants and returns the id it will be stored with."""
+        if not self._reserved:
+            self._reserve_ids(self.batch_size)
+        product_id = self._reserved.pop(0)
+        self._products.append(dict(row, id=product_id))
+        # Children carry the product's timestamp, the partition key they share with it
+        timestamp = row['processing_timestamp']
+        self._images.extend(dict(image, product_id=product_id, processing_timestamp=timestamp) for image in images)
+        self._variants.extend(dict(variant, product_id=product_id, processing_timestamp=timestamp)
+                              for variant in variants)
+        if len(self._products) >= self.batch_size:
+            self.flush()
+        return product_id
+
+    def add_observation(self, product_id: int, observed_at: Optional[datetime] = None):
+        """Queues a "seen, unchanged" marker for an existing product record."""
+        self._observations.append({
+            'product_id': product_id,
+            'session_id': self.session_id,
+            'observed_at': observed_at or datetime.utcnow()
+        })
+        if len(self._observations) >= self.batch_size:
+            self.flush()
+
+    def quarantine(self, product_data: Any, error: str):
+        """Queues a raw product that could not be stored, with the reason."""
+        url = product_data.get('url') if isinstance(product_data, dict) else None
+        self._quarantine.append({
+            'session_id': self.session_id,
+            'source_file': self.source_file,
+            'url': str(url)[:500] if url else None,
+            'payload': json.dumps(product_data, ensure_ascii=False, default=str),
+            'error': error,
+            'created_at': datetime.utcnow()
+        })
+
+    def _write(self, table, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        if self.use_copy:
+            self._copy(table, rows)
+        else:
+            self.db.execute(insert(table), rows)
+
+    def _copy(self, table, rows: List[Dict[str, Any]]):
+        columns = list(rows[0].keys())
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(_copy_field(row.get(column)) for column in columns))
+            buffer.write('\n')
+        buffer.seek(0)
+        # The DBAPI connection of the session, so COPY runs in the same transaction
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.schema}.{table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+    def _write_rows_individually(self, products, images, variants, observations):
+        """Writes each product with its children under its own savepoint, quarantining failures."""
+        images_by_product: Dict[int, List[Dict[str, Any]]] = {}
+        for image in images:
+            images_by_product.setdefault(image['product_id'], []).append(image)
+        variants_by_product: Dict[int, List[Dict[str, Any]]] = {}
+        for variant in variants:
+            variants_by_product.setdefault(variant['product_id'], []).append(variant)
+
+        written = 0
+        for product in products:
+            try:
+                with self.db.begin_nested():
+                    self.db.execute(insert(Product.__table__), [product])
+                    if images_by_product.get(product['id']):
+                        self.db.execute(insert(ProductImage.__table__), images_by_product[product['id']])
+                    if variants_by_product.get(product['id']):
+                        self.db.execute(insert(ProductVariant.__table__), variants_by_product[product['id']])
+                written += 1
+            except Exception as e:
+                self.failed_product_ids.add(product['id'])
+                logger.warning(f"Quarantining product {product.get('url')}: {str(e)}")
+                self.quarantine(product, f"insert failed: {str(e)}")
+
+        for observation in observations:
+            try:
+                with self.db.begin_nested():
+                    self.db.execute(insert(ProductObservation.__table__), [observation])
+                self.observations_written += 1
+            except Exception as e:
+                self.quarantine(observation, f"observation insert failed: {str(e)}")
+        return written
+
+    def _ensure_partitions(self, products: List[Dict[str, Any]]):
+        """
+        Creates the monthly partitions for the records' timestamps, e.g. of archives dated by scrape time.
+
+        Usually they exist already; a partition created here locks its table
+        against readers until the caller commits.
+        """
+        months = {month_start(product['processing_timestamp']) for product in products} - self._partition_months
+        for month in sorted(months):
+            create_partitions(self.db.connection(), month, months_ahead=0)
+        self._partition_months |= months
+
+    def flush(self):
+        """Writes everything queued so far; nothing is committed."""
+        products, images, variants = self._products, self._images, self._variants
+        observations = self._observations
+        self._products, self._images, self._variants, self._observations = [], [], [], []
+
+        if products or observations:
+            # Outside the savepoint below: a failed batch must not roll back ids or partitions that are cached
+            images, variants = self.dimensions.link(images, variants)
+            self._ensure_partitions(products)
+            try:
+                with self.db.begin_nested():
+                    self._write(Product.__table__, products)
+                    self._write(ProductImage.__table__, images)
+                    self._write(ProductVariant.__table__, variants)
+                    self._write(ProductObservation.__table__, observations)
+                self.products_written += len(products)
+                self.observations_written += len(observations)
+            except Exception as e:
+                logger.warning(f"Bulk write of {len(products)} products failed ({str(e)}), retrying row by row")
+                self.products_written += self._write_rows_individually(products, images, variants, observations)
+
+        if self._quarantine:
+            quarantine, self._quarantine = self._quarantine, []
+            self.db.execute(insert(IngestQuarantine.__table__), quarantine)
+            self.quarantined += len(quarantine)
+            logger.warning(f"Quarantined {len(quarantine)} products")
@@ -1,19 +1,31 @@
 import os
-import json
 import pandas as pd
-from datetime import datetime
-import re
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Iterable, Optional
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_
 
 # Import our modules
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db import SessionLocal, test_connection
-from models import Product, ProductImage, ProductVariant, ScrapingSession, create_tables
+from models import (Product, ProductImage, ProductVariant, ProductObservation, IngestedFile, StockRollup,
+                    CategoryKeyword, ScrapingSession, ImageDimension, VariantDimension, create_tables,
+                    create_partitions, month_start)
+from data_processing.bulk_ingest import BulkWriter, DimensionKeys, check_lengths
+from data_processing.history import ProductHistory
+from data_processing.backlog import parse_snapshot, ordered_map
+from data_processing.statistics import (compute_basic_statistics, refresh_statistics, load_statistics,
+                                        StockRollups, rebuild_rollups, daily_stock_counts)
+from data_processing.normalize import (ProductNormalizer, DEFAULT_CATEGORY_TAXONOMY, clean_price,
+                                       parse_stock_status, normalized_records)
+from raw_store import list_raw_files, iter_products, snapshot_name, snapshot_checksum, find_snapshot, snapshot_time
+from fingerprint import product_fingerprint
 
 # Configure logging
 logging.basicConfig(
@@ -28,6 +40,16 @@ class AgiliteDataProcessor:
         Initializes the data processor with a database connection.
         """
         self.db = SessionLocal()
+        # 'bulk' writes a whole snapshot in one transaction with COPY/multi-row inserts,
+        # 'row' commits every product separately
+        self.ingest_mode = os.environ.get('INGEST_MODE', 'bulk').lower()
+        self.batch_size = int(os.environ.get('INGEST_BATCH_SIZE', 1000))
+        # Backlog snapshots larger than this are streamed in this process instead of parsed by a worker
+        self.stream_threshold_bytes = int(float(os.environ.get('INGEST_STREAM_THRESHOLD_MB', 64)) * 1024 * 1024)
+        # Refresh the product_stats table with every ingest and serve basic statistics from it
+        self.precompute_stats = os.environ.get('STATS_PRECOMPUTED', 'true').lower() in ('1', 'true', 'yes')
+        # Months whose history partitions are known to exist (row mode)
+        self._partition_months = set()
         self._ensure_database()
         
     def _ensure_database(self):
@@ -39,234 +61,496 @@ class AgiliteDataProcessor:
             # Create tables if they don't exist
             from db import engine
             create_tables(engine)
+            self._ensure_rollups()
+            self._adopt_ingested_snapshots()
+            self._load_taxonomy()
             logger.info("Database connection and tables verified")
             
         except Exception as e:
             logger.error(f"Database setup failed: {str(e)}")
             raise
     
+    def _ensure_rollups(self):
+        """Builds the hourly stock rollups from existing records when precomputed statistics are enabled."""
+        if not self.precompute_stats:
+            return
+        if self.db.query(StockRollup.id).first() is not None or self.db.query(Product.id).first() is None:
+            return
+        logger.info("Building stock rollups from existing records")
+        created = rebuild_rollups(self.db)
+        self.db.commit()
+        logger.info(f"Created {created} stock rollup buckets")
+    
+    def _adopt_ingested_snapshots(self, raw_data_dir: str = 'data/raw'):
+        """
+        Records the snapshots ingested before the ingested_files manifest existed.
+        
+        Earlier versions ingested the latest snapshot on every run without a
+        manifest, so the first backlog run after an upgrade would ingest the whole
+        archive again. While the manifest is empty, every complete snapshot named
+        with a time before the last completed scraping session started is taken
+        as ingested. The time comes from the file name, not the file, so copies
+        and restores that reset modification times do not matter; it is the
+        scraper's local time and converted to UTC like session times.
+        """
+        if self.db.query(IngestedFile.id).first() is not None:
+            return
+        last_session = self.db.query(ScrapingSession.session_start).filter(
+            ScrapingSession.status.in_(("completed", "completed_with_errors"))
+        ).order_by(ScrapingSession.session_start.desc()).limit(1).scalar()
+        if last_session is None:
+            return
+        
+        adopted = 0
+        for path in list_raw_files(raw_data_dir):
+            started = snapshot_time(path)
+            if started is None or started.astimezone(timezone.utc).replace(tzinfo=None) > last_session:
+                continue
+            self.db.add(IngestedFile(snapshot=snapshot_name(path), path=path,
+                                     checksum=snapshot_checksum(path), products=0))
+            adopted += 1
+        self.db.commit()
+        if adopted:
+            logger.info(f"Recorded {adopted} snapshots ingested before the manifest existed")
+    
+    def _load_taxonomy(self):
+        """Seeds the category taxonomy table with the built-in keywords if it is empty and compiles it."""
+        if self.db.query(CategoryKeyword.id).first() is None:
+            self.db.add_all([
+                CategoryKeyword(keyword=keyword, category=category, priority=i)
+                for i, (keyword, category) in enumerate(DEFAULT_CATEGORY_TAXONOMY)
+            ])
+            self.db.commit()
+        self.normalizer = ProductNormalizer.from_session(self.db)
+    
     def _clean_price(self, price_str: str) -> float:
         """Cleans and converts a price string to a number."""
-        if not price_str:
-            return 0.0
-        try:
-            # Remove all characters except digits, dot, and comma
-            cleaned = re.sub(r'[^\d.,]', '', price_str)
-            # Replace comma with a dot
-            cleaned = cleaned.replace(',', '.')
-            return float(cleaned)
-        except Exception:
-            return 0.0
+        return clean_price(price_str)
     
     def _extract_category(self, title: str) -> str:
-        """Extracts the category from the product title."""
-        if not title:
-            return 'Other'
-        
-        # Common categories in Hebrew
-        categories = {
-            'קרמון': 'Plate Carriers',
-            'חגורת': 'Belts',
-            'פאוץ': 'Pouches',
-            'כפפות': 'Gloves',
-            'כובע': 'Hats',
-            'משקפי': 'Glasses',
-            'פאנל': 'Panels',
-            'פאץ': 'Patches',
-            'שרוול': 'Sleeves',
-            'ער"ד': 'Medical',
-            'פלטה': 'Plates',
-            'מערכת': 'Systems'
-        }
-        
-        for heb, eng in categories.items():
-            if heb in title:
-                return eng
-        return 'Other'
+        """Extracts the category from the product title using the category taxonomy."""
+        return self.normalizer.category(title)
     
     def _parse_stock_status(self, status: str) -> str:
         """Parses the stock status."""
-        if not status:
-            return "Unknown"
+        return parse_stock_status(status)
+    
+    def _record_product(self, product_data: Dict[str, Any], latest: Dict[str, tuple],
+                        history: ProductHistory, session_id: Optional[int] = None,
+                        observed_at: Optional[datetime] = None,
+                        rollups: Optional[StockRollups] = None) -> Optional[str]:
+        """
+        Stores a scraped product, or only an observation if its content is unchanged.
         
-        status_lower = status.lower()
-        # Handle full schema.org URLs
-        if "schema.org/instock" in status_lower or "instock" in status_lower or "in stock" in status_lower:
-            return "In Stock"
-        elif "schema.org/outofstock" in status_lower or "outofstock" in status_lower or "out of stock" in status_lower:
-            return "Out of Stock"
-        elif "pre-order" in status_lower:
-            return "Pre-order"
-        else:
-            return status
+        Returns 'unchanged', 'saved', or None if the product could not be stored.
+        `latest` is updated in place when a new record is written, and the
+        change or sighting is queued on `history` (and counted on `rollups`).
+        """
+        fingerprint = product_data.get('fingerprint') or product_fingerprint(product_data)
+        current = latest.get(product_data.get('url'))
+        if current and current[1] == fingerprint:
+            try:
+                self.db.add(ProductObservation(product_id=current[0], session_id=session_id,
+                                               observed_at=observed_at or datetime.utcnow()))
+                self.db.commit()
+                history.seen(product_data['url'], observed_at)
+                if rollups:
+                    rollups.observed(observed_at or datetime.utcnow(), current[2], current[3])
+                return 'unchanged'
+            except Exception as e:
+                self.db.rollback()
+                logger.error(f"Error saving product observation: {str(e)}")
+                return None
+        
+        product_id = self._save_product_to_db(product_data, fingerprint, observed_at)
+        if product_id is None:
+            return None
+        stock_status = self._parse_stock_status(product_data.get('stock_status', ''))
+        category = self._extract_category(product_data.get('title', ''))
+        latest[product_data['url']] = (product_id, fingerprint, stock_status, category)
+        history.changed(product_data['url'], product_id, observed_at or datetime.utcnow())
+        if rollups:
+            rollups.recorded(product_id, observed_at or datetime.utcnow(), stock_status, category)
+        return 'saved'
+    
+    def _scrape_time(self, product_data: Dict[str, Any], default: Optional[datetime] = None) -> Optional[datetime]:
+        """When a product was scraped, from its 'timestamp', or `default`."""
+        try:
+            return datetime.fromisoformat(product_data['timestamp']).replace(tzinfo=None)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return default
+    
+    def _prepare_product(self, product_data: Dict[str, Any], content_hash: Optional[str] = None,
+                         observed_at: Optional[datetime] = None,
+                         normalized: Optional[Dict[str, Any]] = None) -> tuple:
+        """
+        Builds the product row and its image and variant rows from a scraped product.
+        
+        `normalized` holds the product's columns from a ProductNormalizer batch;
+        without it they are computed for this product alone. `observed_at`
+        becomes the processing_timestamp (default: now). Image and variant rows
+        hold the url and the variant type and name; DimensionKeys.link turns
+        them into rows referencing image_dim and variant_dim.
+        Raises ValueError for products that cannot be stored.
+        """
+        if not isinstance(product_data, dict) or not product_data.get('url'):
+            raise ValueError("product has no url")
+        
+        now = datetime.utcnow()
+        images = product_data.get('images') or []
+        if normalized is None:
+            normalized = {
+                'url': product_data['url'],
+                'title': product_data.get('title', ''),
+                'price': self._clean_price(product_data.get('price', '0')),
+                'description': product_data.get('description', ''),
+                'image_count': len(images),
+                'first_image_url': images[0] if images else None,
+                'stock_status': self._parse_stock_status(product_data.get('stock_status', '')),
+                'variant_count': len(product_data.get('variants') or []),
+                'category': self._extract_category(product_data.get('title', ''))
+            }
+        row = dict(normalized)
+        row.update({
+            'content_hash': content_hash or product_fingerprint(product_data),
+            'processing_timestamp': observed_at or now,
+            'created_at': now,
+            'updated_at': now
+        })
+        image_rows = [
+            {'url': image_url, 'order_index': i}
+            for i, image_url in enumerate(images) if image_url
+        ]
+        variant_rows = []
+        for variant_group in product_data.get('variants') or []:
+            variant_type = variant_group.get('type', 'Unknown')
+            for variant_name in variant_group.get('values', []):
+                if variant_name:
+                    variant_rows.append({'name': variant_name, 'variant_type': variant_type})
+        
+        # Images and variants are stored in their dimension tables
+        for table, rows in ((Product.__table__, [row]), (ImageDimension.__table__, image_rows),
+                            (VariantDimension.__table__, variant_rows)):
+            for table_row in rows:
+                error = check_lengths(table, table_row)
+                if error:
+                    raise ValueError(error)
+        return row, image_rows, variant_rows
     
-    def _save_product_to_db(self, product_data: Dict[str, Any]) -> bool:
-        """Saves a product to the database as a new record for historical data."""
+    def _save_product_to_db(self, product_data: Dict[str, Any], content_hash: Optional[str] = None,
+                            observed_at: Optional[datetime] = None) -> Optional[int]:
+        """Saves a product to the database as a new record for historical data and returns its id."""
         try:
+            row, image_rows, variant_rows = self._prepare_product(product_data, content_hash, observed_at)
+            
+            # Records dated by scrape time may fall outside the months created for the snapshot
+            month = month_start(row['processing_timestamp'])
+            if month not in self._partition_months:
+                create_partitions(self.db.connection(), month, months_ahead=0)
+                self.db.commit()
+                self._partition_months.add(month)
+            
             # Always create a new record to save historical data
-            product = Product(
-                url=product_data['url'],
-                title=product_data.get('title', ''),
-                price=self._clean_price(product_data.get('price', '0')),
-                description=product_data.get('description', ''),
-                image_count=len(product_data.get('images', [])),
-                first_image_url=product_data.get('images', [''])[0] if product_data.get('images') else None,
-                stock_status=self._parse_stock_status(product_data.get('stock_status', '')),
-                variant_count=len(product_data.get('variants', [])),
-                category=self._extract_category(product_data.get('title', '')),
-                processing_timestamp=datetime.utcnow()
-            )
+            product = Product(**row)
             self.db.add(product)
             self.db.flush()  # Get the product ID
             logger.info(f"Created new historical record for product: {product_data.get('title', 'Unknown')}")
             
-            # Save images
-            if product_data.get('images'):
-                for i, image_url in enumerate(product_data['images']):
-                    if image_url:
-                        product_image = ProductImage(
-                            product_id=product.id,
-                            url=image_url,
-                            order_index=i
-                        )
-                        self.db.add(product_image)
-            
-            # Save variants
-            if product_data.get('variants'):
-                for variant_group in product_data['variants']:
-                    variant_type = variant_group.get('type', 'Unknown')
-                    for variant_name in variant_group.get('values', []):
-                        if variant_name:
-                            product_variant = ProductVariant(
-                                product_id=product.id,
-                                name=variant_name,
-                                variant_type=variant_type
-                            )
-                            self.db.add(product_variant)
+            image_rows, variant_rows = DimensionKeys(self.db).link(image_rows, variant_rows)
+            for image_row in image_rows:
+                self.db.add(ProductImage(product_id=product.id, processing_timestamp=product.processing_timestamp,
+                                         **image_row))
+            for variant_row in variant_rows:
+                self.db.add(ProductVariant(product_id=product.id, processing_timestamp=product.processing_timestamp,
+                                           **variant_row))
             
             self.db.commit()
-            return True
+            return product.id
             
         except Exception as e:
             self.db.rollback()
             logger.error(f"Error saving product to database: {str(e)}")
-            return False
+            return None
     
-    def process_data(self) -> Dict[str, Any]:
-        """Main data processing method."""
+    def _ingest_bulk(self, products, scraping_session: ScrapingSession, source_file: str,
+                     latest: Dict[str, tuple], history: ProductHistory, follow: bool = False,
+                     use_scrape_time: bool = False, default_time: Optional[datetime] = None,
+                     rollups: Optional[StockRollups] = None) -> Dict[str, int]:
+        """
+        Writes a snapshot through a BulkWriter in a single transaction.
+        
+        Products that cannot be prepared or inserted go to the quarantine table
+        instead of failing the snapshot. When following a snapshot that is still
+        being written, every batch is committed so new products show up early.
+        """
+        writer = BulkWriter(self.db, scraping_session.id, source_file, batch_size=self.batch_size)
+        counts = {'scraped': 0, 'saved': 0, 'unchanged': 0}
+        products = iter(products)
+        while True:
+            batch = list(islice(products, self.batch_size))
+            if not batch:
+                break
+            # Price, stock and category of the whole batch in one vectorized pass
+            valid = [i for i, product_data in enumerate(batch) if isinstance(product_data, dict)]
+            normalized = dict(zip(valid, normalized_records(
+                self.normalizer.normalize([batch[i] for i in valid])))) if valid else {}
+            
+            for i, product_data in enumerate(batch):
+                counts['scraped'] += 1
+                try:
+                    fingerprint = product_data.get('fingerprint') or product_fingerprint(product_data)
+                    observed_at = self._scrape_time(product_data, default_time) if use_scrape_time else None
+                    current = latest.get(product_data.get('url'))
+                    if current and current[1] == fingerprint:
+                        writer.add_observation(current[0], observed_at)
+                        history.seen(product_data['url'], observed_at)
+                        if rollups:
+                            rollups.observed(observed_at or datetime.utcnow(), current[2], current[3])
+                        counts['unchanged'] += 1
+                    else:
+                        row, image_rows, variant_rows = self._prepare_product(
+                            product_data, fingerprint, observed_at, normalized.get(i))
+                        product_id = writer.add_product(row, image_rows, variant_rows)
+                        latest[row['url']] = (product_id, fingerprint, row['stock_status'], row['category'])
+                        history.changed(row['url'], product_id, row['processing_timestamp'])
+                        if rollups:
+                            rollups.recorded(product_id, row['processing_timestamp'],
+                                             row['stock_status'], row['category'])
+                except (ValueError, TypeError, AttributeError) as e:
+                    writer.quarantine(product_data, str(e))
+            
+            if follow:
+                writer.flush()
+                history.flush(writer.failed_product_ids)
+                if rollups:
+                    rollups.flush(writer.failed_product_ids)
+                self.db.commit()
+        
+        writer.flush()
+        history.flush(writer.failed_product_ids)
+        if rollups:
+            rollups.flush(writer.failed_product_ids)
+        counts['saved'] = writer.products_written
+        counts['unchanged'] = writer.observations_written
+        counts['failed'] = writer.quarantined
+        return counts
+    
+    def _ingest_snapshot(self, products, source_file: str, follow: bool = False,
+                         checksum: Optional[str] = None, as_of: Optional[datetime] = None,
+                         use_scrape_time: bool = False, months: Iterable[datetime] = ()) -> Dict[str, Any]:
+        """
+        Ingests the products of one snapshot and records it in the ingested_files manifest.
+        
+        `as_of` compares fingerprints with the versions valid at that time instead
+        of the current ones, and `use_scrape_time` dates records and observations
+        by the products' scrape timestamps; both are used for older snapshots.
+        `months` lists further months the records fall in, whose partitions are
+        created up front; creating one mid-snapshot would block readers of the
+        history tables until the snapshot commits.
+        """
+        # Monthly partitions for the records of this snapshot (older snapshots go to their own month)
+        create_partitions(self.db.connection(), as_of)
+        for month in sorted(set(months) - {month_start(as_of or datetime.utcnow())}):
+            create_partitions(self.db.connection(), month, months_ahead=0)
+        
+        # Create a scraping session
+        scraping_session = ScrapingSession()
+        self.db.add(scraping_session)
+        self.db.commit()
+        
+        logger.info(f"Started scraping session {scraping_session.id} for {source_file}")
+        
+        processed_count = 0
+        failed_count = 0
+        scraped_count = 0
+        unchanged_count = 0
+        
+        # Products whose fingerprint matches their current version only get an observation row
+        history = ProductHistory(self.db)
+        latest = history.load(as_of)
+        default_time = as_of if use_scrape_time else None
+        # Hourly stock counts for the time-based statistics, written with the records
+        rollups = StockRollups(self.db) if self.precompute_stats else None
+        
+        if self.ingest_mode == 'bulk':
+            try:
+                counts = self._ingest_bulk(products, scraping_session, source_file, latest, history,
+                                           follow, use_scrape_time, default_time, rollups)
+            except Exception:
+                self.db.rollback()
+                scraping_session.session_end = datetime.utcnow()
+                scraping_session.status = "failed"
+                self.db.commit()
+                raise
+            scraped_count = counts['scraped']
+            processed_count = counts['saved'] + counts['unchanged']
+            unchanged_count = counts['unchanged']
+            failed_count = counts['failed']
+        else:
+            for product_data in products:
+                scraped_count += 1
+                observed_at = self._scrape_time(product_data, default_time) if use_scrape_time else None
+                outcome = self._record_product(product_data, latest, history, scraping_session.id,
+                                               observed_at, rollups)
+                if outcome:
+                    processed_count += 1
+                    if outcome == 'unchanged':
+                        unchanged_count += 1
+                else:
+                    failed_count += 1
+            history.flush()
+            if rollups:
+                rollups.flush()
+        
+        # A followed snapshot may have been compressed under a new name by the time it is finished
+        snapshot = snapshot_name(source_file)
+        current_path = source_file if os.path.exists(source_file) else find_snapshot(
+            os.path.dirname(source_file), snapshot)
+        self.db.add(IngestedFile(
+            snapshot=snapshot,
+            path=current_path or source_file,
+            checksum=checksum or (snapshot_checksum(current_path) if current_path else ''),
+            products=scraped_count,
+            session_id=scraping_session.id
+        ))
+        
+        # Update the scraping session
+        scraping_session.session_end = datetime.utcnow()
+        scraping_session.products_scraped = scraped_count
+        scraping_session.products_processed = processed_count
+        scraping_session.status = "completed" if failed_count == 0 else "completed_with_errors"
+        if failed_count > 0:
+            scraping_session.error_message = f"Failed to process {failed_count} products"
+        
+        # Committed together with the products they describe
+        if self.precompute_stats:
+            refresh_statistics(self.db)
+        
+        self.db.commit()
+        
+        logger.info(f"Successfully processed {processed_count} products "
+                    f"({unchanged_count} unchanged), failed: {failed_count}")
+        
+        return {
+            "success": True,
+            "processed_count": processed_count,
+            "unchanged_count": unchanged_count,
+            "failed_count": failed_count,
+            "session_id": scraping_session.id
+        }
+    
+    def process_data(self, follow: bool = False) -> Dict[str, Any]:
+        """
+        Main data processing method.
+        
+        With follow=True the latest snapshot is processed even while the scraper
+        is still writing it, tailing new products until the scrape finishes.
+        A snapshot that is already in the ingested_files manifest is skipped.
+        """
         try:
-            # Create a scraping session
-            scraping_session = ScrapingSession()
-            self.db.add(scraping_session)
-            self.db.commit()
-            
-            logger.info(f"Started scraping session {scraping_session.id}")
-            
             # Get the latest data file
             raw_data_dir = 'data/raw'
             if not os.path.exists(raw_data_dir):
                 logger.warning(f"Raw data directory {raw_data_dir} does not exist")
                 return {"success": False, "message": "No raw data directory"}
             
-            files = [f for f in os.listdir(raw_data_dir) if f.startswith('products_') and f.endswith('.json')]
+            # Snapshots still being written by the scraper are skipped unless following
+            files = list_raw_files(raw_data_dir, include_incomplete=follow)
             if not files:
                 logger.warning("No raw data files found")
                 return {"success": False, "message": "No raw data files"}
             
-            latest_file = os.path.join(raw_data_dir, sorted(files)[-1])
-            logger.info(f"Processing data from {latest_file}")
-            
-            # Load and process data
-            with open(latest_file, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-            
-            processed_count = 0
-            failed_count = 0
+            latest_file = files[-1]
+            if self.db.query(IngestedFile.id).filter(IngestedFile.snapshot == snapshot_name(latest_file)).first():
+                logger.info(f"{latest_file} has already been ingested")
+                return {"success": True, "processed_count": 0, "message": "Already ingested"}
             
-            for product_data in raw_data:
-                if self._save_product_to_db(product_data):
-                    processed_count += 1
-                else:
-                    failed_count += 1
-            
-            # Update the scraping session
-            scraping_session.session_end = datetime.utcnow()
-            scraping_session.products_scraped = len(raw_data)
-            scraping_session.products_processed = processed_count
-            scraping_session.status = "completed" if failed_count == 0 else "completed_with_errors"
-            if failed_count > 0:
-                scraping_session.error_message = f"Failed to process {failed_count} products"
-            
-            self.db.commit()
-            
-            logger.info(f"Successfully processed {processed_count} products, failed: {failed_count}")
+            logger.info(f"Processing data from {latest_file}")
             
-            return {
-                "success": True,
-                "processed_count": processed_count,
-                "failed_count": failed_count,
-                "session_id": scraping_session.id
-            }
+            # Products are read one at a time (decompressing .gz/.zst snapshots on the fly),
+            # so memory does not grow with the snapshot
+            return self._ingest_snapshot(iter_products(latest_file, follow=follow), latest_file, follow)
             
         except Exception as e:
             logger.error(f"Error in data processing: {str(e)}")
             return {"success": False, "error": str(e)}
     
+    def process_backlog(self, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Ingests every complete raw snapshot that is not in the ingested_files manifest, oldest first.
+        
+        Snapshots are read and fingerprinted in a process pool while earlier ones
+        are written, each in its own transaction together with its manifest row,
+        so an interrupted backlog resumes where it stopped and re-running it
+        never ingests a snapshot twice. Snapshots whose content checksum matches
+        an ingested one (e.g. a copy under another name) are only recorded.
+        """
+        raw_data_dir = 'data/raw'
+        ingested = dict(self.db.query(IngestedFile.snapshot, IngestedFile.checksum).all())
+        checksums = set(ingested.values())
+        pending = [f for f in list_raw_files(raw_data_dir) if snapshot_name(f) not in ingested]
+        if not pending:
+            logger.info("No pending raw data files")
+            return {"success": True, "files": 0, "processed_count": 0}
+        
+        workers = workers or int(os.environ.get('INGEST_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+        logger.info(f"Ingesting {len(pending)} pending raw data files with {workers} parser processes")
+        
+        totals = {"success": True, "files": 0, "duplicates": 0, "processed_count": 0,
+                  "unchanged_count": 0, "failed_count": 0}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parse = partial(parse_snapshot, max_bytes=self.stream_threshold_bytes)
+            for parsed in ordered_map(executor, parse, pending, window=workers * 2):
+                if parsed['checksum'] in checksums:
+                    logger.info(f"{parsed['path']} has the same content as an ingested snapshot, skipping")
+                    self.db.add(IngestedFile(snapshot=parsed['snapshot'], path=parsed['path'],
+                                             checksum=parsed['checksum'], products=0))
+                    self.db.commit()
+                    totals['duplicates'] += 1
+                    continue
+                
+                logger.info(f"Processing data from {parsed['path']}")
+                # Large snapshots come back unparsed and are streamed straight into batched writes
+                products = iter(parsed['products']) if parsed['products'] is not None else iter_products(parsed['path'])
+                months = {month_start(self._scrape_time(product, parsed['started_at']) or datetime.utcnow())
+                          for product in parsed['products'] or () if isinstance(product, dict)}
+                try:
+                    result = self._ingest_snapshot(products, parsed['path'],
+                                                   checksum=parsed['checksum'],
+                                                   as_of=parsed['started_at'], use_scrape_time=True,
+                                                   months=months)
+                except Exception as e:
+                    # Later snapshots build on this one, so stop and retry from here next time
+                    logger.error(f"Error ingesting {parsed['path']}: {str(e)}")
+                    executor.shutdown(cancel_futures=True)
+                    return dict(totals, success=False, error=str(e), failed_file=parsed['path'])
+                
+                checksums.add(parsed['checksum'])
+                totals['files'] += 1
+                for key in ('processed_count', 'unchanged_count', 'failed_count'):
+                    totals[key] += result[key]
+        
+        logger.info(f"Backlog complete: {totals}")
+        return totals
+    
     def get_basic_statistics(self) -> Dict[str, Any]:
-        """Gets basic statistics from the processed data."""
+        """
+        Gets basic statistics from the processed data.
+        
+        Served from the product_stats row refreshed by the last ingest when
+        precomputed statistics are enabled, otherwise aggregated in the database.
+        """
         try:
-            # Total number of products (all historical records)
-            total_products = self.db.query(Product).count()
-            
-            # Number of unique products (by URL)
-            unique_products = self.db.query(Product.url).distinct().count()
-            
-            # Latest data (the last record for each product)
-            latest_products = self.db.query(Product).distinct(Product.url).order_by(
-                Product.url, Product.processing_timestamp.desc()
-            ).all()
-            
-            # Statistics on the latest data
-            latest_prices = [p.price for p in latest_products if p.price > 0]
-            avg_price = sum(latest_prices) / len(latest_prices) if latest_prices else 0
-            min_price = min(latest_prices) if latest_prices else 0
-            max_price = max(latest_prices) if latest_prices else 0
-            
-            # Products with variants (based on the latest data)
-            products_with_variants = len([p for p in latest_products if p.variant_count > 0])
-            
-            # Average number of variants (based on the latest data)
-            avg_variants = sum(p.variant_count for p in latest_products) / len(latest_products) if latest_products else 0
-            
-            # Products with images (based on the latest data)
-            products_with_images = len([p for p in latest_products if p.image_count > 0])
-            
-            # Average number of images (based on the latest data)
-            avg_images = sum(p.image_count for p in latest_products) / len(latest_products) if latest_products else 0
-            
-            # Statistics by category (based on the latest data)
-            category_stats = {}
-            for product in latest_products:
-                if product.category:
-                    category_stats[product.category] = category_stats.get(product.category, 0) + 1
+            basic_stats = load_statistics(self.db) if self.precompute_stats else None
+            if basic_stats is None:
+                basic_stats = compute_basic_statistics(self.db)
             
             # Time-based statistics
             time_stats = self._get_time_based_statistics()
             
-            stats = {
-                'total_records': total_products,
-                'unique_products': unique_products,
-                'average_price': round(avg_price, 2),
-                'min_price': min_price,
-                'max_price': max_price,
-                'products_with_variants': products_with_variants,
-                'average_variants_per_product': round(avg_variants, 2),
-                'products_with_images': products_with_images,
-                'average_images_per_product': round(avg_images, 2),
-                'category_distribution': category_stats,
-                'time_based_stats': time_stats,
-                'timestamp': datetime.utcnow().isoformat()
-            }
+            stats = dict(basic_stats)
+            stats['time_based_stats'] = time_stats
+            stats['timestamp'] = datetime.utcnow().isoformat()
             
             logger.info(f"Statistics calculated: {stats}")
             return stats
@@ -276,20 +560,19 @@ class AgiliteDataProcessor:
             return {}
     
     def _get_time_based_statistics(self) -> Dict[str, Any]:
-        """Gets time-based statistics for graphs."""
+        """
+        Gets time-based statistics for graphs.
+        
+        Counts come pre-aggregated per day, stock status and category: from the
+        hourly stock rollups when precomputed statistics are enabled, otherwise
+        grouped in the database.
+        """
         try:
             # Get data for the last 30 days
             from datetime import timedelta
             thirty_days_ago = datetime.utcnow() - timedelta(days=30)
             
-            # Daily statistics
-            daily_stats = self.db.query(
-                func.date(Product.processing_timestamp).label('date'),
-                Product.stock_status,
-                Product.category
-            ).filter(
-                Product.processing_timestamp >= thirty_days_ago
-            ).all()
+            daily_stats = daily_stock_counts(self.db, thirty_days_ago, precomputed=self.precompute_stats)
             
             # Group by day
             daily_data = {}
@@ -303,17 +586,17 @@ class AgiliteDataProcessor:
                         'categories': {}
                     }
                 
-                daily_data[date_str]['total'] += 1
+                daily_data[date_str]['total'] += record.records
                 
                 if record.stock_status == 'In Stock':
-                    daily_data[date_str]['in_stock'] += 1
+                    daily_data[date_str]['in_stock'] += record.records
                 elif record.stock_status == 'Out of Stock':
-                    daily_data[date_str]['out_of_stock'] += 1
+                    daily_data[date_str]['out_of_stock'] += record.records
                 
                 if record.category:
                     if record.category not in daily_data[date_str]['categories']:
                         daily_data[date_str]['categories'][record.category] = 0
-                    daily_data[date_str]['categories'][record.category] += 1
+                    daily_data[date_str]['categories'][record.category] += record.records
             
             return {
                 'daily_stats': daily_data,
@@ -330,9 +613,16 @@ class AgiliteDataProcessor:
             self.db.close()
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Process raw snapshots into the database")
+    parser.add_argument('--backlog', action='store_true', help="Ingest every pending snapshot, oldest first")
+    parser.add_argument('--workers', type=int, default=None, help="Parser processes for --backlog")
+    args = parser.parse_args()
+    
     # Example usage
     processor = AgiliteDataProcessor()
-    result = processor.process_data()
+    result = processor.process_backlog(args.workers) if args.backlog else processor.process_data()
     
     if result.get("success"):
         stats = processor.get_basic_statistics()
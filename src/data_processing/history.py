@@ -0,0 +1,265 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update, func, case, or_, text
+from sqlalchemy.orm import Session, aliased
+
+from models import Product, ProductDimension, ProductVersion, ProductLatest
+from data_processing.bulk_ingest import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+
+class ProductHistory:
+    """
+    Maintains the slowly-changing product dimension during an ingest.
+
+    Every URL has one `product_dim` row. A new `product_versions` row is opened
+    only when a product record with changed content is written, and the
+    previous version of that product is closed at the same moment. Products
+    seen unchanged only widen the dimension's first/last seen range. The
+    `product_latest` row of the URL is replaced by the newest record. Changes
+    are queued and written set-based by `flush()`, inside the caller's
+    transaction. Versions are ordered by valid_from, so older snapshots can be
+    ingested after newer ones.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._dims: Dict[str, int] = {}
+        self._changed: List[Tuple[str, int, datetime]] = []
+        self._seen: Dict[str, datetime] = {}
+
+    def load(self, as_of: Optional[datetime] = None) -> Dict[str, tuple]:
+        """
+        Returns {url: (product id, content hash, stock status, category)} of the
+        current version of every product, or of the version that was valid at `as_of`.
+        """
+        self._dims = dict(self.db.execute(select(ProductDimension.url, ProductDimension.id)).all())
+        if as_of is None:
+            rows = self.db.execute(select(
+                ProductLatest.url, ProductLatest.product_id, ProductLatest.content_hash,
+                ProductLatest.stock_status, ProductLatest.category
+            )).all()
+            return {url: (product_id, content_hash, stock_status, category)
+                    for url, product_id, content_hash, stock_status, category in rows}
+
+        query = (
+            select(ProductDimension.url, ProductDimension.id, Product.id, Product.content_hash,
+                   Product.stock_status, Product.category)
+            .join(ProductVersion, ProductVersion.product_dim_id == ProductDimension.id)
+            .join(Product, Product.id == ProductVersion.product_id)
+        )
+        query = query.where(
+            ProductVersion.valid_from <= as_of,
+            or_(ProductVersion.valid_to.is_(None), ProductVersion.valid_to > as_of)
+        )
+        rows = self.db.execute(query).all()
+        return {url: (product_id, content_hash, stock_status, category)
+                for url, _, product_id, content_hash, stock_status, category in rows}
+
+    def changed(self, url: str, product_id: int, at: datetime):
+        """Queues a new version of a product, stored in the product record `product_id`."""
+        self._changed.append((url, product_id, at))
+        self._seen[url] = max(at, self._seen.get(url, at))
+
+    def seen(self, url: str, at: Optional[datetime] = None):
+        """Queues a sighting of a product whose content did not change."""
+        at = at or datetime.utcnow()
+        self._seen[url] = max(at, self._seen.get(url, at))
+
+    def _ensure_dimensions(self, seen: Dict[str, datetime]):
+        """Creates dimension rows for URLs seen for the first time."""
+        new = {url: at for url, at in seen.items() if url not in self._dims}
+        if not new:
+            return
+        self.db.execute(insert(ProductDimension.__table__), [
+            {'url': url, 'first_seen_at': at, 'last_seen_at': at} for url, at in new.items()
+        ])
+        self._dims.update(self.db.execute(
+            select(ProductDimension.url, ProductDimension.id).where(ProductDimension.url.in_(list(new)))
+        ).all())
+
+    def flush(self, skip_product_ids: Iterable[int] = ()):
+        """Writes queued versions and sightings; product records in `skip_product_ids` were not stored."""
+        skip = set(skip_product_ids)
+        changed = [entry for entry in self._changed if entry[1] not in skip]
+        seen = self._seen
+        self._changed, self._seen = [], {}
+        if not seen:
+            return
+
+        self._ensure_dimensions(seen)
+
+        if changed:
+            self.db.execute(insert(ProductVersion.__table__), [
+                {'product_dim_id': self._dims[url], 'product_id': product_id, 'valid_from': at, 'valid_to': None}
+                for url, product_id, at in changed
+            ])
+            # Every version of a changed product ends where the next one (by valid_from) starts;
+            # recomputing them all also places versions from older snapshots correctly
+            following = aliased(ProductVersion)
+            dim_ids = list({self._dims[url] for url, _, _ in changed})
+            self.db.execute(
+                update(ProductVersion)
+                .where(ProductVersion.product_dim_id.in_(dim_ids))
+                .values(valid_to=select(func.min(following.valid_from)).where(
+                    following.product_dim_id == ProductVersion.product_dim_id,
+                    following.valid_from > ProductVersion.valid_from
+                ).scalar_subquery()),
+                execution_options={'synchronize_session': False}
+            )
+            self._upsert_latest(changed)
+
+        # One statement per distinct timestamp would be exact; the batch's range is close enough
+        first, last = min(seen.values()), max(seen.values())
+        self.db.execute(
+            update(ProductDimension)
+            .where(ProductDimension.id.in_([self._dims[url] for url in seen]))
+            .values(
+                first_seen_at=case((ProductDimension.first_seen_at > first, first), else_=ProductDimension.first_seen_at),
+                last_seen_at=case((ProductDimension.last_seen_at < last, last), else_=ProductDimension.last_seen_at)
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        self.db.execute(
+            update(ProductLatest)
+            .where(ProductLatest.url.in_(list(seen)))
+            .values(last_seen_at=case((ProductLatest.last_seen_at < last, last), else_=ProductLatest.last_seen_at)),
+            execution_options={'synchronize_session': False}
+        )
+
+    def _upsert_latest(self, changed: List[Tuple[str, int, datetime]]):
+        """Replaces the product_latest rows of changed products, unless they already hold a newer record."""
+        newest: Dict[str, Tuple[int, datetime]] = {}
+        for url, product_id, at in changed:
+            if url not in newest or at >= newest[url][1]:
+                newest[url] = (product_id, at)
+
+        ids = [product_id for product_id, _ in newest.values()]
+        for start in range(0, len(ids), LATEST_CHUNK):
+            statement = dialect_insert(self.db)(ProductLatest.__table__).from_select(
+                LATEST_COLUMNS, _latest_source().where(Product.id.in_(ids[start:start + LATEST_CHUNK]))
+            )
+            excluded = statement.excluded
+            self.db.execute(statement.on_conflict_do_update(
+                index_elements=['url'],
+                set_={column: getattr(excluded, column) for column in LATEST_COLUMNS if column != 'url'},
+                where=ProductLatest.__table__.c.processing_timestamp <= excluded.processing_timestamp
+            ))
+
+
+# Columns of product_latest, in the order _latest_source selects them
+LATEST_COLUMNS = ['url', 'product_id', 'title', 'price', 'stock_status', 'category', 'image_count',
+                  'variant_count', 'first_image_url', 'content_hash', 'processing_timestamp', 'last_seen_at']
+# Product ids per upsert statement
+LATEST_CHUNK = 1000
+
+
+def _latest_source():
+    """SELECT of product records shaped as product_latest rows."""
+    return select(
+        Product.url, Product.id, Product.title, Product.price, Product.stock_status, Product.category,
+        Product.image_count, Product.variant_count, Product.first_image_url, Product.content_hash,
+        Product.processing_timestamp, Product.processing_timestamp.label('last_seen_at')
+    )
+
+
+def rebuild_latest(db: Session) -> int:
+    """
+    Fills product_latest from the open product versions.
+
+    Used for databases whose history predates the table. Returns the number
+    of rows written.
+    """
+    db.execute(ProductLatest.__table__.delete())
+    source = (
+        _latest_source()
+        .join(ProductVersion, ProductVersion.product_id == Product.id)
+        .where(ProductVersion.valid_to.is_(None))
+    )
+    result = db.execute(insert(ProductLatest.__table__).from_select(LATEST_COLUMNS, source))
+    db.execute(
+        update(ProductLatest)
+        .values(last_seen_at=select(ProductDimension.last_seen_at)
+                .where(ProductDimension.url == ProductLatest.url).scalar_subquery())
+        .where(select(ProductDimension.id).where(ProductDimension.url == ProductLatest.url).exists()),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount
+
+
+# Signature of a legacy record's content, used when it has no content_hash
+_LEGACY_SIGNATURE = (
+    "COALESCE(content_hash, md5(concat_ws('|', title, price, stock_status, category, "
+    "image_count, variant_count, first_image_url, description)))"
+)
+
+
+def backfill_history(db: Session) -> int:
+    """
+    Builds product_dim and product_versions from existing products records.
+
+    Consecutive records of a URL with the same content collapse into one
+    version. Only URLs without a dimension row are migrated, so running it
+    again is a no-op. Returns the number of versions created. PostgreSQL only.
+    """
+    db.execute(text("""
+        INSERT INTO agilite.product_dim (url, first_seen_at, last_seen_at)
+        SELECT url, MIN(processing_timestamp), MAX(processing_timestamp)
+        FROM agilite.products p
+        WHERE NOT EXISTS (SELECT 1 FROM agilite.product_dim d WHERE d.url = p.url)
+        GROUP BY url
+    """))
+    result = db.execute(text(f"""
+        WITH ordered AS (
+            SELECT p.id, p.url, p.processing_timestamp,
+                   {_LEGACY_SIGNATURE} AS signature,
+                   LAG({_LEGACY_SIGNATURE}) OVER (PARTITION BY p.url ORDER BY p.processing_timestamp, p.id) AS previous
+            FROM agilite.products p
+            JOIN agilite.product_dim d ON d.url = p.url
+            WHERE NOT EXISTS (SELECT 1 FROM agilite.product_versions v WHERE v.product_dim_id = d.id)
+        ), starts AS (
+            SELECT id, url, processing_timestamp FROM ordered
+            WHERE previous IS NULL OR previous <> signature
+        )
+        INSERT INTO agilite.product_versions (product_dim_id, product_id, valid_from, valid_to)
+        SELECT d.id, s.id, s.processing_timestamp,
+               LEAD(s.processing_timestamp) OVER (PARTITION BY s.url ORDER BY s.processing_timestamp, s.id)
+        FROM starts s JOIN agilite.product_dim d ON d.url = s.url
+    """))
+    return result.rowcount
+
+
+def prune_redundant_records(db: Session) -> int:
+    """
+    Deletes products records that repeat the version they belong to.
+
+    Each deleted record becomes a product_observations row pointing at the
+    record that opened its version, and observations of deleted records are
+    moved there too. Returns the number of records deleted. PostgreSQL only.
+    """
+    db.execute(text("""
+        CREATE TEMPORARY TABLE redundant_records ON COMMIT DROP AS
+        SELECT p.id, v.product_id AS version_record, p.processing_timestamp
+        FROM agilite.products p
+        JOIN agilite.product_dim d ON d.url = p.url
+        JOIN agilite.product_versions v ON v.product_dim_id = d.id
+             AND p.processing_timestamp >= v.valid_from
+             AND (v.valid_to IS NULL OR p.processing_timestamp < v.valid_to)
+        WHERE p.id <> v.product_id
+          AND NOT EXISTS (SELECT 1 FROM agilite.product_versions o WHERE o.product_id = p.id)
+    """))
+    db.execute(text("""
+        UPDATE agilite.product_observations o SET product_id = r.version_record
+        FROM redundant_records r WHERE o.product_id = r.id
+    """))
+    db.execute(text("""
+        INSERT INTO agilite.product_observations (product_id, observed_at)
+        SELECT version_record, processing_timestamp FROM redundant_records
+    """))
+    db.execute(text("DELETE FROM agilite.product_images WHERE product_id IN (SELECT id FROM redundant_records)"))
+    db.execute(text("DELETE FROM agilite.product_variants WHERE product_id IN (SELECT id FROM redundant_records)"))
+    result = db.execute(text("DELETE FROM agilite.products WHERE id IN (SELECT id FROM redundant_records)"))
+    return result.rowcount
@@ -0,0 +1,189 @@
+import re
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Common categories in Hebrew, in priority order: when a title contains several
+# keywords, the one listed first wins
+DEFAULT_CATEGORY_TAXONOMY = [
+    ('קרמון', 'Plate Carriers'),
+    ('חגורת', 'Belts'),
+    ('פאוץ', 'Pouches'),
+    ('כפפות', 'Gloves'),
+    ('כובע', 'Hats'),
+    ('משקפי', 'Glasses'),
+    ('פאנל', 'Panels'),
+    ('פאץ', 'Patches'),
+    ('שרוול', 'Sleeves'),
+    ('ער"ד', 'Medical'),
+    ('פלטה', 'Plates'),
+    ('מערכת', 'Systems'),
+]
+DEFAULT_CATEGORY = 'Other'
+
+# Checked in order against the lowercased status; schema.org URLs contain the bare token
+STOCK_STATUS_RULES = [
+    (r'instock|in stock', 'In Stock'),
+    (r'outofstock|out of stock', 'Out of Stock'),
+    (r'pre-order', 'Pre-order'),
+]
+UNKNOWN_STOCK_STATUS = 'Unknown'
+
+PRICE_JUNK = re.compile(r'[^\d.,]')
+
+# Product columns produced by ProductNormalizer.normalize, in the order the writer uses them
+NORMALIZED_COLUMNS = ['url', 'title', 'price', 'description', 'image_count', 'first_image_url',
+                      'stock_status', 'variant_count', 'category']
+
+
+class CategoryMatcher:
+    """
+    Assigns categories from keyword → category rules with one precompiled regex.
+
+    All keywords are compiled into a single alternation inside a lookahead, so
+    one scan of a title finds every keyword occurrence, overlapping ones
+    included. The rule listed first among those found wins, as with a linear
+    scan over the rules.
+    """
+
+    def __init__(self, taxonomy: Sequence[Tuple[str, str]], default: str = DEFAULT_CATEGORY):
+        self.default = default
+        self.priority: Dict[str, int] = {}
+        self.categories: Dict[str, str] = {}
+        for keyword, category in taxonomy:
+            if keyword and keyword not in self.priority:
+                self.priority[keyword] = len(self.priority)
+                self.categories[keyword] = category
+        # Alternatives in priority order, so the preferred keyword wins among those starting at one position
+        alternation = '|'.join(re.escape(keyword) for keyword in self.priority)
+        self.pattern = re.compile(f"(?=({alternation}))") if alternation else None
+
+    def match(self, title: Optional[str]) -> str:
+        """Category of one title."""
+        if not title or self.pattern is None:
+            return self.default
+        found = [m.group(1) for m in self.pattern.finditer(title)]
+        if not found:
+            return self.default
+        return self.categories[min(found, key=self.priority.__getitem__)]
+
+    def match_series(self, titles: pd.Series) -> pd.Series:
+        """Categories of a Series of titles; each distinct title is matched once."""
+        result = pd.Series(self.default, index=titles.index, dtype=object)
+        valid = titles[titles.notna() & (titles.astype(str) != '')].astype(str)
+        if valid.empty or self.pattern is None:
+            return result
+
+        unique = pd.Series(valid.unique())
+        matches = unique.str.extractall(self.pattern)[0]
+        if matches.empty:
+            return result
+        best = matches.map(self.priority).groupby(level=0).min()
+        keywords = {priority: keyword for keyword, priority in self.priority.items()}
+        by_title = pd.Series(
+            [self.categories[keywords[p]] for p in best.values],
+            index=unique.iloc[best.index].values
+        )
+        result.loc[valid.index] = valid.map(by_title).fillna(self.default).values
+        return result
+
+
+def clean_price(price: Any) -> float:
+    """Cleans and converts a price string (or number) to a float; unparseable prices are 0.0."""
+    if price is None or price == '':
+        return 0.0
+    cleaned = PRICE_JUNK.sub('', str(price)).replace(',', '.')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return 0.0
+
+
+def parse_stock_status(status: Optional[str]) -> str:
+    """Maps scraped stock texts and schema.org availability URLs to a consistent status."""
+    if not status:
+        return UNKNOWN_STOCK_STATUS
+    status_lower = status.lower()
+    for pattern, normalized in STOCK_STATUS_RULES:
+        if re.search(pattern, status_lower):
+            return normalized
+    return status
+
+
+class ProductNormalizer:
+    """Normalizes price, stock status and category for single products or whole batches."""
+
+    def __init__(self, taxonomy: Optional[Sequence[Tuple[str, str]]] = None):
+        self.matcher = CategoryMatcher(taxonomy or DEFAULT_CATEGORY_TAXONOMY)
+
+    @classmethod
+    def from_session(cls, db) -> 'ProductNormalizer':
+        """Builds a normalizer from the category_taxonomy table, falling back to the defaults."""
+        from models import CategoryKeyword
+        rows = db.query(CategoryKeyword.keyword, CategoryKeyword.category).order_by(
+            CategoryKeyword.priority, CategoryKeyword.id
+        ).all()
+        if not rows:
+            logger.warning("Category taxonomy table is empty, using the built-in keywords")
+        return cls([(row.keyword, row.category) for row in rows] or None)
+
+    def category(self, title: Optional[str]) -> str:
+        return self.matcher.match(title)
+
+    def normalize(self, products: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Turns a batch of scraped products into the product columns the DB writer stores.
+
+        Prices, stock statuses and categories are computed with vectorized string
+        operations over the whole batch. Rows keep the order of `products`.
+        """
+        raw = pd.DataFrame.from_records(
+            [{'url': product.get('url'),
+              'title': product.get('title', ''),
+              'price': product.get('price'),
+              'description': product.get('description', ''),
+              'images': product.get('images'),
+              'variants': product.get('variants'),
+              'stock_status': product.get('stock_status')}
+             for product in products],
+            columns=['url', 'title', 'price', 'description', 'images', 'variants', 'stock_status']
+        )
+        frame = pd.DataFrame(index=raw.index)
+        frame['url'] = raw['url']
+        frame['title'] = raw['title']
+
+        # Remove all characters except digits, dot and comma, then read commas as decimal points
+        prices = raw['price'].where(raw['price'].notna(), '').astype(str)
+        prices = prices.str.replace(PRICE_JUNK.pattern, '', regex=True).str.replace(',', '.', regex=False)
+        frame['price'] = pd.to_numeric(prices, errors='coerce').fillna(0.0).astype(float)
+
+        frame['description'] = raw['description']
+        images = raw['images'].map(lambda value: value if isinstance(value, list) else [])
+        frame['image_count'] = images.str.len().astype(int)
+        frame['first_image_url'] = images.str[0]
+
+        statuses = raw['stock_status'].where(raw['stock_status'].notna(), '').astype(str)
+        lowered = statuses.str.lower()
+        conditions = [lowered.str.contains(pattern, regex=True) for pattern, _ in STOCK_STATUS_RULES]
+        choices = [normalized for _, normalized in STOCK_STATUS_RULES]
+        frame['stock_status'] = np.select(conditions, choices, default=statuses.to_numpy(dtype=object))
+        frame.loc[statuses == '', 'stock_status'] = UNKNOWN_STOCK_STATUS
+
+        frame['variant_count'] = raw['variants'].map(lambda value: len(value) if isinstance(value, list) else 0)
+        frame['category'] = self.matcher.match_series(raw['title'])
+
+        # Plain Python values (None instead of NaN) for the writer
+        return frame[NORMALIZED_COLUMNS].astype(object).where(frame[NORMALIZED_COLUMNS].notna(), None)
+
+
+def normalized_records(frame: pd.DataFrame) -> Iterable[Dict[str, Any]]:
+    """Rows of a normalized frame as dicts with native Python numbers."""
+    for record in frame.to_dict('records'):
+        record['price'] = float(record['price'])
+        record['image_count'] = int(record['image_count'])
+        record['variant_count'] = int(record['variant_count'])
+        yield record
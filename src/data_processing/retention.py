@@ -0,0 +1,263 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import (Base, PARTITIONED_TABLES, RetentionRun, add_months, month_start, partition_bounds,
+                    partitioned_tables, create_partitions)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_SCHEMA = 'agilite_archive'
+
+
+def downsample_history(db: Session, before: datetime, after: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Keeps one product record and one observation per product and day for data before `before`.
+
+    The last record of each URL and day is kept. Observations and product
+    versions of the removed records move to it, a product's consecutive
+    versions that end up on the same record are merged, and the removed
+    records' images and variants are deleted. Records from `after` on only
+    are considered (default: all). Hourly stock_rollups keep the counts at
+    full resolution. Returns the number of records and observations removed.
+    PostgreSQL only; the caller commits.
+    """
+    window = {'before': before, 'after': after or datetime.min}
+    db.execute(text("""
+        CREATE TEMPORARY TABLE downsampled ON COMMIT DROP AS
+        SELECT id, processing_timestamp, keep_id FROM (
+            SELECT id, processing_timestamp,
+                   FIRST_VALUE(id) OVER (
+                       PARTITION BY url, date_trunc('day', processing_timestamp)
+                       ORDER BY processing_timestamp DESC, id DESC
+                   ) AS keep_id
+            FROM agilite.products
+            WHERE processing_timestamp >= :after AND processing_timestamp < :before
+        ) ranked
+        WHERE id <> keep_id
+    """), window)
+
+    # The day is represented by its last state: everything pointing at a removed record moves to it
+    db.execute(text("""
+        UPDATE agilite.product_observations o SET product_id = d.keep_id
+        FROM downsampled d WHERE o.product_id = d.id
+    """))
+    db.execute(text("""
+        UPDATE agilite.product_versions v SET product_id = d.keep_id
+        FROM downsampled d WHERE v.product_id = d.id
+    """))
+    db.execute(text("""
+        DELETE FROM agilite.product_versions v USING (
+            SELECT id, LAG(product_id) OVER (PARTITION BY product_dim_id ORDER BY valid_from, id) AS previous, product_id
+            FROM agilite.product_versions
+            WHERE product_dim_id IN (
+                SELECT v2.product_dim_id FROM agilite.product_versions v2
+                JOIN downsampled d ON d.keep_id = v2.product_id
+            )
+        ) ordered
+        WHERE v.id = ordered.id AND ordered.previous = ordered.product_id
+    """))
+    db.execute(text("""
+        UPDATE agilite.product_versions v SET valid_to = (
+            SELECT MIN(f.valid_from) FROM agilite.product_versions f
+            WHERE f.product_dim_id = v.product_dim_id AND f.valid_from > v.valid_from
+        )
+        WHERE v.product_dim_id IN (
+            SELECT v2.product_dim_id FROM agilite.product_versions v2
+            JOIN downsampled d ON d.keep_id = v2.product_id
+        )
+    """))
+
+    # The timestamp bounds let the deletes prune to the affected partitions
+    for table in ('product_images', 'product_variants'):
+        db.execute(text(f"""
+            DELETE FROM agilite.{table} c USING downsampled d
+            WHERE c.product_id = d.id AND c.processing_timestamp = d.processing_timestamp
+              AND c.processing_timestamp >= :after AND c.processing_timestamp < :before
+        """), window)
+    records = db.execute(text("""
+        DELETE FROM agilite.products p USING downsampled d
+        WHERE p.id = d.id AND p.processing_timestamp = d.processing_timestamp
+          AND p.processing_timestamp >= :after AND p.processing_timestamp < :before
+    """), window).rowcount
+
+    observations = db.execute(text("""
+        DELETE FROM agilite.product_observations o USING (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY product_id, date_trunc('day', observed_at) ORDER BY observed_at DESC, id DESC
+            ) AS rank
+            FROM agilite.product_observations
+            WHERE observed_at >= :after AND observed_at < :before
+        ) ranked
+        WHERE o.id = ranked.id AND ranked.rank > 1
+    """), window).rowcount
+
+    db.execute(text("DROP TABLE downsampled"))
+    return {'records': records, 'observations': observations}
+
+
+def expire_partitions(db: Session, before: datetime, archive_schema: Optional[str] = DEFAULT_ARCHIVE_SCHEMA) -> List[str]:
+    """
+    Detaches the monthly partitions that end on or before `before`.
+
+    Detached partitions move to `archive_schema` (kept as plain tables) or stay
+    in the agilite schema as standalone tables when it is None. A month is kept
+    while product_latest still points at one of its records, i.e. while it holds
+    the current state of a product. Observations and versions of the detached
+    records are deleted. Returns the names of the detached partitions.
+    PostgreSQL only; the caller commits.
+    """
+    connection = db.connection()
+    partitioned = set(partitioned_tables(connection))
+    if 'products' not in partitioned:
+        return []
+
+    detached = []
+    for name, lower, upper in partition_bounds(connection, 'products'):
+        if lower is None or upper is None or upper > before:
+            continue
+        month = {'lower': lower, 'upper': upper}
+        if db.execute(text("""
+            SELECT 1 FROM agilite.product_latest
+            WHERE processing_timestamp >= :lower AND processing_timestamp < :upper LIMIT 1
+        """), month).first():
+            logger.info(f"Keeping {name}: it holds the current state of some products")
+            continue
+
+        db.execute(text(f"""
+            DELETE FROM agilite.product_observations
+            WHERE product_id IN (SELECT id FROM agilite.{name})
+        """))
+        db.execute(text(f"""
+            DELETE FROM agilite.product_versions
+            WHERE product_id IN (SELECT id FROM agilite.{name})
+        """))
+        # Children reference the products partition, so they are detached first
+        for table in reversed(PARTITIONED_TABLES):
+            for partition, part_lower, part_upper in partition_bounds(connection, table):
+                if (part_lower, part_upper) != (lower, upper):
+                    continue
+                db.execute(text(f"ALTER TABLE agilite.{table} DETACH PARTITION agilite.{partition}"))
+                if archive_schema:
+                    db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+                    db.execute(text(f"ALTER TABLE agilite.{partition} SET SCHEMA {archive_schema}"))
+                detached.append(partition)
+    if detached:
+        logger.info(f"Detached partitions {', '.join(detached)}")
+    return detached
+
+
+def run_retention(db: Session, downsample_days: Optional[int] = 90, expire_months: Optional[int] = None,
+                  archive_schema: Optional[str] = DEFAULT_ARCHIVE_SCHEMA, full: bool = False) -> RetentionRun:
+    """
+    Runs one retention pass and records it in retention_runs.
+
+    Data older than `downsample_days` is downsampled to one record per product
+    and day, continuing from the previous run's cutoff unless `full` is set.
+    Partitions that ended more than `expire_months` months ago are detached
+    (never when None). Upcoming partitions are created too. Commits.
+    """
+    now = datetime.utcnow()
+    run = RetentionRun(started_at=now)
+
+    if downsample_days is not None:
+        before = now - timedelta(days=downsample_days)
+        previous = None if full else db.query(RetentionRun.downsampled_before).filter(
+            RetentionRun.downsampled_before.isnot(None)
+        ).order_by(RetentionRun.downsampled_before.desc()).limit(1).scalar()
+        # Days are kept whole, so the window restarts at the day of the previous cutoff
+        after = previous.replace(hour=0, minute=0, second=0, microsecond=0) if previous else None
+        removed = downsample_history(db, before.replace(hour=0, minute=0, second=0, microsecond=0), after)
+        run.downsampled_before = before.replace(hour=0, minute=0, second=0, microsecond=0)
+        run.records_removed = removed['records']
+        run.observations_removed = removed['observations']
+        logger.info(f"Downsampled history before {run.downsampled_before}: {removed}")
+
+    if expire_months is not None:
+        detached = expire_partitions(db, add_months(month_start(now), -expire_months), archive_schema)
+        run.partitions_detached = ','.join(detached) or None
+
+    create_partitions(db.connection(), now)
+    db.add(run)
+    db.commit()
+    return run
+
+
+def partition_existing_tables(db: Session) -> List[str]:
+    """
+    Converts unpartitioned history tables from before partitioning into partitioned ones.
+
+    Each existing table is renamed to <table>_legacy and attached as the
+    partition of all data up to the end of the current month, so no rows are
+    copied; new months get their own partitions. Its primary key on id becomes
+    (id, processing_timestamp) like the parent's, and foreign keys to
+    products.id are replaced by the composite keys of the new schema. Tables that are
+    already partitioned are left alone. Returns the converted tables.
+    PostgreSQL only; the caller commits.
+    """
+    connection = db.connection()
+    partitioned = set(partitioned_tables(connection))
+    pending = [table for table in PARTITIONED_TABLES if table not in partitioned]
+    if not pending:
+        return []
+
+    # Ids alone are not unique across partitions: drop the foreign keys that reference them
+    for table, constraint in db.execute(text("""
+        SELECT cl.relname, co.conname FROM pg_constraint co
+        JOIN pg_class cl ON cl.oid = co.conrelid
+        WHERE co.contype = 'f' AND co.confrelid = 'agilite.products'::regclass
+    """)).all():
+        db.execute(text(f'ALTER TABLE agilite.{table} DROP CONSTRAINT "{constraint}"'))
+
+    # Children get their product's timestamp, the partition key they share with it
+    for table in ('product_images', 'product_variants'):
+        if table not in pending:
+            continue
+        db.execute(text(f"ALTER TABLE agilite.{table} ADD COLUMN IF NOT EXISTS processing_timestamp TIMESTAMP"))
+        db.execute(text(f"""
+            UPDATE agilite.{table} c SET processing_timestamp = p.processing_timestamp
+            FROM agilite.products p WHERE p.id = c.product_id AND c.processing_timestamp IS NULL
+        """))
+        db.execute(text(f"DELETE FROM agilite.{table} WHERE processing_timestamp IS NULL"))
+    if 'products' in pending:
+        db.execute(text("""
+            UPDATE agilite.products SET processing_timestamp = COALESCE(created_at, now())
+            WHERE processing_timestamp IS NULL
+        """))
+
+    upper = add_months(month_start(datetime.utcnow()), 1)
+    for table in pending:
+        legacy = f"{table}_legacy"
+        db.execute(text(f"ALTER TABLE agilite.{table} RENAME TO {legacy}"))
+        # Index and sequence names must be free for the new table
+        for (index,) in db.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = 'agilite' AND tablename = :table"
+        ), {'table': legacy}).all():
+            db.execute(text(f'ALTER INDEX agilite."{index}" RENAME TO "{index}_legacy"'))
+        db.execute(text(f"ALTER SEQUENCE IF EXISTS agilite.{table}_id_seq RENAME TO {legacy}_id_seq"))
+        db.execute(text(f"ALTER TABLE agilite.{legacy} ALTER COLUMN processing_timestamp SET NOT NULL"))
+        # A partition's primary key must match the parent's (id, processing_timestamp)
+        for (constraint,) in db.execute(text("""
+            SELECT conname FROM pg_constraint
+            WHERE contype = 'p' AND conrelid = CAST(:table AS regclass)
+        """), {'table': f"agilite.{legacy}"}).all():
+            db.execute(text(f'ALTER TABLE agilite.{legacy} DROP CONSTRAINT "{constraint}"'))
+        db.execute(text(f"ALTER TABLE agilite.{legacy} ADD CONSTRAINT {legacy}_pkey "
+                        f"PRIMARY KEY (id, processing_timestamp)"))
+
+        Base.metadata.tables[f"agilite.{table}"].create(bind=connection)
+        db.execute(text(f"""
+            SELECT setval(pg_get_serial_sequence('agilite.{table}', 'id'),
+                          GREATEST((SELECT MAX(id) FROM agilite.{legacy}), 1))
+        """))
+        db.execute(text(
+            f"ALTER TABLE agilite.{table} ATTACH PARTITION agilite.{legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{upper:%Y-%m-%d}')"
+        ))
+        logger.info(f"Partitioned {table}; existing rows are in {legacy}")
+
+    create_partitions(connection, upper)
+    return pending
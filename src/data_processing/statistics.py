@@ -0,0 +1,221 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, func, case, union_all, text
+from sqlalchemy.orm import Session
+
+from models import (Product, ProductVersion, ProductObservation, ProductStatistics,
+                    ProductLatest, StockRollup)
+from data_processing.bulk_ingest import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Keys of the basic statistics, in the order they are reported
+BASIC_STATISTICS = ['total_records', 'unique_products', 'average_price', 'min_price', 'max_price',
+                    'products_with_variants', 'average_variants_per_product', 'products_with_images',
+                    'average_images_per_product', 'category_distribution']
+
+
+def latest_products(db: Session):
+    """
+    Subquery of the latest state of every product.
+
+    That is the product_latest table once it is populated, the record of each
+    product's open version on databases that only have the history, and
+    otherwise the newest record per URL.
+    """
+    if db.query(ProductLatest.url).first() is not None:
+        return select(ProductLatest.url, ProductLatest.price, ProductLatest.variant_count,
+                      ProductLatest.image_count, ProductLatest.category).subquery()
+    if db.query(ProductVersion.id).first() is not None:
+        return (
+            select(Product.url, Product.price, Product.variant_count, Product.image_count, Product.category)
+            .join(ProductVersion, ProductVersion.product_id == Product.id)
+            .where(ProductVersion.valid_to.is_(None))
+            .subquery()
+        )
+    ranked = select(
+        Product.url, Product.price, Product.variant_count, Product.image_count, Product.category,
+        func.row_number().over(
+            partition_by=Product.url,
+            order_by=(Product.processing_timestamp.desc(), Product.id.desc())
+        ).label('rank')
+    ).subquery()
+    return (
+        select(ranked.c.url, ranked.c.price, ranked.c.variant_count, ranked.c.image_count, ranked.c.category)
+        .where(ranked.c.rank == 1)
+        .subquery()
+    )
+
+
+def compute_basic_statistics(db: Session) -> Dict[str, Any]:
+    """
+    Computes the basic statistics in the database.
+
+    One aggregate query returns the totals, price range and variant/image
+    figures, and one grouped query the category distribution; only the final
+    numbers are transferred.
+    """
+    latest = latest_products(db)
+    positive_price = case((latest.c.price > 0, latest.c.price))
+
+    row = db.execute(select(
+        select(func.count(Product.id)).scalar_subquery().label('total_records'),
+        # One latest row per URL
+        func.count().label('unique_products'),
+        func.avg(positive_price).label('average_price'),
+        func.min(positive_price).label('min_price'),
+        func.max(positive_price).label('max_price'),
+        func.count(case((latest.c.variant_count > 0, 1))).label('products_with_variants'),
+        func.avg(latest.c.variant_count).label('average_variants'),
+        func.count(case((latest.c.image_count > 0, 1))).label('products_with_images'),
+        func.avg(latest.c.image_count).label('average_images')
+    ).select_from(latest)).one()
+
+    categories = db.execute(
+        select(latest.c.category, func.count())
+        .where(latest.c.category.isnot(None), latest.c.category != '')
+        .group_by(latest.c.category)
+    ).all()
+
+    return {
+        'total_records': row.total_records or 0,
+        'unique_products': row.unique_products or 0,
+        'average_price': round(float(row.average_price or 0), 2),
+        'min_price': float(row.min_price or 0),
+        'max_price': float(row.max_price or 0),
+        'products_with_variants': row.products_with_variants or 0,
+        'average_variants_per_product': round(float(row.average_variants or 0), 2),
+        'products_with_images': row.products_with_images or 0,
+        'average_images_per_product': round(float(row.average_images or 0), 2),
+        'category_distribution': {category: count for category, count in categories}
+    }
+
+
+def refresh_statistics(db: Session) -> ProductStatistics:
+    """Computes the basic statistics and stores them as a new product_stats row; the caller commits."""
+    stats = compute_basic_statistics(db)
+    row = ProductStatistics(
+        computed_at=datetime.utcnow(),
+        **dict(stats, category_distribution=json.dumps(stats['category_distribution'], ensure_ascii=False))
+    )
+    db.add(row)
+    return row
+
+
+def load_statistics(db: Session) -> Optional[Dict[str, Any]]:
+    """The most recently precomputed basic statistics, or None if there are none."""
+    row = db.query(ProductStatistics).order_by(ProductStatistics.computed_at.desc(),
+                                               ProductStatistics.id.desc()).first()
+    if row is None:
+        return None
+    stats = {key: getattr(row, key) for key in BASIC_STATISTICS}
+    stats['category_distribution'] = json.loads(row.category_distribution or '{}')
+    return stats
+
+
+def _hour(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+class StockRollups:
+    """
+    Maintains the hourly stock_rollups counts during an ingest.
+
+    Every stored product record and every observation adds one to the bucket of
+    its hour, stock status and category. Counts are accumulated in memory and
+    added to the table by `flush()`, inside the caller's transaction, so the
+    rollups always match the records committed with them.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._records: Dict[int, Tuple[datetime, Optional[str], Optional[str]]] = {}
+        self._observations: Dict[Tuple[datetime, str, str], int] = {}
+
+    def recorded(self, product_id: int, at: datetime, stock_status: Optional[str], category: Optional[str]):
+        """Queues a new product record."""
+        self._records[product_id] = (at, stock_status, category)
+
+    def observed(self, at: datetime, stock_status: Optional[str], category: Optional[str]):
+        """Queues an observation of a record with the given stock status and category."""
+        key = (_hour(at), stock_status or '', category or '')
+        self._observations[key] = self._observations.get(key, 0) + 1
+
+    def flush(self, skip_product_ids: Iterable[int] = ()):
+        """Adds the queued counts to stock_rollups; product records in `skip_product_ids` were not stored."""
+        skip = set(skip_product_ids)
+        counts = self._observations
+        for product_id, (at, stock_status, category) in self._records.items():
+            if product_id not in skip:
+                key = (_hour(at), stock_status or '', category or '')
+                counts[key] = counts.get(key, 0) + 1
+        self._records, self._observations = {}, {}
+        if not counts:
+            return
+
+        statement = dialect_insert(self.db)(StockRollup.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['hour', 'stock_status', 'category'],
+            set_={'records': StockRollup.__table__.c.records + statement.excluded.records}
+        )
+        self.db.execute(statement, [
+            {'hour': hour, 'stock_status': stock_status, 'category': category, 'records': records}
+            for (hour, stock_status, category), records in counts.items()
+        ])
+
+
+def rebuild_rollups(db: Session) -> int:
+    """
+    Recomputes stock_rollups from all product records and observations.
+
+    Used for databases that have records from before the rollups existed.
+    Returns the number of buckets written. PostgreSQL only.
+    """
+    db.execute(text("DELETE FROM agilite.stock_rollups"))
+    result = db.execute(text("""
+        INSERT INTO agilite.stock_rollups (hour, stock_status, category, records)
+        SELECT date_trunc('hour', at), COALESCE(stock_status, ''), COALESCE(category, ''), COUNT(*)
+        FROM (
+            SELECT processing_timestamp AS at, stock_status, category FROM agilite.products
+            UNION ALL
+            SELECT o.observed_at, p.stock_status, p.category
+            FROM agilite.product_observations o JOIN agilite.products p ON p.id = o.product_id
+        ) events
+        GROUP BY 1, 2, 3
+    """))
+    return result.rowcount
+
+
+def daily_stock_counts(db: Session, since: datetime, precomputed: bool = True) -> List[Any]:
+    """
+    Rows of (date, stock_status, category, records) for records and observations since `since`.
+
+    With `precomputed` the hourly rollups are summed per day, so the cost
+    depends on the number of days and categories; otherwise the records and
+    observations themselves are grouped in the database.
+    """
+    if precomputed:
+        day = func.date(StockRollup.hour)
+        return db.execute(
+            select(day.label('date'), StockRollup.stock_status, StockRollup.category,
+                   func.sum(StockRollup.records).label('records'))
+            .where(StockRollup.hour >= _hour(since))
+            .group_by(day, StockRollup.stock_status, StockRollup.category)
+        ).all()
+
+    events = union_all(
+        select(Product.processing_timestamp.label('at'), Product.stock_status, Product.category)
+        .where(Product.processing_timestamp >= since),
+        # Unchanged products are only recorded as observations of their latest record
+        select(ProductObservation.observed_at.label('at'), Product.stock_status, Product.category)
+        .join(Product, ProductObservation.product_id == Product.id)
+        .where(ProductObservation.observed_at >= since)
+    ).subquery()
+    day = func.date(events.c.at)
+    return db.execute(
+        select(day.label('date'), events.c.stock_status, events.c.category, func.count().label('records'))
+        .group_by(day, events.c.stock_status, events.c.category)
+    ).all()
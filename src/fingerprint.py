@@ -0,0 +1,17 @@
+import json
+import hashlib
+
+# Scraped fields that describe the product itself; timestamps and per-run metrics are left out
+FINGERPRINT_FIELDS = ('title', 'price', 'stock_status', 'variants', 'variant_stock', 'images', 'description')
+
+
+def product_fingerprint(product):
+    """
+    Stable SHA-256 of a scraped product's content.
+
+    Two scrapes of an unchanged product give the same fingerprint regardless of
+    when they ran or how long they took.
+    """
+    content = {field: product.get(field) for field in FINGERPRINT_FIELDS}
+    canonical = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
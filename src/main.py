@@ -21,12 +21,9 @@ def run_scraper():
         
         scraper = AgiliteScraper()
         try:
-            products_data = scraper.scrape_all_products()
-            logger.info(f"Successfully scraped {len(products_data)} products")
-            
-            # Save the collected data to file
-            scraper.save_products_data(products_data)
-            logger.info("Data saved to file successfully")
+            # Products are streamed to the snapshot file as they are scraped
+            snapshot_path, product_count = scraper.scrape_to_snapshot()
+            logger.info(f"Successfully scraped {product_count} products into {snapshot_path}")
             
             return True
         except Exception as e:
@@ -48,7 +45,8 @@ def run_processor():
         
         processor = AgiliteDataProcessor()
         try:
-            result = processor.process_data()
+            # Ingests every snapshot not yet in the manifest, so snapshots left by a failed run are caught up
+            result = processor.process_backlog()
             if result.get("success"):
                 stats = processor.get_basic_statistics()
                 logger.info(f"Successfully processed {result.get('processed_count', 0)} products")
@@ -66,6 +64,24 @@ def run_processor():
         logger.error(f"Traceback: {traceback.format_exc()}")
         return False
 
+def run_retention():
+    """Run the history retention job (downsampling and expired partitions)"""
+    try:
+        logger.info("Starting history retention...")
+        from run_retention import apply_retention, retention_settings
+        
+        downsample_days, expire_months, archive_schema = retention_settings()
+        if apply_retention(downsample_days=downsample_days, expire_months=expire_months,
+                           archive_schema=archive_schema):
+            logger.info("History retention completed")
+            return True
+        logger.error("History retention failed")
+        return False
+    except Exception as e:
+        logger.error(f"Error during history retention: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return False
+
 def run_full_cycle():
     """Run both scraper and processor in sequence"""
     logger.info("Starting full data collection and processing cycle")
@@ -127,6 +143,8 @@ def main():
         
         # Schedule the full cycle
         schedule.every(schedule_hours).hours.do(run_full_cycle)
+        # Downsample old history and detach expired partitions once a day
+        schedule.every(24).hours.do(run_retention)
         
         # Run initial cycle
         logger.info("Running initial data collection and processing cycle...")
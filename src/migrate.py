@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Applies pending schema migrations. With --status, lists them without applying;
+with --check, also verifies that the known queries are served by indexes.
+"""
+
+import sys
+import argparse
+import logging
+
+# Load environment variables from the .env file
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+    print("Loaded environment variables from .env file")
+except ImportError:
+    print("python-dotenv not installed, using system environment variables")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def migrate(status=False, check=False):
+    """Applies pending migrations (or only lists them with status=True); with check=True checks query plans"""
+    try:
+        from db import engine, SessionLocal
+        from models import create_tables
+        from migrations.runner import MIGRATIONS, pending_migrations
+        from migrations.plan_check import check_query_plans
+
+        if not status:
+            print("Applying schema migrations...")
+            create_tables(engine)
+
+        db = SessionLocal()
+        try:
+            if status:
+                pending = {m.version for m in pending_migrations(db)}
+                for m in MIGRATIONS:
+                    print(f"{'pending' if m.version in pending else 'applied'}  {m.version:4}  {m.name}")
+
+            if check:
+                failures = check_query_plans(db)
+                for name, scans in failures:
+                    print(f"❌ {name}: sequential scan of {', '.join(scans)}")
+                if failures:
+                    return False
+                print("All known queries are served by indexes")
+        finally:
+            db.close()
+
+        return True
+
+    except Exception as e:
+        logger.error(f"Error migrating the schema: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument('--status', action='store_true',
+                        help="List applied and pending migrations without applying them")
+    parser.add_argument('--check', action='store_true',
+                        help="Fail if a known query plan contains a sequential scan")
+    args = parser.parse_args()
+
+    success = migrate(args.status, args.check)
+
+    if success:
+        print("\n✅ Schema is up to date!" if not args.status else "\n✅ Done!")
+    else:
+        print("\n❌ Schema migration failed.")
+        sys.exit(1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Migrates existing product records to the slowly-changing-dimension history model
+(product_dim + product_versions) and rebuilds product_latest, optionally
+deleting records that only repeat their version.
+"""
+
+import sys
+import argparse
+import logging
+
+# Load environment variables from the .env file
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+    print("Loaded environment variables from .env file")
+except ImportError:
+    print("python-dotenv not installed, using system environment variables")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def migrate_history(prune=False):
+    """Builds product history from existing records; with prune=True also removes redundant records"""
+    try:
+        from db import engine, SessionLocal
+        from models import create_tables
+        from data_processing.history import backfill_history, prune_redundant_records, rebuild_latest
+
+        print("Creating history tables...")
+        create_tables(engine)
+
+        db = SessionLocal()
+        try:
+            versions = backfill_history(db)
+            print(f"Created {versions} product versions")
+            
+            latest = rebuild_latest(db)
+            print(f"Rebuilt the latest state of {latest} products")
+
+            if prune:
+                print("⚠️  Deleting product records that repeat their version...")
+                deleted = prune_redundant_records(db)
+                print(f"Replaced {deleted} redundant records with observations")
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        return True
+
+    except Exception as e:
+        logger.error(f"Error migrating history: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate product records to the history model")
+    parser.add_argument('--prune', action='store_true',
+                        help="Delete records (with their images and variants) that repeat their version")
+    args = parser.parse_args()
+
+    success = migrate_history(args.prune)
+
+    if success:
+        print("\n✅ Product history migrated successfully!")
+    else:
+        print("\n❌ Failed to migrate product history.")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+"""
+Checks that the known dashboard and ingest queries are served by indexes.
+
+Each query is planned with EXPLAIN while sequential scans are discouraged
+(enable_seqscan = off), so on a small or empty table the planner still picks
+an index if one fits; a "Seq Scan" left in the plan means no index can serve
+the query. PostgreSQL only.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# name -> query; parameters are filled from plan_parameters()
+KNOWN_QUERIES: Dict[str, str] = {
+    'latest record of a url': """
+        SELECT * FROM agilite.products WHERE url = :url
+        ORDER BY processing_timestamp DESC LIMIT 1
+    """,
+    'history of a url': """
+        SELECT id, price, stock_status, processing_timestamp FROM agilite.products
+        WHERE url = :url ORDER BY processing_timestamp DESC
+    """,
+    'records in a time range': """
+        SELECT category, stock_status, COUNT(*) FROM agilite.products
+        WHERE processing_timestamp >= :since AND processing_timestamp < :until
+        GROUP BY category, stock_status
+    """,
+    'images of a product': """
+        SELECT d.url, i.order_index FROM agilite.product_images i
+        JOIN agilite.image_dim d ON d.id = i.image_id WHERE i.product_id = :product_id
+    """,
+    'variants of a product': """
+        SELECT d.variant_type, d.name FROM agilite.product_variants v
+        JOIN agilite.variant_dim d ON d.id = v.variant_id WHERE v.product_id = :product_id
+    """,
+    'records with a variant': """
+        SELECT v.product_id, v.processing_timestamp FROM agilite.product_variants v
+        JOIN agilite.variant_dim d ON d.id = v.variant_id
+        WHERE d.variant_type = :variant_type AND d.name = :variant_name
+    """,
+    'observations of a session': """
+        SELECT product_id, observed_at FROM agilite.product_observations WHERE session_id = :session_id
+    """,
+    'latest scraping session': """
+        SELECT * FROM agilite.scraping_sessions ORDER BY session_start DESC LIMIT 1
+    """,
+    'current version of a product': """
+        SELECT * FROM agilite.product_versions WHERE product_dim_id = :product_dim_id AND valid_to IS NULL
+    """,
+    'latest products of a category': """
+        SELECT url, title, price, stock_status FROM agilite.product_latest WHERE category = :category
+    """,
+    'stock rollups in a time range': """
+        SELECT date_trunc('day', hour), stock_status, category, SUM(records) FROM agilite.stock_rollups
+        WHERE hour >= :since GROUP BY 1, 2, 3
+    """,
+}
+
+
+def plan_parameters() -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {'url': 'https://example.com/product', 'since': now - timedelta(days=30), 'until': now,
+            'product_id': 1, 'session_id': 1, 'product_dim_id': 1, 'category': 'Other',
+            'variant_type': 'color', 'variant_name': 'black'}
+
+
+def _plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def sequential_scans(db: Session, query: str, parameters: Dict[str, Any]) -> List[str]:
+    """Relations the plan of `query` reads with a sequential scan."""
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return [node.get('Relation Name', '?') for node in _plan_nodes(plan[0]['Plan'])
+            if node['Node Type'] == 'Seq Scan']
+
+
+def check_query_plans(db: Session) -> List[Tuple[str, List[str]]]:
+    """
+    Plans every known query and returns (query name, sequentially scanned relations)
+    for the ones that are not fully served by indexes; empty when all are.
+    """
+    parameters = plan_parameters()
+    failures = []
+    # SET LOCAL ends with the transaction, which is rolled back
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    try:
+        for name, query in KNOWN_QUERIES.items():
+            scans = sequential_scans(db, query, parameters)
+            if scans:
+                logger.warning(f"Query '{name}' scans {', '.join(scans)} sequentially")
+                failures.append((name, scans))
+    finally:
+        db.rollback()
+    return failures
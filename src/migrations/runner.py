@@ -0,0 +1,81 @@
+import logging
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import SchemaMigration
+
+logger = logging.getLogger(__name__)
+
+# Serializes runners started at the same time (e.g. scheduler and a manual run)
+MIGRATION_LOCK_KEY = 5_207_024
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable[[Session], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Registers a forward-only migration; versions must be unique and increasing."""
+    def register(upgrade: Callable[[Session], None]):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} must come after {MIGRATIONS[-1].version}")
+        MIGRATIONS.append(Migration(version, name, upgrade))
+        return upgrade
+    return register
+
+
+def applied_versions(db: Session) -> List[int]:
+    return [row[0] for row in db.query(SchemaMigration.version).order_by(SchemaMigration.version).all()]
+
+
+def pending_migrations(db: Session) -> List[Migration]:
+    """Migrations not yet applied, in order; fails if the database has versions this code does not know."""
+    # The registry is filled by importing the versions module
+    import migrations.versions  # noqa: F401
+    applied = set(applied_versions(db))
+    unknown = applied - {m.version for m in MIGRATIONS}
+    if unknown:
+        raise RuntimeError(f"Database has migrations {sorted(unknown)} that this code does not know; "
+                           f"it was migrated by a newer version")
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def run_migrations(engine, target: Optional[int] = None) -> List[int]:
+    """
+    Applies the pending migrations up to `target` (default: all), each in its own transaction.
+
+    A migration and its schema_migrations row commit together, so a failed
+    migration leaves the database at the previous version and is retried on
+    the next run. There are no downgrades. Returns the versions applied.
+    """
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    applied = []
+    with Session(bind=engine) as db:
+        for candidate in pending_migrations(db):
+            if target is not None and candidate.version > target:
+                break
+            if db.get_bind().dialect.name == 'postgresql':
+                db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+            # Another runner may have applied it while this one waited for the lock
+            if db.get(SchemaMigration, candidate.version) is not None:
+                db.commit()
+                continue
+            logger.info(f"Applying migration {candidate.version}: {candidate.name}")
+            try:
+                candidate.upgrade(db)
+                db.add(SchemaMigration(version=candidate.version, name=candidate.name, applied_at=datetime.utcnow()))
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.error(f"Migration {candidate.version} ({candidate.name}) failed")
+                raise
+            applied.append(candidate.version)
+    return applied
@@ -0,0 +1,124 @@
+"""
+Schema migrations, applied in order by migrations.runner.run_migrations.
+
+Every migration must be safe on a database whose tables were just created from
+the models (IF NOT EXISTS, backfills that find nothing to do), because new
+databases run them all after create_all. Never edit a released migration;
+add a new one. PostgreSQL only.
+"""
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from migrations.runner import migration
+
+logger = logging.getLogger(__name__)
+
+
+@migration(1, "products.content_hash")
+def add_content_hash(db: Session):
+    db.execute(text("ALTER TABLE agilite.products ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_agilite_products_content_hash ON agilite.products (content_hash)"))
+
+
+@migration(2, "processing_timestamp on product images and variants")
+def add_child_processing_timestamp(db: Session):
+    for table in ('product_images', 'product_variants'):
+        db.execute(text(f"ALTER TABLE agilite.{table} ADD COLUMN IF NOT EXISTS processing_timestamp TIMESTAMP"))
+
+
+@migration(3, "backfill product history and latest state")
+def backfill_product_history(db: Session):
+    from data_processing.history import backfill_history, rebuild_latest
+    versions = backfill_history(db)
+    logger.info(f"Created {versions} product versions")
+    if db.execute(text("SELECT 1 FROM agilite.product_latest LIMIT 1")).first() is None:
+        latest = rebuild_latest(db)
+        logger.info(f"Created {latest} latest product rows")
+
+
+@migration(4, "indexes for history, time range and foreign key lookups")
+def add_query_indexes(db: Session):
+    statements = [
+        # Latest record per URL and a URL's history in order
+        "CREATE INDEX IF NOT EXISTS ix_products_url_processing_timestamp "
+        "ON agilite.products (url, processing_timestamp DESC)",
+        # Time range scans over append-ordered history
+        "CREATE INDEX IF NOT EXISTS ix_products_processing_timestamp_brin "
+        "ON agilite.products USING brin (processing_timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_product_images_processing_timestamp_brin "
+        "ON agilite.product_images USING brin (processing_timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_product_variants_processing_timestamp_brin "
+        "ON agilite.product_variants USING brin (processing_timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_agilite_products_category ON agilite.products (category)",
+        # Foreign keys, so joins and deletes on the referenced side do not scan the children
+        "CREATE INDEX IF NOT EXISTS ix_agilite_product_images_product_id ON agilite.product_images (product_id)",
+        "CREATE INDEX IF NOT EXISTS ix_agilite_product_variants_product_id ON agilite.product_variants (product_id)",
+        "CREATE INDEX IF NOT EXISTS ix_agilite_product_observations_session_id "
+        "ON agilite.product_observations (session_id)",
+        "CREATE INDEX IF NOT EXISTS ix_agilite_ingest_quarantine_session_id ON agilite.ingest_quarantine (session_id)",
+        "CREATE INDEX IF NOT EXISTS ix_agilite_ingested_files_session_id ON agilite.ingested_files (session_id)",
+        # Latest scraping session
+        "CREATE INDEX IF NOT EXISTS ix_agilite_scraping_sessions_session_start "
+        "ON agilite.scraping_sessions (session_start)",
+    ]
+    for statement in statements:
+        db.execute(text(statement))
+    # The composite index makes the single-column URL index redundant
+    db.execute(text("DROP INDEX IF EXISTS agilite.ix_agilite_products_url"))
+
+
+def _columns(db: Session, table: str) -> set:
+    return {name for (name,) in db.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = 'agilite' AND table_name = :table"
+    ), {'table': table})}
+
+
+@migration(5, "image and variant dimension tables")
+def deduplicate_images_and_variants(db: Session):
+    # image_dim and variant_dim are created by create_all; this moves existing rows over to them
+    if 'url' in _columns(db, 'product_images'):
+        db.execute(text("""
+            INSERT INTO agilite.image_dim (url)
+            SELECT DISTINCT url FROM agilite.product_images
+            ON CONFLICT (url) DO NOTHING
+        """))
+        db.execute(text("ALTER TABLE agilite.product_images ADD COLUMN IF NOT EXISTS image_id INTEGER"))
+        db.execute(text("""
+            UPDATE agilite.product_images i SET image_id = d.id
+            FROM agilite.image_dim d WHERE d.url = i.url
+        """))
+        db.execute(text("ALTER TABLE agilite.product_images ALTER COLUMN image_id SET NOT NULL"))
+        db.execute(text("ALTER TABLE agilite.product_images DROP COLUMN url, DROP COLUMN IF EXISTS created_at"))
+        db.execute(text("""
+            ALTER TABLE agilite.product_images ADD CONSTRAINT product_images_image_id_fkey
+            FOREIGN KEY (image_id) REFERENCES agilite.image_dim (id)
+        """))
+
+    if 'name' in _columns(db, 'product_variants'):
+        db.execute(text("""
+            INSERT INTO agilite.variant_dim (variant_type, name)
+            SELECT DISTINCT COALESCE(variant_type, ''), name FROM agilite.product_variants
+            ON CONFLICT (variant_type, name) DO NOTHING
+        """))
+        db.execute(text("ALTER TABLE agilite.product_variants ADD COLUMN IF NOT EXISTS variant_id INTEGER"))
+        db.execute(text("""
+            UPDATE agilite.product_variants v SET variant_id = d.id
+            FROM agilite.variant_dim d WHERE d.variant_type = COALESCE(v.variant_type, '') AND d.name = v.name
+        """))
+        db.execute(text("ALTER TABLE agilite.product_variants ALTER COLUMN variant_id SET NOT NULL"))
+        db.execute(text("""
+            ALTER TABLE agilite.product_variants
+            DROP COLUMN name, DROP COLUMN variant_type, DROP COLUMN IF EXISTS created_at
+        """))
+        db.execute(text("""
+            ALTER TABLE agilite.product_variants ADD CONSTRAINT product_variants_variant_id_fkey
+            FOREIGN KEY (variant_id) REFERENCES agilite.variant_dim (id)
+        """))
+
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_agilite_product_images_image_id ON agilite.product_images (image_id)"))
+    db.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_agilite_product_variants_variant_id ON agilite.product_variants (variant_id)"
+    ))
@@ -1,7 +1,10 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, MetaData, text
+from sqlalchemy import (Column, Integer, String, Float, DateTime, ForeignKey, ForeignKeyConstraint, Text, Boolean,
+                        MetaData, Index, UniqueConstraint, text)
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from typing import List, Optional
+import re
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,13 +13,23 @@ logger = logging.getLogger(__name__)
 metadata = MetaData(schema='agilite')
 Base = declarative_base(metadata=metadata)
 
+# History tables partitioned by month of processing_timestamp (PostgreSQL), parents first
+PARTITIONED_TABLES = ('products', 'product_images', 'product_variants')
+
 class Product(Base):
     """Model for storing product information."""
     __tablename__ = "products"
-    __table_args__ = {'schema': 'agilite'}
+    __table_args__ = (
+        # Latest record of a URL and its history in order
+        Index('ix_products_url_processing_timestamp', 'url', text('processing_timestamp DESC')),
+        # Time range scans; tiny compared to a b-tree since rows arrive in timestamp order
+        Index('ix_products_processing_timestamp_brin', 'processing_timestamp', postgresql_using='brin'),
+        {'schema': 'agilite', 'postgresql_partition_by': 'RANGE (processing_timestamp)'}
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    url = Column(String(500), index=True, nullable=False)
+    # The partition key is part of the primary key, as PostgreSQL requires
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    url = Column(String(500), nullable=False)  # Indexed with processing_timestamp
     title = Column(String(500), nullable=True)
     price = Column(Float, nullable=True)
     description = Column(Text, nullable=True)
@@ -24,8 +37,9 @@ class Product(Base):
     first_image_url = Column(String(500), nullable=True)
     stock_status = Column(String(100), nullable=True)
     variant_count = Column(Integer, default=0)
-    category = Column(String(200), nullable=True)
-    processing_timestamp = Column(DateTime, default=datetime.utcnow)
+    category = Column(String(200), nullable=True, index=True)
+    content_hash = Column(String(64), index=True, nullable=True)  # Fingerprint of the scraped content
+    processing_timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -37,38 +51,262 @@ class Product(Base):
         return f"<Product(id={self.id}, title='{self.title}', price={self.price})>"
 
 class ProductImage(Base):
-    """Model for storing product images."""
+    """Model linking a product record to its images, in order."""
     __tablename__ = "product_images"
-    __table_args__ = {'schema': 'agilite'}
+    __table_args__ = (
+        ForeignKeyConstraint(['product_id', 'processing_timestamp'],
+                             ['agilite.products.id', 'agilite.products.processing_timestamp']),
+        Index('ix_product_images_processing_timestamp_brin', 'processing_timestamp', postgresql_using='brin'),
+        {'schema': 'agilite', 'postgresql_partition_by': 'RANGE (processing_timestamp)'}
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("agilite.products.id"), nullable=False)
-    url = Column(String(500), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    product_id = Column(Integer, nullable=False, index=True)
+    processing_timestamp = Column(DateTime, primary_key=True)  # The product's, so both are partitioned alike
+    image_id = Column(Integer, ForeignKey("agilite.image_dim.id"), nullable=False, index=True)
     order_index = Column(Integer, default=0)  # Image order
-    created_at = Column(DateTime, default=datetime.utcnow)
     
-    # Relationship with product
+    # Relationships with product and the image itself
     product = relationship("Product", back_populates="images")
+    image = relationship("ImageDimension")
     
     def __repr__(self):
-        return f"<ProductImage(id={self.id}, product_id={self.product_id}, url='{self.url}')>"
+        return f"<ProductImage(id={self.id}, product_id={self.product_id}, image_id={self.image_id})>"
 
 class ProductVariant(Base):
-    """Model for storing product variants."""
+    """Model linking a product record to its variants."""
     __tablename__ = "product_variants"
+    __table_args__ = (
+        ForeignKeyConstraint(['product_id', 'processing_timestamp'],
+                             ['agilite.products.id', 'agilite.products.processing_timestamp']),
+        Index('ix_product_variants_processing_timestamp_brin', 'processing_timestamp', postgresql_using='brin'),
+        {'schema': 'agilite', 'postgresql_partition_by': 'RANGE (processing_timestamp)'}
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    product_id = Column(Integer, nullable=False, index=True)
+    processing_timestamp = Column(DateTime, primary_key=True)  # The product's, so both are partitioned alike
+    variant_id = Column(Integer, ForeignKey("agilite.variant_dim.id"), nullable=False, index=True)
+    
+    # Relationships with product and the variant itself
+    product = relationship("Product", back_populates="variants")
+    variant = relationship("VariantDimension")
+    
+    def __repr__(self):
+        return f"<ProductVariant(id={self.id}, product_id={self.product_id}, variant_id={self.variant_id})>"
+
+class ImageDimension(Base):
+    """Model for a distinct product image, one row per image URL."""
+    __tablename__ = "image_dim"
     __table_args__ = {'schema': 'agilite'}
     
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("agilite.products.id"), nullable=False)
+    url = Column(String(500), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f"<ImageDimension(id={self.id}, url='{self.url}')>"
+
+class VariantDimension(Base):
+    """Model for a distinct product variant, one row per variant type and name."""
+    __tablename__ = "variant_dim"
+    __table_args__ = (
+        UniqueConstraint('variant_type', 'name', name='uq_variant_dim_type_name'),
+        {'schema': 'agilite'}
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    variant_type = Column(String(100), nullable=False, default='')  # color, size, etc.
     name = Column(String(200), nullable=False)
-    variant_type = Column(String(100), nullable=True)  # color, size, etc.
+    
+    def __repr__(self):
+        return f"<VariantDimension(id={self.id}, variant_type='{self.variant_type}', name='{self.name}')>"
+
+class ProductObservation(Base):
+    """Model for recording that a product was seen unchanged since its last stored record."""
+    __tablename__ = "product_observations"
+    __table_args__ = {'schema': 'agilite'}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # No foreign key: ids alone are not unique across the partitions of products
+    product_id = Column(Integer, nullable=False, index=True)
+    session_id = Column(Integer, ForeignKey("agilite.scraping_sessions.id"), nullable=True, index=True)
+    observed_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    # Relationship with the record that is still current
+    product = relationship("Product", primaryjoin="foreign(ProductObservation.product_id) == Product.id",
+                           viewonly=True)
+    
+    def __repr__(self):
+        return f"<ProductObservation(id={self.id}, product_id={self.product_id}, observed_at={self.observed_at})>"
+
+class ProductDimension(Base):
+    """Model for the stable identity of a product, one row per URL."""
+    __tablename__ = "product_dim"
+    __table_args__ = {'schema': 'agilite'}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String(500), unique=True, nullable=False)
+    first_seen_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationship with the product's versions
+    versions = relationship("ProductVersion", back_populates="dimension", order_by="ProductVersion.valid_from")
+    
+    def __repr__(self):
+        return f"<ProductDimension(id={self.id}, url='{self.url}')>"
+
+class ProductVersion(Base):
+    """Model for the validity interval of one version of a product (valid_to is NULL for the current one)."""
+    __tablename__ = "product_versions"
+    __table_args__ = (
+        Index('ix_product_versions_current', 'product_dim_id', 'valid_to'),
+        {'schema': 'agilite'}
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_dim_id = Column(Integer, ForeignKey("agilite.product_dim.id"), nullable=False)
+    product_id = Column(Integer, nullable=False, index=True)  # Record holding the attributes
+    valid_from = Column(DateTime, nullable=False)
+    valid_to = Column(DateTime, nullable=True)
+    
+    # Relationships with the dimension and the attribute record
+    dimension = relationship("ProductDimension", back_populates="versions")
+    product = relationship("Product", primaryjoin="foreign(ProductVersion.product_id) == Product.id",
+                           viewonly=True)
+    
+    def __repr__(self):
+        return f"<ProductVersion(id={self.id}, product_dim_id={self.product_dim_id}, valid_from={self.valid_from}, valid_to={self.valid_to})>"
+
+class ProductLatest(Base):
+    """Model for the current state of every product, one row per URL, maintained at ingest."""
+    __tablename__ = "product_latest"
+    __table_args__ = {'schema': 'agilite'}
+    
+    url = Column(String(500), primary_key=True)
+    product_id = Column(Integer, nullable=False)  # Record holding this state
+    title = Column(String(500), nullable=True)
+    price = Column(Float, nullable=True)
+    stock_status = Column(String(100), nullable=True, index=True)
+    category = Column(String(200), nullable=True, index=True)
+    image_count = Column(Integer, default=0)
+    variant_count = Column(Integer, default=0)
+    first_image_url = Column(String(500), nullable=True)
+    content_hash = Column(String(64), nullable=True)
+    processing_timestamp = Column(DateTime, nullable=False)  # When this state was recorded
+    last_seen_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<ProductLatest(url='{self.url}', price={self.price}, stock_status='{self.stock_status}')>"
+
+class IngestQuarantine(Base):
+    """Model for raw products that could not be stored, kept with the reason for inspection."""
+    __tablename__ = "ingest_quarantine"
+    __table_args__ = {'schema': 'agilite'}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("agilite.scraping_sessions.id"), nullable=True, index=True)
+    source_file = Column(String(500), nullable=True)
+    url = Column(String(500), nullable=True)
+    payload = Column(Text, nullable=False)  # The raw product as JSON
+    error = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    # Relationship with product
-    product = relationship("Product", back_populates="variants")
+    def __repr__(self):
+        return f"<IngestQuarantine(id={self.id}, url='{self.url}', error='{self.error}')>"
+
+class IngestedFile(Base):
+    """Model for the manifest of raw snapshot files that have been ingested."""
+    __tablename__ = "ingested_files"
+    __table_args__ = {'schema': 'agilite'}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot = Column(String(200), unique=True, nullable=False)  # File name without extension
+    path = Column(String(500), nullable=False)
+    checksum = Column(String(64), index=True, nullable=False)  # SHA-256 of the decompressed content
+    products = Column(Integer, default=0)
+    session_id = Column(Integer, ForeignKey("agilite.scraping_sessions.id"), nullable=True, index=True)
+    ingested_at = Column(DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f"<ProductVariant(id={self.id}, product_id={self.product_id}, name='{self.name}')>"
+        return f"<IngestedFile(id={self.id}, snapshot='{self.snapshot}', products={self.products})>"
+
+class CategoryKeyword(Base):
+    """Model for the category taxonomy: title keywords and the category they map to."""
+    __tablename__ = "category_taxonomy"
+    __table_args__ = {'schema': 'agilite'}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    keyword = Column(String(200), unique=True, nullable=False)
+    category = Column(String(200), nullable=False)
+    priority = Column(Integer, default=0)  # Lower wins when a title contains several keywords
+    
+    def __repr__(self):
+        return f"<CategoryKeyword(keyword='{self.keyword}', category='{self.category}')>"
+
+class ProductStatistics(Base):
+    """Model for basic statistics over the latest products, precomputed at ingest."""
+    __tablename__ = "product_stats"
+    __table_args__ = {'schema': 'agilite'}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    computed_at = Column(DateTime, default=datetime.utcnow, index=True)
+    total_records = Column(Integer, default=0)
+    unique_products = Column(Integer, default=0)
+    average_price = Column(Float, default=0.0)
+    min_price = Column(Float, default=0.0)
+    max_price = Column(Float, default=0.0)
+    products_with_variants = Column(Integer, default=0)
+    average_variants_per_product = Column(Float, default=0.0)
+    products_with_images = Column(Integer, default=0)
+    average_images_per_product = Column(Float, default=0.0)
+    category_distribution = Column(Text, nullable=True)  # JSON object: category -> product count
+    
+    def __repr__(self):
+        return f"<ProductStatistics(id={self.id}, computed_at={self.computed_at}, unique_products={self.unique_products})>"
+
+class StockRollup(Base):
+    """Model for hourly counts of product records and observations by stock status and category."""
+    __tablename__ = "stock_rollups"
+    __table_args__ = (
+        UniqueConstraint('hour', 'stock_status', 'category', name='uq_stock_rollups_bucket'),
+        {'schema': 'agilite'}
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    hour = Column(DateTime, nullable=False)  # Start of the hour
+    stock_status = Column(String(100), nullable=False, default='')  # '' when the record has none
+    category = Column(String(200), nullable=False, default='')
+    records = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<StockRollup(hour={self.hour}, stock_status='{self.stock_status}', category='{self.category}', records={self.records})>"
+
+class RetentionRun(Base):
+    """Model for the log of history retention runs (downsampling and expired partitions)."""
+    __tablename__ = "retention_runs"
+    __table_args__ = {'schema': 'agilite'}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    downsampled_before = Column(DateTime, nullable=True)  # Records before this keep one per product and day
+    records_removed = Column(Integer, default=0)
+    observations_removed = Column(Integer, default=0)
+    partitions_detached = Column(Text, nullable=True)  # Comma-separated partition names
+    
+    def __repr__(self):
+        return f"<RetentionRun(id={self.id}, downsampled_before={self.downsampled_before})>"
+
+class SchemaMigration(Base):
+    """Model for the schema migrations applied to the database."""
+    __tablename__ = "schema_migrations"
+    __table_args__ = {'schema': 'agilite'}
+    
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<SchemaMigration(version={self.version}, name='{self.name}')>"
 
 class ScrapingSession(Base):
     """Model for tracking scraping sessions."""
@@ -76,7 +314,7 @@ class ScrapingSession(Base):
     __table_args__ = {'schema': 'agilite'}
     
     id = Column(Integer, primary_key=True, index=True)
-    session_start = Column(DateTime, default=datetime.utcnow)
+    session_start = Column(DateTime, default=datetime.utcnow, index=True)
     session_end = Column(DateTime, nullable=True)
     products_scraped = Column(Integer, default=0)
     products_processed = Column(Integer, default=0)
@@ -95,11 +333,92 @@ def create_tables(engine):
             connection.commit()
         
         Base.metadata.create_all(bind=engine)
+        
+        # create_all does not alter existing tables; later changes are versioned migrations
+        from migrations.runner import run_migrations
+        run_migrations(engine)
+        
+        with engine.connect() as connection:
+            # Partitions for this month and the next one
+            create_partitions(connection)
+            connection.commit()
         logger.info("Database tables created successfully in schema 'agilite'")
     except Exception as e:
         logger.error(f"Failed to create database tables: {e}")
         raise
 
+def month_start(at: datetime) -> datetime:
+    return datetime(at.year, at.month, 1)
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_y{month:%Y}m{month:%m}"
+
+_BOUND = re.compile(r"FROM \((MINVALUE|'[^']*')\) TO \((MAXVALUE|'[^']*')\)")
+
+def partition_bounds(connection, table: str) -> List[tuple]:
+    """Returns (partition name, lower bound, upper bound) of a partitioned table; None stands for MINVALUE/MAXVALUE."""
+    rows = connection.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = 'agilite' AND p.relname = :table
+    """), {'table': table}).all()
+    bounds = []
+    for name, expression in rows:
+        match = _BOUND.search(expression or '')
+        if not match:
+            continue
+        lower, upper = (None if value.endswith('VALUE') else datetime.fromisoformat(value.strip("'"))
+                        for value in match.groups())
+        bounds.append((name, lower, upper))
+    return sorted(bounds, key=lambda bound: bound[1] or datetime.min)
+
+def partitioned_tables(connection) -> List[str]:
+    """Names of the tables in the agilite schema that are partitioned (PostgreSQL only)."""
+    return [row[0] for row in connection.execute(text("""
+        SELECT c.relname FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'agilite'
+    """))]
+
+def create_partitions(connection, at: Optional[datetime] = None, months_ahead: int = 1) -> List[str]:
+    """
+    Creates the monthly partitions of the history tables for the month of `at`
+    (default: now) and `months_ahead` following months, skipping months an
+    existing partition already covers. Returns the names of the new partitions.
+    Does nothing on other databases or on tables that are not partitioned.
+    """
+    if connection.dialect.name != 'postgresql':
+        return []
+    partitioned = set(partitioned_tables(connection))
+    created = []
+    first = month_start(at or datetime.utcnow())
+    for table in PARTITIONED_TABLES:
+        if table not in partitioned:
+            continue
+        existing = partition_bounds(connection, table)
+        for i in range(months_ahead + 1):
+            start, end = add_months(first, i), add_months(first, i + 1)
+            if any((lower is None or lower < end) and (upper is None or upper > start)
+                   for _, lower, upper in existing):
+                continue
+            name = partition_name(table, start)
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS agilite.{name} PARTITION OF agilite.{table} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            ))
+            created.append(name)
+    if created:
+        logger.info(f"Created partitions {', '.join(created)}")
+    return created
+
 def drop_tables(engine):
     """Drops all tables from the database (for development only!)."""
     try:
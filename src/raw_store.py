@@ -0,0 +1,405 @@
+import os
+import io
+import gzip
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is used when zstandard is not installed
+    zstandard = None
+
+try:
+    import ijson
+except ImportError:  # optional, JSON arrays are then parsed with the incremental fallback below
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+RAW_PREFIX = 'products_'
+COMPRESSED_EXTENSIONS = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst'}
+RAW_EXTENSIONS = ('.json', '.ndjson') + tuple(COMPRESSED_EXTENSIONS.values())
+CHECKPOINT_SUFFIX = '.checkpoint'
+DEFAULT_COMPRESSION = 'gzip'
+# Bytes read at a time when looking for the last complete line of an unfinished snapshot
+RECOVER_BLOCK = 1 << 16
+
+
+def resolve_compression(compression):
+    """Normalize a compression name ('gzip', 'zstd' or 'none'), falling back to gzip without zstandard"""
+    compression = (compression or DEFAULT_COMPRESSION).lower()
+    if compression in ('none', 'off', 'false'):
+        return None
+    if compression in ('zst', 'zstd'):
+        if zstandard is None:
+            logger.warning("zstandard is not installed, compressing snapshots with gzip")
+            return 'gzip'
+        return 'zstd'
+    if compression in ('gz', 'gzip'):
+        return 'gzip'
+    raise ValueError(f"Unknown snapshot compression: {compression}")
+
+
+def _snapshot_stem(path):
+    """Path without its snapshot extension, e.g. data/raw/products_20240101_000000"""
+    for extension in sorted(RAW_EXTENSIONS, key=len, reverse=True):
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return os.path.splitext(path)[0]
+
+
+def snapshot_name(path):
+    """Name identifying a snapshot regardless of its format, e.g. products_20240101_000000"""
+    return os.path.basename(_snapshot_stem(path))
+
+
+def snapshot_time(path):
+    """When a snapshot was started, from its file name, or None for unexpected names"""
+    try:
+        return datetime.strptime(snapshot_name(path)[len(RAW_PREFIX):], "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def snapshot_checksum(path, chunk_size=1 << 20):
+    """SHA-256 of a snapshot's decompressed content, so compressing a file does not change it"""
+    digest = hashlib.sha256()
+    if path.endswith('.gz'):
+        f = gzip.open(path, 'rb')
+    elif path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} requires the zstandard package")
+        f = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    else:
+        f = open(path, 'rb')
+    with f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_snapshot(directory, name):
+    """Current path of the snapshot called `name` (it may have been compressed since), or None"""
+    for path in list_raw_files(directory, include_incomplete=True):
+        if snapshot_name(path) == name:
+            return path
+    return None
+
+
+def open_snapshot(path):
+    """Open a raw snapshot for reading as text, decompressing .gz and .zst files on the fly"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} requires the zstandard package")
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def compress_snapshot(path, compression=DEFAULT_COMPRESSION, level=None):
+    """
+    Write a compressed NDJSON copy of a complete snapshot and return its path.
+
+    Accepts plain NDJSON as well as legacy pretty-printed JSON arrays. The copy
+    is written to a temporary file and renamed, so readers never see half of it.
+    """
+    compression = resolve_compression(compression)
+    if compression is None:
+        return path
+    target = _snapshot_stem(path) + COMPRESSED_EXTENSIONS[compression]
+    temporary = f"{target}.tmp"
+
+    if compression == 'zstd':
+        raw = open(temporary, 'wb')
+        stream = zstandard.ZstdCompressor(level=level or 10).stream_writer(raw, closefd=True)
+        out = io.TextIOWrapper(stream, encoding='utf-8')
+    else:
+        out = gzip.open(temporary, 'wt', encoding='utf-8', compresslevel=level or 6)
+    with out:
+        for product in iter_products(path):
+            out.write(json.dumps(product, ensure_ascii=False) + '\n')
+
+    os.replace(temporary, target)
+    return target
+
+
+def checkpoint_path(path):
+    """Path of the journal of finished URLs that sits next to a snapshot while it is being written"""
+    return f"{path}{CHECKPOINT_SUFFIX}"
+
+
+def timings_path(path):
+    """Path of the per-run timing summary written next to a snapshot"""
+    directory, name = os.path.split(_snapshot_stem(path))
+    stem = name
+    if stem.startswith(RAW_PREFIX):
+        stem = stem[len(RAW_PREFIX):]
+    # Deliberately outside the products_* pattern so it is never read as a snapshot
+    return os.path.join(directory, f"timings_{stem}.json")
+
+
+def is_complete(path):
+    """A snapshot is complete once its checkpoint journal has been removed"""
+    return not os.path.exists(checkpoint_path(path))
+
+
+def list_raw_files(directory, include_incomplete=False):
+    """List raw snapshot files in a directory, oldest first"""
+    if not os.path.exists(directory):
+        return []
+    files = [
+        os.path.join(directory, f) for f in os.listdir(directory)
+        if f.startswith(RAW_PREFIX) and f.endswith(RAW_EXTENSIONS)
+    ]
+    if not include_incomplete:
+        files = [f for f in files if is_complete(f)]
+
+    # A run interrupted while compressing can leave both forms; list each snapshot once,
+    # preferring the compressed copy
+    by_stem = {}
+    for f in files:
+        stem = _snapshot_stem(f)
+        if stem not in by_stem or f.endswith(tuple(COMPRESSED_EXTENSIONS.values())):
+            by_stem[stem] = f
+    return sorted(by_stem.values())
+
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    """
+    Yield the elements of a top-level JSON array from a text file, reading it in chunks.
+
+    Only one element plus one chunk is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    started = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    while True:
+        # Skip whitespace and separators between elements
+        while position < len(buffer) and buffer[position] in ' \t\r\n,' + ('' if started else '\ufeff'):
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            fill()
+            continue
+
+        if not started:
+            if buffer[position] != '[':
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        # A value cut off at the end of the buffer (e.g. a number) may continue in the next chunk
+        if end >= len(buffer) and not eof:
+            fill()
+            continue
+        position = end
+        yield element
+
+
+def iter_products(path, follow=False, poll_interval=1.0, idle_timeout=300):
+    """
+    Yield products from a raw snapshot one at a time.
+
+    Legacy JSON array snapshots are parsed incrementally (with ijson when it
+    is installed). NDJSON snapshots, plain or compressed, are read line by line. With
+    `follow=True` a plain snapshot that is still being written is tailed until
+    its checkpoint journal disappears, or until no new line has arrived for
+    `idle_timeout` seconds. Compressed snapshots are always complete.
+    """
+    if path.endswith('.json'):
+        if ijson is not None:
+            with open(path, 'rb') as f:
+                yield from ijson.items(f, 'item', use_float=True)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                yield from _iter_json_array(f)
+        return
+
+    if path.endswith(tuple(COMPRESSED_EXTENSIONS.values())):
+        with open_snapshot(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        last_data_at = time.monotonic()
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if line.endswith('\n'):
+                last_data_at = time.monotonic()
+                if line.strip():
+                    yield json.loads(line)
+                continue
+
+            # EOF or a line that is still being written
+            if not follow or is_complete(path):
+                if line.strip():
+                    logger.warning(f"Ignoring truncated last line in {path}")
+                return
+            if time.monotonic() - last_data_at > idle_timeout:
+                logger.warning(f"No new data in {path} for {idle_timeout}s, stopping")
+                return
+            f.seek(position)
+            time.sleep(poll_interval)
+
+
+class SnapshotRun:
+    """
+    Appends scraped products to an NDJSON snapshot as they complete.
+
+    Every finished URL is also appended to a checkpoint journal, so a crashed
+    run can be resumed by skipping URLs already written. Completing the run
+    removes the journal and replaces the plain NDJSON with a compressed copy.
+    """
+
+    def __init__(self, path, compression=DEFAULT_COMPRESSION):
+        self.path = path
+        self.compression = resolve_compression(compression)
+        self.done = set()
+        self.count = 0
+        resuming = os.path.exists(path)
+        if resuming:
+            self._recover()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._checkpoint = open(checkpoint_path(path), 'a', encoding='utf-8')
+        if resuming:
+            logger.info(f"Resuming snapshot {path} with {len(self.done)} finished products")
+
+    @classmethod
+    def start(cls, directory, compression=DEFAULT_COMPRESSION):
+        """Start a new timestamped snapshot in a directory"""
+        os.makedirs(directory, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        return cls(os.path.join(directory, f"{RAW_PREFIX}{timestamp}.ndjson"), compression)
+
+    @classmethod
+    def resume_or_start(cls, directory, compression=DEFAULT_COMPRESSION):
+        """Resume the latest unfinished snapshot in a directory, or start a new one"""
+        unfinished = [f for f in list_raw_files(directory, include_incomplete=True)
+                      if f.endswith('.ndjson') and not is_complete(f)]
+        if unfinished:
+            return cls(unfinished[-1], compression)
+        return cls.start(directory, compression)
+
+    def _recover(self):
+        """Drop a partially written last line and rebuild the set of finished URLs"""
+        # Scan back from the end in blocks, so recovering a large snapshot does not read it into memory
+        with open(self.path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            position = size
+            end = 0
+            while position > 0:
+                start = max(0, position - RECOVER_BLOCK)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                position = start
+            if end < size:
+                f.truncate(end)
+
+        journal = checkpoint_path(self.path)
+        if os.path.exists(journal):
+            with open(journal, 'r', encoding='utf-8') as f:
+                self.done.update(line.strip() for line in f if line.strip())
+
+        # A product can be written just before a crash without reaching the journal
+        missing = []
+        for product in iter_products(self.path):
+            self.count += 1
+            if product.get('url') not in self.done:
+                missing.append(product.get('url'))
+                self.done.add(product.get('url'))
+        if missing:
+            with open(journal, 'a', encoding='utf-8') as f:
+                f.writelines(f"{url}\n" for url in missing)
+
+    def write(self, product):
+        """Append one product and mark its URL as finished"""
+        self._file.write(json.dumps(product, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._checkpoint.write(f"{product.get('url')}\n")
+        self._checkpoint.flush()
+        self.done.add(product.get('url'))
+        self.count += 1
+
+    def close(self):
+        """Close the files but keep the journal so the run can be resumed"""
+        self._file.close()
+        self._checkpoint.close()
+
+    def complete(self):
+        """
+        Close the snapshot and remove the journal, marking it ready for processing.
+
+        The snapshot is then compressed; `path` points at the compressed file
+        afterwards. If compressing fails the plain snapshot is kept.
+        """
+        self.close()
+        os.remove(checkpoint_path(self.path))
+        if self.compression is None:
+            return
+        plain = self.path
+        try:
+            self.path = compress_snapshot(plain, self.compression)
+        except Exception as e:
+            logger.error(f"Could not compress snapshot {plain}: {str(e)}")
+            return
+        os.remove(plain)
+
+
+def compress_directory(directory, compression=DEFAULT_COMPRESSION):
+    """Compress every complete plain snapshot (.ndjson or legacy .json) in a directory"""
+    compressed = []
+    for path in list_raw_files(directory):
+        if path.endswith(tuple(COMPRESSED_EXTENSIONS.values())):
+            continue
+        before = os.path.getsize(path)
+        target = compress_snapshot(path, compression)
+        if target == path:
+            continue
+        os.remove(path)
+        logger.info(f"Compressed {path} ({before} bytes) to {target} ({os.path.getsize(target)} bytes)")
+        compressed.append(target)
+    return compressed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Compress existing raw snapshots")
+    parser.add_argument('directory', nargs='?', default='data/raw')
+    parser.add_argument('--compression', default=DEFAULT_COMPRESSION, choices=['gzip', 'zstd'])
+    args = parser.parse_args()
+    compress_directory(args.directory, args.compression)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Applies history retention: downsamples old product records to one per product
+and day and detaches expired monthly partitions. With --convert, first turns
+existing unpartitioned history tables into partitioned ones.
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Load environment variables from the .env file
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+    print("Loaded environment variables from .env file")
+except ImportError:
+    print("python-dotenv not installed, using system environment variables")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def retention_settings():
+    """Retention settings from the environment: (downsample days, expire months, archive schema)"""
+    downsample_days = os.environ.get('RETENTION_DOWNSAMPLE_DAYS', '90')
+    expire_months = os.environ.get('RETENTION_EXPIRE_MONTHS', '')
+    archive_schema = os.environ.get('RETENTION_ARCHIVE_SCHEMA', 'agilite_archive')
+    return (int(downsample_days) if downsample_days else None,
+            int(expire_months) if expire_months else None,
+            archive_schema or None)
+
+def apply_retention(convert=False, full=False, downsample_days=None, expire_months=None, archive_schema=None):
+    """Runs one retention pass; with convert=True partitions existing tables first"""
+    try:
+        from db import engine, SessionLocal
+        from models import create_tables
+        from data_processing.retention import partition_existing_tables, run_retention
+
+        create_tables(engine)
+
+        db = SessionLocal()
+        try:
+            if convert:
+                print("Partitioning existing history tables...")
+                converted = partition_existing_tables(db)
+                db.commit()
+                print(f"Partitioned: {', '.join(converted) or 'nothing to convert'}")
+
+            run = run_retention(db, downsample_days, expire_months, archive_schema, full=full)
+            print(f"Removed {run.records_removed or 0} records and {run.observations_removed or 0} observations "
+                  f"before {run.downsampled_before}")
+            if run.partitions_detached:
+                print(f"Detached partitions: {run.partitions_detached}")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        return True
+
+    except Exception as e:
+        logger.error(f"Error applying retention: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == "__main__":
+    downsample_days, expire_months, archive_schema = retention_settings()
+
+    parser = argparse.ArgumentParser(description="Downsample and expire product history")
+    parser.add_argument('--convert', action='store_true',
+                        help="Partition existing unpartitioned history tables first")
+    parser.add_argument('--full', action='store_true',
+                        help="Downsample all old data, not only data since the previous run")
+    parser.add_argument('--downsample-days', type=int, default=downsample_days,
+                        help="Keep one record per product and day for data older than this")
+    parser.add_argument('--expire-months', type=int, default=expire_months,
+                        help="Detach partitions that ended more than this many months ago")
+    parser.add_argument('--archive-schema', default=archive_schema,
+                        help="Schema detached partitions are moved to")
+    args = parser.parse_args()
+
+    success = apply_retention(args.convert, args.full, args.downsample_days, args.expire_months, args.archive_schema)
+
+    if success:
+        print("\n✅ Retention applied successfully!")
+    else:
+        print("\n❌ Failed to apply retention.")
+        sys.exit(1)
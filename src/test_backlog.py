@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Checks that re-running the backlog over a database filled before the
+ingested_files manifest existed does not ingest any snapshot again.
+
+Runs against the PostgreSQL database named in TEST_DB_NAME (the agilite schema
+in it is dropped and recreated); skipped when it is not set.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+# Load environment variables from the .env file
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _test_engine():
+    """Engine of the test database with an empty agilite schema"""
+    name = os.getenv('TEST_DB_NAME')
+    if not name:
+        raise unittest.SkipTest("TEST_DB_NAME is not set")
+    # db reads DB_NAME when it is first imported
+    os.environ['DB_NAME'] = name
+    from db import engine
+    from sqlalchemy import text
+    if engine.url.database != name:
+        raise unittest.SkipTest(f"db is already connected to {engine.url.database}, not {name}")
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA IF EXISTS agilite CASCADE"))
+    return engine
+
+
+def _write_snapshot(directory, name, products):
+    with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(products, f, ensure_ascii=False)
+
+
+def _snapshot(day, price):
+    return [
+        {
+            'url': f"https://agilite.co.il/products/item-{i}",
+            'title': f"Item {i}",
+            'price': price,
+            'stock_status': 'In stock',
+            'images': [f"https://cdn.example.com/item-{i}.jpg", "https://cdn.example.com/logo.jpg"],
+            'variants': [{'type': 'color', 'values': ['Black', 'Coyote']}],
+            'timestamp': f"2024-01-0{day}T08:00:00"
+        }
+        for i in range(20)
+    ]
+
+
+def _row_counts(db):
+    from sqlalchemy import text
+    return {
+        table: db.execute(text(f"SELECT COUNT(*) FROM agilite.{table}")).scalar()
+        for table in ('products', 'product_images', 'product_variants', 'product_observations',
+                      'product_versions', 'ingested_files')
+    }
+
+
+def test_backlog_does_not_reingest_legacy_snapshots():
+    """Running the backlog over a pre-manifest database only ingests the snapshots it has not seen"""
+    _test_engine()
+    from sqlalchemy import text
+    from data_processing.data_processor import AgiliteDataProcessor
+
+    previous_directory = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='agilite_backlog_test_')
+    raw_dir = os.path.join(workdir, 'data', 'raw')
+    os.makedirs(raw_dir)
+    os.chdir(workdir)
+    try:
+        _write_snapshot(raw_dir, 'products_20240101_080000', _snapshot(1, '100'))
+        _write_snapshot(raw_dir, 'products_20240102_080000', _snapshot(2, '120'))
+
+        # A database as left by versions without the manifest: records without a
+        # content hash, completed sessions and no ingested_files rows
+        processor = AgiliteDataProcessor()
+        assert processor.process_backlog(workers=1)['files'] == 2
+        processor.db.execute(text("DELETE FROM agilite.ingested_files"))
+        processor.db.execute(text("UPDATE agilite.products SET content_hash = NULL"))
+        processor.db.execute(text("UPDATE agilite.product_latest SET content_hash = NULL"))
+        processor.db.commit()
+        legacy = _row_counts(processor.db)
+        processor.db.close()
+
+        # The archive was copied without keeping modification times, and one snapshot
+        # was scraped after the last session and never ingested
+        future = time.time() + 86400
+        for name in os.listdir(raw_dir):
+            os.utime(os.path.join(raw_dir, name), (future, future))
+        pending = datetime.now() + timedelta(hours=1)
+        _write_snapshot(raw_dir, f"products_{pending:%Y%m%d_%H%M%S}", _snapshot(3, '130'))
+
+        processor = AgiliteDataProcessor()
+        assert processor.process_backlog(workers=1)['files'] == 1
+        after_new = _row_counts(processor.db)
+        processor.db.close()
+        assert after_new['products'] == legacy['products'] + 20, (legacy, after_new)
+        assert after_new['ingested_files'] == 3, after_new
+
+        for run in range(2):
+            processor = AgiliteDataProcessor()
+            result = processor.process_backlog(workers=1)
+            counts = _row_counts(processor.db)
+            processor.db.close()
+            assert result['success'] and result['files'] == 0, result
+            assert counts == after_new, (run, after_new, counts)
+    finally:
+        os.chdir(previous_directory)
+
+
+def main():
+    try:
+        test_backlog_does_not_reingest_legacy_snapshots()
+    except unittest.SkipTest as e:
+        logger.warning(f"Skipped: {e}")
+        return
+    except AssertionError as e:
+        logger.error(f"Backlog test failed: {e}")
+        sys.exit(1)
+    logger.info("Backlog test passed")
+
+if __name__ == "__main__":
+    main()
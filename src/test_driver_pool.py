@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Checks that threads waiting for a driver get one when a leased driver is
+recycled, instead of waiting forever. Uses fake drivers, no browser needed.
+"""
+
+import sys
+import logging
+import threading
+import time
+
+from data_collection.driver_pool import DriverPool
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+
+    def execute_script(self, script):
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_waiters_get_a_driver_after_recycling():
+    """With one driver recycled every two pages, four threads all finish their leases"""
+    started = []
+
+    def factory():
+        started.append(FakeDriver())
+        return started[-1]
+
+    pool = DriverPool(factory, size=1, max_pages=2)
+    finished = []
+
+    def work(worker):
+        for _ in range(3):
+            with pool.lease() as driver:
+                assert not driver.quit_called
+                # Hold the driver so the other threads are already waiting when it is recycled
+                time.sleep(0.01)
+        finished.append(worker)
+
+    threads = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    pool.close()
+
+    assert sorted(finished) == [0, 1, 2, 3], finished
+    # 12 pages at 2 per driver, never more than one driver at a time
+    assert len(started) == 6, len(started)
+    assert all(driver.quit_called for driver in started)
+
+
+def main():
+    try:
+        test_waiters_get_a_driver_after_recycling()
+    except AssertionError as e:
+        logger.error(f"Driver pool test failed: {e}")
+        sys.exit(1)
+    logger.info("Driver pool test passed")
+
+if __name__ == "__main__":
+    main()
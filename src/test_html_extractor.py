@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Checks that product images extracted from a rendered page are full URLs, the
+same ones the JSON path and the browser's img.src give. No browser needed.
+"""
+
+import sys
+import logging
+
+from data_collection.html_extractor import ProductPageExtractor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PAGE = """
+<html><body>
+  <div class="product-gallery">
+    <img src="//cdn.shopify.com/s/files/1/0001/products/front.jpg?v=1">
+    <img src="/cdn/shop/products/back.jpg">
+    <img src="side.jpg">
+    <img src="https://cdn.shopify.com/s/files/1/0001/products/top.jpg">
+  </div>
+</body></html>
+"""
+
+
+def test_images_are_absolute():
+    """Protocol-relative and relative image sources resolve against the page URL"""
+    extractor = ProductPageExtractor(PAGE, "https://agilite.co.il/products/injector-plate-carrier")
+    assert extractor.images() == [
+        "https://cdn.shopify.com/s/files/1/0001/products/front.jpg?v=1",
+        "https://agilite.co.il/cdn/shop/products/back.jpg",
+        "https://agilite.co.il/products/side.jpg",
+        "https://cdn.shopify.com/s/files/1/0001/products/top.jpg",
+    ], extractor.images()
+
+
+def test_images_follow_base_href():
+    """A <base href> changes what relative sources resolve against, as in the browser"""
+    page = PAGE.replace("<html>", '<html><head><base href="https://cdn.example.com/assets/"></head>')
+    extractor = ProductPageExtractor(page, "https://agilite.co.il/products/injector-plate-carrier")
+    assert extractor.images()[1:3] == [
+        "https://cdn.example.com/cdn/shop/products/back.jpg",
+        "https://cdn.example.com/assets/side.jpg",
+    ], extractor.images()
+
+
+def main():
+    try:
+        test_images_are_absolute()
+        test_images_follow_base_href()
+    except AssertionError as e:
+        logger.error(f"HTML extractor test failed: {e}")
+        sys.exit(1)
+    logger.info("HTML extractor test passed")
+
+if __name__ == "__main__":
+    main()
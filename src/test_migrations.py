@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Checks that the schema migrations apply to an empty database and that every
+known query plans against the migrated schema without a sequential scan.
+
+Runs against the PostgreSQL database named in TEST_DB_NAME (the agilite schema
+in it is dropped and recreated); skipped when it is not set.
+"""
+
+import sys
+import logging
+import unittest
+
+from test_backlog import _test_engine
+
+logger = logging.getLogger(__name__)
+
+
+def test_known_queries_use_indexes_after_migrations():
+    """Every known query plans against the migrated schema and is served by indexes"""
+    engine = _test_engine()
+    from db import SessionLocal
+    from models import create_tables
+    from migrations.runner import MIGRATIONS, applied_versions, pending_migrations, run_migrations
+    from migrations.plan_check import check_query_plans
+
+    create_tables(engine)
+    db = SessionLocal()
+    try:
+        assert pending_migrations(db) == []
+        assert applied_versions(db) == [m.version for m in MIGRATIONS]
+        # A query naming a missing column fails to plan rather than being reported
+        assert check_query_plans(db) == []
+    finally:
+        db.close()
+
+    assert run_migrations(engine) == []
+
+
+def main():
+    try:
+        test_known_queries_use_indexes_after_migrations()
+    except unittest.SkipTest as e:
+        logger.warning(f"Skipped: {e}")
+        return
+    except AssertionError as e:
+        logger.error(f"Migration test failed: {e}")
+        sys.exit(1)
+    logger.info("Migration test passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Checks that run_retention.py --convert partitions a database created by the
+first, unpartitioned version of the schema, keeping its rows.
+
+Runs against the PostgreSQL database named in TEST_DB_NAME (the agilite schema
+in it is dropped and recreated); skipped when it is not set.
+"""
+
+import sys
+import logging
+import unittest
+from datetime import datetime
+
+from test_backlog import _test_engine
+
+logger = logging.getLogger(__name__)
+
+# The tables as the first version of models.py created them
+BASELINE_SCHEMA = [
+    "CREATE SCHEMA IF NOT EXISTS agilite",
+    """
+    CREATE TABLE agilite.products (
+        id SERIAL PRIMARY KEY, url VARCHAR(500) NOT NULL, title VARCHAR(500), price FLOAT,
+        description TEXT, image_count INTEGER, first_image_url VARCHAR(500), stock_status VARCHAR(100),
+        variant_count INTEGER, category VARCHAR(200), processing_timestamp TIMESTAMP,
+        created_at TIMESTAMP, updated_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX ix_agilite_products_id ON agilite.products (id)",
+    "CREATE INDEX ix_agilite_products_url ON agilite.products (url)",
+    """
+    CREATE TABLE agilite.product_images (
+        id SERIAL PRIMARY KEY, product_id INTEGER NOT NULL REFERENCES agilite.products (id),
+        url VARCHAR(500) NOT NULL, order_index INTEGER, created_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX ix_agilite_product_images_id ON agilite.product_images (id)",
+    """
+    CREATE TABLE agilite.product_variants (
+        id SERIAL PRIMARY KEY, product_id INTEGER NOT NULL REFERENCES agilite.products (id),
+        name VARCHAR(200) NOT NULL, variant_type VARCHAR(100), created_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX ix_agilite_product_variants_id ON agilite.product_variants (id)",
+    """
+    CREATE TABLE agilite.scraping_sessions (
+        id SERIAL PRIMARY KEY, session_start TIMESTAMP, session_end TIMESTAMP, products_scraped INTEGER,
+        products_processed INTEGER, status VARCHAR(50), error_message TEXT
+    )
+    """,
+    "CREATE INDEX ix_agilite_scraping_sessions_id ON agilite.scraping_sessions (id)",
+]
+
+
+def _fill_baseline(connection, products=10):
+    from sqlalchemy import text
+    for statement in BASELINE_SCHEMA:
+        connection.execute(text(statement))
+    for i in range(products):
+        at = datetime(2024, 1 + i % 3, 1 + i, 8)
+        product_id = connection.execute(text("""
+            INSERT INTO agilite.products (url, title, price, stock_status, image_count, variant_count,
+                                          processing_timestamp, created_at, updated_at)
+            VALUES (:url, :title, 100, 'In stock', 2, 1, :at, :at, :at) RETURNING id
+        """), {'url': f"https://agilite.co.il/products/item-{i % 4}", 'title': f"Item {i % 4}", 'at': at}).scalar()
+        for order_index, url in enumerate((f"https://cdn.example.com/item-{i % 4}.jpg",
+                                           "https://cdn.example.com/logo.jpg")):
+            connection.execute(text("""
+                INSERT INTO agilite.product_images (product_id, url, order_index, created_at)
+                VALUES (:product_id, :url, :order_index, :at)
+            """), {'product_id': product_id, 'url': url, 'order_index': order_index, 'at': at})
+        connection.execute(text("""
+            INSERT INTO agilite.product_variants (product_id, name, variant_type, created_at)
+            VALUES (:product_id, 'Black', 'color', :at)
+        """), {'product_id': product_id, 'at': at})
+
+
+def _row_counts(connection):
+    from sqlalchemy import text
+    return {
+        table: connection.execute(text(f"SELECT COUNT(*) FROM agilite.{table}")).scalar()
+        for table in ('products', 'product_images', 'product_variants')
+    }
+
+
+def test_convert_baseline_database():
+    """A baseline database upgraded by the migrations converts to partitions with all of its rows"""
+    engine = _test_engine()
+    from sqlalchemy import text
+    from db import SessionLocal
+    from models import PARTITIONED_TABLES, Product, create_tables, partitioned_tables
+    from data_processing.retention import partition_existing_tables
+
+    with engine.begin() as connection:
+        _fill_baseline(connection)
+        before = _row_counts(connection)
+    # Startup applies the migrations to the unpartitioned tables
+    create_tables(engine)
+
+    db = SessionLocal()
+    try:
+        assert sorted(partition_existing_tables(db)) == sorted(PARTITIONED_TABLES)
+        db.commit()
+        assert sorted(partitioned_tables(db.connection())) == sorted(PARTITIONED_TABLES)
+        assert _row_counts(db) == before
+        for table in PARTITIONED_TABLES:
+            key = db.execute(text("""
+                SELECT array_agg(a.attname::text ORDER BY a.attname) FROM pg_constraint co
+                JOIN unnest(co.conkey) k(attnum) ON TRUE
+                JOIN pg_attribute a ON a.attrelid = co.conrelid AND a.attnum = k.attnum
+                WHERE co.contype = 'p' AND co.conrelid = CAST(:table AS regclass)
+            """), {'table': f"agilite.{table}_legacy"}).scalar()
+            assert key == ['id', 'processing_timestamp'], (table, key)
+        # Converted rows are still joined to their images
+        assert db.execute(text("""
+            SELECT COUNT(*) FROM agilite.products p
+            JOIN agilite.product_images i ON i.product_id = p.id AND i.processing_timestamp = p.processing_timestamp
+        """)).scalar() == before['product_images']
+
+        # New records go to the monthly partitions and continue the id sequence
+        db.add(Product(url="https://agilite.co.il/products/new", title="New", processing_timestamp=datetime.utcnow()))
+        db.commit()
+        assert db.execute(text("SELECT MAX(id) FROM agilite.products")).scalar() == before['products'] + 1
+
+        # Running it again finds nothing left to convert
+        assert partition_existing_tables(db) == []
+    finally:
+        db.close()
+
+
+def main():
+    try:
+        test_convert_baseline_database()
+    except unittest.SkipTest as e:
+        logger.warning(f"Skipped: {e}")
+        return
+    except AssertionError as e:
+        logger.error(f"Retention test failed: {e}")
+        sys.exit(1)
+    logger.info("Retention test passed")
+
+if __name__ == "__main__":
+    main()